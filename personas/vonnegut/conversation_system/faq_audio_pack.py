@@ -0,0 +1,259 @@
+"""
+Pre-rendered audio pack for FAQ responses.
+A batch job synthesizes every FAQ response ahead of time through the configured
+TTS engine, one engine per worker process, and writes the clips back to back as
+PCM16 at the server sample rate into a single file, with an offset index keyed
+by a hash of the response text. The voice server memory-maps the pack once at
+startup, so an FAQ hit is a slice of the mapping: no synthesis, no file open,
+no float conversion before it is base64-encoded for the client.
+"""
+
+import os
+import asyncio
+import hashlib
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PACK_SAMPLE_RATE = 16000  # VoiceConversationServer.sample_rate
+PACK_DTYPE = np.dtype('<i2')  # PCM16, little-endian
+PACK_FORMAT_VERSION = 1
+
+
+def text_key(text: str) -> str:
+    """Pack key of a response: hash of its stripped text."""
+    return hashlib.sha1(text.strip().encode('utf-8')).hexdigest()
+
+
+def to_pcm16(audio: np.ndarray, source_rate: int, target_rate: int) -> np.ndarray:
+    """Resample float audio in [-1, 1] to target_rate and convert it to PCM16."""
+    audio = np.asarray(audio, dtype=np.float32).reshape(-1)
+    if source_rate != target_rate and len(audio):
+        # Same linear resampling the TTS handlers use
+        new_length = int(len(audio) * target_rate / source_rate)
+        audio = np.interp(
+            np.linspace(0, len(audio), new_length),
+            np.arange(len(audio)),
+            audio
+        )
+    return (np.clip(audio, -1.0, 1.0) * 32767).astype(PACK_DTYPE)
+
+
+class AudioPack:
+    """Memory-mapped PCM16 clips with an offset index keyed by response text."""
+
+    def __init__(self, pcm_path, index_path):
+        self.pcm_path = Path(pcm_path)
+        self.index_path = Path(index_path)
+        self.sample_rate = None
+        self.samples = None  # read-only np.memmap over the whole pack
+        self.clips: Dict[str, Tuple[int, int]] = {}  # key -> (offset, length) in samples
+
+    @classmethod
+    def for_database(cls, faq_db_path) -> "AudioPack":
+        """Pack stored next to the FAQ database (faq_database.audio.pcm / .audio.npz)."""
+        faq_db_path = Path(faq_db_path)
+        return cls(faq_db_path.with_name(faq_db_path.stem + '.audio.pcm'),
+                   faq_db_path.with_name(faq_db_path.stem + '.audio.npz'))
+
+    def __len__(self) -> int:
+        return len(self.clips)
+
+    @property
+    def duration(self) -> float:
+        """Total seconds of audio in the pack."""
+        if not self.sample_rate:
+            return 0.0
+        return sum(length for _, length in self.clips.values()) / self.sample_rate
+
+    def load(self) -> bool:
+        """
+        Map the pack and read its index.
+
+        Returns:
+            True if the pack was loaded, False when it is missing or unreadable
+        """
+        try:
+            if not self.pcm_path.exists() or not self.index_path.exists():
+                return False
+            with np.load(self.index_path, allow_pickle=False) as data:
+                if int(data['version']) != PACK_FORMAT_VERSION:
+                    logger.info(f"Ignoring FAQ audio pack {self.index_path}: old format")
+                    return False
+                keys = data['keys'].tolist()
+                offsets = data['offsets'].tolist()
+                lengths = data['lengths'].tolist()
+                sample_rate = int(data['sample_rate'])
+
+            total = self.pcm_path.stat().st_size // PACK_DTYPE.itemsize
+            if any(offset + length > total for offset, length in zip(offsets, lengths)):
+                logger.error(f"FAQ audio pack {self.pcm_path} is shorter than its index")
+                return False
+
+            # np.memmap cannot map an empty file; a pack of nothing has no clips to slice
+            self.samples = np.memmap(self.pcm_path, dtype=PACK_DTYPE, mode='r') if total else np.empty(0, PACK_DTYPE)
+            self.clips = dict(zip(keys, zip(offsets, lengths)))
+            self.sample_rate = sample_rate
+            logger.info(f"Mapped FAQ audio pack: {len(self.clips)} clips, {self.duration:.1f}s at {sample_rate} Hz")
+            return True
+
+        except Exception as e:
+            logger.error(f"Error loading FAQ audio pack {self.index_path}: {e}")
+            return False
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        """PCM16 view of the clip for a response text, or None if the pack has no audio for it."""
+        clip = self.clips.get(text_key(text))
+        if clip is None or clip[1] == 0 or self.samples is None:
+            return None
+        offset, length = clip
+        return self.samples[offset:offset + length]
+
+    def close(self):
+        """Drop the mapping and the index."""
+        self.samples = None
+        self.clips = {}
+        self.sample_rate = None
+
+    def write(self, clips: Iterable[Tuple[str, np.ndarray]], sample_rate: int):
+        """
+        Write (key, PCM16 samples) clips as the new pack, replacing any existing one.
+
+        Both files are written under temporary names and renamed into place, the
+        samples first, so a server mapping the old pack keeps a consistent view.
+        """
+        pcm_temporary = self.pcm_path.with_name(self.pcm_path.name + '.tmp')
+        index_temporary = self.index_path.with_name(self.index_path.name + '.tmp')
+        keys, offsets, lengths = [], [], []
+        offset = 0
+        with open(pcm_temporary, 'wb') as f:
+            for key, samples in clips:
+                samples = np.asarray(samples, dtype=PACK_DTYPE)
+                f.write(samples.tobytes())
+                keys.append(key)
+                offsets.append(offset)
+                lengths.append(len(samples))
+                offset += len(samples)
+        with open(index_temporary, 'wb') as f:
+            np.savez(
+                f,
+                version=np.int64(PACK_FORMAT_VERSION),
+                sample_rate=np.int64(sample_rate),
+                keys=np.array(keys, dtype='U40'),
+                offsets=np.array(offsets, dtype=np.int64),
+                lengths=np.array(lengths, dtype=np.int64)
+            )
+        pcm_temporary.replace(self.pcm_path)
+        index_temporary.replace(self.index_path)
+        logger.info(f"Wrote FAQ audio pack to {self.pcm_path}: {len(keys)} clips, "
+                    f"{offset / sample_rate:.1f}s, {offset * PACK_DTYPE.itemsize / 1e6:.1f} MB")
+
+
+# Per-process TTS engine for the batch job (pyttsx3 engines are not thread-safe)
+_worker_tts = None
+
+
+def _init_worker():
+    """Create this worker's TTS engine."""
+    global _worker_tts
+    from local_tts_lite import LocalTTSHandler
+    logging.basicConfig(level=logging.WARNING)
+    _worker_tts = LocalTTSHandler()
+    asyncio.run(_worker_tts.initialize_engines())
+
+
+def _synthesize_pcm16(text: str, sample_rate: int) -> Optional[np.ndarray]:
+    """Synthesize one response in a worker process and convert it to pack samples."""
+    audio = asyncio.run(_worker_tts.synthesize_speech(text))
+    if audio is None:
+        return None
+    return to_pcm16(audio, _worker_tts.sample_rate, sample_rate)
+
+
+async def build_audio_pack(faq_entries: Iterable[Dict], pack: AudioPack, sample_rate: int = PACK_SAMPLE_RATE,
+                           workers: Optional[int] = None, rebuild: bool = False) -> Dict:
+    """
+    Synthesize every FAQ response in parallel and write them as one pack.
+
+    Args:
+        faq_entries: FAQ entries; each distinct response text is synthesized once
+        pack: Pack to (re)write
+        sample_rate: Sample rate of the pack (the server's)
+        workers: TTS worker processes (default: CPU count, at most 4)
+        rebuild: Resynthesize clips already present in the existing pack
+
+    Returns:
+        Counts of synthesized, reused and failed responses
+    """
+    texts = list(dict.fromkeys(entry['response'].strip() for entry in faq_entries
+                               if entry.get('response', '').strip()))
+
+    # Clips of unchanged responses are copied from the current pack unless it is stale
+    existing = {}
+    if not rebuild and pack.load() and pack.sample_rate == sample_rate:
+        # Copied out of the mapping so the old pack file can be replaced (Windows refuses while mapped)
+        existing = {text: np.array(samples) for text, samples in ((text, pack.get(text)) for text in texts)
+                    if samples is not None}
+        pack.close()
+    pending = [text for text in texts if text not in existing]
+
+    synthesized: Dict[str, np.ndarray] = {}
+    failed: List[str] = []
+    if pending:
+        workers = workers or min(4, os.cpu_count() or 1)
+        logger.info(f"Synthesizing {len(pending)} FAQ responses with {workers} workers "
+                    f"({len(existing)} reused from the current pack)")
+        loop = asyncio.get_running_loop()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            results = await asyncio.gather(
+                *(loop.run_in_executor(pool, _synthesize_pcm16, text, sample_rate) for text in pending),
+                return_exceptions=True
+            )
+        for text, result in zip(pending, results):
+            if isinstance(result, Exception) or result is None or len(result) == 0:
+                logger.error(f"TTS failed for FAQ response '{text[:50]}...': {result}")
+                failed.append(text)
+            else:
+                synthesized[text] = result
+
+    clips = []
+    for text in texts:
+        samples = synthesized.get(text, existing.get(text))
+        if samples is not None and len(samples):
+            clips.append((text_key(text), samples))
+    pack.write(clips, sample_rate)
+
+    return {'synthesized': len(synthesized), 'reused': len(existing), 'failed': len(failed)}
+
+
+async def build_from_database(faq_db_path: str, sample_rate: int, workers: Optional[int], rebuild: bool) -> Dict:
+    """Load the FAQ database through the router and build its audio pack."""
+    from faq_router import FAQRouter
+
+    router = FAQRouter(faq_db_path=faq_db_path)
+    await router.initialize()
+    return await build_audio_pack(router.faq_entries, AudioPack.for_database(faq_db_path),
+                                  sample_rate, workers, rebuild)
+
+
+def main():
+    """Pre-render the audio for every FAQ response."""
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--db', default='faq_database.json', help='FAQ database to render')
+    parser.add_argument('--sample-rate', type=int, default=PACK_SAMPLE_RATE)
+    parser.add_argument('--workers', type=int, default=None, help='TTS worker processes')
+    parser.add_argument('--rebuild', action='store_true', help='resynthesize every response')
+    args = parser.parse_args()
+
+    stats = asyncio.run(build_from_database(args.db, args.sample_rate, args.workers, args.rebuild))
+    logger.info(f"FAQ audio pack done: {stats}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,449 @@
+"""
+Sparse trigger-word index for the FAQ router.
+Trigger phrases are compiled into a CSR term-by-entry matrix over a fixed vocabulary:
+the row of a normalized token lists the entries whose trigger phrases contain it,
+so scoring a query is one sparse vector x matrix product, a vectorized boost add
+and an argmax.
+Multi-word trigger phrases are also compiled into an Aho-Corasick automaton over
+tokens, which finds every phrase occurring in a query (or a whole transcript) in
+one linear pass; an entry whose phrase occurs verbatim scores at least PHRASE_MATCH_SCORE.
+The compiled index (vocabulary, postings, phrase automaton and entry offsets into
+the serialized entries) is saved next to the FAQ database, keyed by a content hash
+of the files it was built from, so a restart with unchanged inputs loads it in
+milliseconds instead of rebuilding.
+"""
+
+import re
+import json
+import hashlib
+import logging
+from collections import Counter, deque
+from collections.abc import Sequence as SequenceABC
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z0-9]+)*")
+PHRASE_MATCH_SCORE = 0.75  # score (before boost) of an entry whose multi-word trigger occurs verbatim
+INDEX_FORMAT_VERSION = 1  # bump when the saved layout or the scoring inputs change
+TOKEN_STRIDE = 1 << 32  # automaton transition key = state * TOKEN_STRIDE + token id
+PHRASE_ARRAYS = ('phrase_vocab', 'phrase_indptr', 'phrase_tokens', 'phrase_transition_keys',
+                 'phrase_transition_next', 'phrase_fail', 'phrase_output_indptr', 'phrase_outputs')
+
+
+def normalize_tokens(text: str) -> List[str]:
+    """Lowercase word tokens with surrounding punctuation removed."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def content_key(paths: Iterable) -> str:
+    """SHA-256 over the contents of the given files (a missing file counts as absent, not empty)."""
+    digest = hashlib.sha256(f"faq-index-v{INDEX_FORMAT_VERSION}".encode())
+    for path in paths:
+        path = Path(path)
+        if path.exists():
+            digest.update(b"file:" + path.read_bytes())
+        else:
+            digest.update(b"missing")
+    return digest.hexdigest()
+
+
+def _flatten(lists: Sequence[Sequence[int]]) -> Tuple[np.ndarray, np.ndarray]:
+    """CSR-style (indptr, values) arrays for a list of int lists."""
+    indptr = np.zeros(len(lists) + 1, dtype=np.int64)
+    np.cumsum([len(values) for values in lists], out=indptr[1:])
+    values = np.fromiter((value for values in lists for value in values), dtype=np.int64, count=int(indptr[-1]))
+    return indptr, values
+
+
+def _unflatten(indptr: Sequence[int], values: Sequence[int]) -> List[List[int]]:
+    return [list(values[start:stop]) for start, stop in zip(indptr[:-1], indptr[1:])]
+
+
+class PhraseMatcher:
+    """Aho-Corasick automaton over normalized token sequences."""
+
+    def __init__(self, phrases: Iterable[str] = ()):
+        # Trie being built: phrases as token tuples, per-state transitions by token
+        self.phrases: List[Tuple[str, ...]] = []
+        self.phrase_ids: Dict[Tuple[str, ...], int] = {}
+        self.goto: List[Dict[str, int]] = [{}]  # state 0 is the root
+
+        # Compiled tables walked by find_tokens()
+        self.token_ids: Dict[str, int] = {}
+        self.transitions: Dict[int, int] = {}  # state * TOKEN_STRIDE + token id -> next state
+        self.fail: List[int] = [0]
+        self.output_indptr: List[int] = [0, 0]  # phrase ids ending in each state, fail links included
+        self.outputs: List[int] = []
+        self.lengths: List[int] = []  # tokens per phrase
+        self.compiled = True
+        self._saved: Optional[Dict[str, np.ndarray]] = None  # arrays of a loaded matcher, until add() needs the trie
+
+        for phrase in phrases:
+            self.add(phrase)
+
+    def __len__(self) -> int:
+        return len(self.lengths) if self.compiled else len(self.phrases)
+
+    def add(self, phrase: str) -> Optional[int]:
+        """Insert a phrase and return its id (None when it has no word tokens)."""
+        tokens = tuple(normalize_tokens(phrase))
+        if not tokens:
+            return None
+        self._restore_trie()
+        if tokens in self.phrase_ids:
+            return self.phrase_ids[tokens]
+
+        state = 0
+        for token in tokens:
+            next_state = self.goto[state].get(token)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][token] = next_state
+                self.goto.append({})
+            state = next_state
+
+        phrase_id = len(self.phrases)
+        self.phrases.append(tokens)
+        self.phrase_ids[tokens] = phrase_id
+        self.compiled = False
+        return phrase_id
+
+    def _restore_trie(self):
+        """Rebuild the trie of a loaded matcher so more phrases can be added."""
+        if self._saved is None:
+            return
+        vocab = self._saved['phrase_vocab'].tolist()
+        tokens = self._saved['phrase_tokens'].tolist()
+        indptr = self._saved['phrase_indptr'].tolist()
+        self._saved = None
+        for start, stop in zip(indptr[:-1], indptr[1:]):
+            self.add(' '.join(vocab[token] for token in tokens[start:stop]))
+
+    def compile(self):
+        """Compute fail links breadth-first and flatten the automaton into lookup tables."""
+        if self.compiled:
+            return
+        fail = [0] * len(self.goto)
+        output: List[List[int]] = [[] for _ in self.goto]
+        for phrase_id, tokens in enumerate(self.phrases):
+            state = 0
+            for token in tokens:
+                state = self.goto[state][token]
+            output[state].append(phrase_id)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, next_state in self.goto[state].items():
+                fallback = fail[state]
+                while fallback and token not in self.goto[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = self.goto[fallback].get(token, 0)
+                # Phrases ending at the fail state also end here
+                output[next_state].extend(output[fail[next_state]])
+                queue.append(next_state)
+
+        self.token_ids = {}
+        self.transitions = {}
+        for state, edges in enumerate(self.goto):
+            for token, next_state in edges.items():
+                token_id = self.token_ids.setdefault(token, len(self.token_ids))
+                self.transitions[state * TOKEN_STRIDE + token_id] = next_state
+        self.fail = fail
+        indptr, outputs = _flatten(output)
+        self.output_indptr, self.outputs = indptr.tolist(), outputs.tolist()
+        self.lengths = [len(tokens) for tokens in self.phrases]
+        self.compiled = True
+
+    def find_tokens(self, tokens: Sequence[str]) -> List[Tuple[int, int]]:
+        """Every (start token, phrase id) occurrence in a token sequence, in order of end position."""
+        self.compile()
+        transitions, fail = self.transitions, self.fail
+        hits = []
+        state = 0
+        for position, token in enumerate(tokens):
+            token_id = self.token_ids.get(token)
+            if token_id is None:
+                state = 0  # no phrase contains the token
+                continue
+            while True:
+                next_state = transitions.get(state * TOKEN_STRIDE + token_id)
+                if next_state is not None or not state:
+                    state = next_state or 0
+                    break
+                state = fail[state]
+            for phrase_id in self.outputs[self.output_indptr[state]:self.output_indptr[state + 1]]:
+                hits.append((position + 1 - self.lengths[phrase_id], phrase_id))
+        return hits
+
+    def find(self, text: str) -> List[Tuple[int, int]]:
+        """Every (start token, phrase id) occurrence in a text."""
+        return self.find_tokens(normalize_tokens(text))
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """The compiled automaton as arrays (see PHRASE_ARRAYS)."""
+        if self._saved is not None:
+            return dict(self._saved)
+        self.compile()
+        phrase_indptr, phrase_tokens = _flatten([[self.token_ids[token] for token in tokens]
+                                                 for tokens in self.phrases])
+        return {
+            'phrase_vocab': np.array(sorted(self.token_ids, key=self.token_ids.get), dtype=str),
+            'phrase_indptr': phrase_indptr,
+            'phrase_tokens': phrase_tokens,
+            'phrase_transition_keys': np.fromiter(self.transitions.keys(), dtype=np.int64, count=len(self.transitions)),
+            'phrase_transition_next': np.fromiter(self.transitions.values(), dtype=np.int64, count=len(self.transitions)),
+            'phrase_fail': np.asarray(self.fail, dtype=np.int64),
+            'phrase_output_indptr': np.asarray(self.output_indptr, dtype=np.int64),
+            'phrase_outputs': np.asarray(self.outputs, dtype=np.int64)
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays) -> "PhraseMatcher":
+        """Compiled automaton from arrays written by to_arrays()."""
+        matcher = cls()
+        saved = {name: arrays[name] for name in PHRASE_ARRAYS}
+        matcher.token_ids = {token: token_id for token_id, token in enumerate(saved['phrase_vocab'].tolist())}
+        matcher.transitions = dict(zip(saved['phrase_transition_keys'].tolist(),
+                                       saved['phrase_transition_next'].tolist()))
+        matcher.fail = saved['phrase_fail'].tolist()
+        matcher.output_indptr = saved['phrase_output_indptr'].tolist()
+        matcher.outputs = saved['phrase_outputs'].tolist()
+        matcher.lengths = np.diff(saved['phrase_indptr']).tolist()
+        matcher._saved = saved
+        return matcher
+
+
+class EntryTable(SequenceABC):
+    """FAQ entries decoded on first access from serialized JSON (entry i is blob[offsets[i]:offsets[i + 1]])."""
+
+    def __init__(self, blob: bytes, offsets: List[int]):
+        self.blob = blob
+        self.offsets = offsets
+        self._decoded: Dict[int, Dict] = {}
+        self._appended: List[Dict] = []
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1 + len(self._appended)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError('entry position out of range')
+        stored = len(self.offsets) - 1
+        if position >= stored:
+            return self._appended[position - stored]
+        entry = self._decoded.get(position)
+        if entry is None:
+            entry = json.loads(self.blob[self.offsets[position]:self.offsets[position + 1]].decode('utf-8'))
+            self._decoded[position] = entry
+        return entry
+
+    def append(self, entry: Dict):
+        self._appended.append(entry)
+
+
+class TriggerIndex:
+    """CSR matrix of trigger-token weights, one row per vocabulary token and one column per entry."""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """Drop every entry and the vocabulary."""
+        # Entries are referred to by their position in the FAQ entry list:
+        # ids from transcript extraction are only unique within one entry type
+        self.vocabulary: Dict[str, int] = {}
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int32)  # entry positions
+        self.data = np.zeros(0, dtype=np.float32)  # token count across the entry's trigger phrases
+        self.boosts = np.zeros(0, dtype=np.float64)
+        # (term, entry, weight) triplets and boosts of entries added since the last compile
+        self._pending: List[Tuple[int, int, int]] = []
+        self._pending_boosts: List[float] = []
+        # Multi-word trigger phrases and the entry positions each one belongs to
+        # (kept flat as (indptr, positions) after a load until an entry is added)
+        self.phrases = PhraseMatcher()
+        self.phrase_entries: Optional[List[List[int]]] = []
+        self._phrase_entry_indptr: List[int] = []
+        self._phrase_entry_positions: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.boosts) + len(self._pending_boosts)
+
+    def build(self, entries: Sequence[Dict]):
+        """Index every entry from scratch."""
+        self.clear()
+        for entry in entries:
+            self.add(entry)
+        self.compile()
+
+    def add(self, entry: Dict) -> int:
+        """Queue one more entry for the matrix and return its position."""
+        position = len(self)
+        counts = Counter(normalize_tokens(' '.join(entry.get('trigger_phrases', []))))
+        for token, count in counts.items():
+            term = self.vocabulary.setdefault(token, len(self.vocabulary))
+            self._pending.append((term, position, count))
+        self._pending_boosts.append(entry.get('confidence_boost', 0))
+
+        if self.phrase_entries is None:
+            self.phrase_entries = _unflatten(self._phrase_entry_indptr, self._phrase_entry_positions)
+        for phrase in entry.get('trigger_phrases', []):
+            if len(normalize_tokens(phrase)) < 2:
+                continue  # single words are covered by the matrix
+            phrase_id = self.phrases.add(phrase)
+            if phrase_id == len(self.phrase_entries):
+                self.phrase_entries.append([])
+            if position not in self.phrase_entries[phrase_id]:
+                self.phrase_entries[phrase_id].append(position)
+        return position
+
+    def phrase_positions(self, phrase_id: int) -> List[int]:
+        """Entry positions having a phrase among their triggers."""
+        if self.phrase_entries is None:
+            return self._phrase_entry_positions[self._phrase_entry_indptr[phrase_id]:
+                                                self._phrase_entry_indptr[phrase_id + 1]]
+        return self.phrase_entries[phrase_id]
+
+    def compile(self):
+        """Fold queued entries into the CSR arrays and the phrase automaton."""
+        self.phrases.compile()
+        if not self._pending_boosts:
+            return
+        # Back to (term, entry, weight) triplets, append the queued ones, and sort by term
+        terms = np.repeat(np.arange(len(self.indptr) - 1), np.diff(self.indptr))
+        entries = self.indices
+        weights = self.data
+        if self._pending:
+            pending = np.asarray(self._pending, dtype=np.int64)
+            terms = np.concatenate([terms, pending[:, 0]])
+            entries = np.concatenate([entries, pending[:, 1]])
+            weights = np.concatenate([weights, pending[:, 2]])
+        order = np.argsort(terms, kind='stable')
+
+        self.indptr = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(self.vocabulary)), out=self.indptr[1:])
+        self.indices = entries[order].astype(np.int32)
+        self.data = weights[order].astype(np.float32)
+        self.boosts = np.concatenate([self.boosts, np.asarray(self._pending_boosts, dtype=np.float64)])
+        self._pending, self._pending_boosts = [], []
+
+    def scores(self, query: str) -> np.ndarray:
+        """
+        Score every entry against a query.
+
+        The score is the trigger-token overlap per query token plus the entry's
+        confidence boost, capped at 1.0; tokens outside the vocabulary add nothing.
+        An entry one of whose multi-word triggers occurs verbatim in the query
+        scores at least PHRASE_MATCH_SCORE plus its boost.
+        """
+        self.compile()
+        tokens = normalize_tokens(query)
+        if not tokens:
+            return np.zeros(len(self.boosts))
+
+        counts = Counter(self.vocabulary[token] for token in tokens if token in self.vocabulary)
+        matches = np.zeros(len(self.boosts))
+        if counts:
+            terms = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+            query_weights = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+            # Gather the stored rows of the query's terms in one go
+            starts, stops = self.indptr[terms], self.indptr[terms + 1]
+            lengths = stops - starts
+            offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+            matches = np.bincount(self.indices[offsets], weights=self.data[offsets] * np.repeat(query_weights, lengths),
+                                  minlength=len(self.boosts))
+        scores = matches / len(tokens)
+
+        phrase_hits = {phrase_id for _, phrase_id in self.phrases.find_tokens(tokens)}
+        if phrase_hits:
+            positions = np.fromiter({position for phrase_id in phrase_hits
+                                     for position in self.phrase_positions(phrase_id)}, dtype=np.int64)
+            scores[positions] = np.maximum(scores[positions], PHRASE_MATCH_SCORE)
+        return np.minimum(1.0, scores + self.boosts)
+
+    def best_match(self, query: str) -> Tuple[Optional[int], float]:
+        """
+        Find the best-scoring entry for a query.
+
+        Returns:
+            (entry position, score), or (None, 0.0) for an empty query or index
+        """
+        if not normalize_tokens(query) or not len(self):
+            return None, 0.0
+        scores = self.scores(query)
+        position = int(np.argmax(scores))
+        return position, float(scores[position])
+
+    def save(self, path, key: str, entries: Sequence[Dict]):
+        """Write the compiled index and the entries it was built from."""
+        self.compile()
+        # Entries as one UTF-8 blob with per-entry offsets, decoded on demand after loading
+        encoded = [json.dumps(entry, ensure_ascii=False).encode('utf-8') for entry in entries]
+        entry_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(blob) for blob in encoded], out=entry_offsets[1:])
+        if self.phrase_entries is None:
+            phrase_entry_indptr = np.asarray(self._phrase_entry_indptr, dtype=np.int64)
+            phrase_entry_positions = np.asarray(self._phrase_entry_positions, dtype=np.int64)
+        else:
+            phrase_entry_indptr, phrase_entry_positions = _flatten(self.phrase_entries)
+
+        path = Path(path)
+        temporary = path.with_name(path.name + '.tmp')
+        with open(temporary, 'wb') as f:
+            np.savez(
+                f,
+                key=np.array(key),
+                tokens=np.array(sorted(self.vocabulary, key=self.vocabulary.get), dtype=str),
+                indptr=self.indptr,
+                indices=self.indices,
+                data=self.data,
+                boosts=self.boosts,
+                phrase_entry_indptr=phrase_entry_indptr,
+                phrase_entry_positions=phrase_entry_positions,
+                entries=np.frombuffer(b''.join(encoded), dtype=np.uint8),
+                entry_offsets=entry_offsets,
+                **self.phrases.to_arrays()
+            )
+        temporary.replace(path)  # readers never see a half-written index
+        logger.info(f"Saved compiled FAQ index to {path} ({len(encoded)} entries, {len(self.vocabulary)} tokens)")
+
+    @classmethod
+    def load(cls, path, key: str) -> Optional[Tuple["TriggerIndex", EntryTable]]:
+        """
+        Read an index written by save().
+
+        Returns:
+            (index, entries), or None when the file is missing, unreadable or was
+            built from different inputs than key describes
+        """
+        path = Path(path)
+        if not path.exists():
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as arrays:
+                if str(arrays['key']) != key:
+                    logger.info(f"Compiled FAQ index {path} is out of date")
+                    return None
+                index = cls()
+                index.vocabulary = {token: term for term, token in enumerate(arrays['tokens'].tolist())}
+                index.indptr = arrays['indptr']
+                index.indices = arrays['indices']
+                index.data = arrays['data']
+                index.boosts = arrays['boosts']
+                index.phrases = PhraseMatcher.from_arrays(arrays)
+                index.phrase_entries = None
+                index._phrase_entry_indptr = arrays['phrase_entry_indptr'].tolist()
+                index._phrase_entry_positions = arrays['phrase_entry_positions'].tolist()
+                entries = EntryTable(arrays['entries'].tobytes(), arrays['entry_offsets'].tolist())
+            return index, entries
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable compiled FAQ index {path}: {e}")
+            return None
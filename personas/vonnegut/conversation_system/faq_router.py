@@ -12,6 +12,7 @@ import re
 import asyncio
 from datetime import datetime
 from safe_file_reader import read_transcript_safely, validate_transcript_content
+from faq_index import PhraseMatcher, TriggerIndex, content_key
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -21,10 +22,12 @@ class FAQRouter:
     def __init__(self, transcript_path: str = None, faq_db_path: str = "faq_database.json"):
         self.transcript_path = transcript_path or "../sound_files/transcript_01.txt"
         self.faq_db_path = Path(faq_db_path)
+        # Compiled trigger index saved next to the database (faq_database.index.npz)
+        self.index_path = self.faq_db_path.with_name(self.faq_db_path.stem + '.index.npz')
         
         # FAQ database
         self.faq_entries = []
-        self.embeddings = None
+        self.trigger_index = TriggerIndex()  # sparse trigger-token x entry matrix
         
         # Configuration
         self.similarity_threshold = 0.7
@@ -39,6 +42,11 @@ class FAQRouter:
         logger.info("Initializing FAQ router...")
         
         try:
+            # A compiled index built from the same database and transcript skips everything else
+            if self.load_compiled_index():
+                logger.info(f"FAQ router initialized with {len(self.faq_entries)} entries (compiled index)")
+                return
+            
             # Load existing FAQ database or create from transcript
             if self.faq_db_path.exists():
                 await self.load_faq_database()
@@ -47,12 +55,35 @@ class FAQRouter:
             
             # Load or generate embeddings
             await self.load_or_generate_embeddings()
+            self.save_compiled_index()
             
             logger.info(f"FAQ router initialized with {len(self.faq_entries)} entries")
             
         except Exception as e:
             logger.error(f"Error initializing FAQ router: {e}")
     
+    def index_key(self) -> str:
+        """Content hash of the inputs the compiled index is built from."""
+        return content_key([self.faq_db_path, self.transcript_path])
+    
+    def load_compiled_index(self) -> bool:
+        """Load entries and trigger index from the compiled index if it is up to date.
+        
+        Entries are decoded from the index on first access.
+        """
+        loaded = TriggerIndex.load(self.index_path, self.index_key())
+        if loaded is None:
+            return False
+        self.trigger_index, self.faq_entries = loaded
+        return True
+    
+    def save_compiled_index(self):
+        """Save the trigger index and entries, keyed by the current database and transcript."""
+        try:
+            self.trigger_index.save(self.index_path, self.index_key(), self.faq_entries)
+        except Exception as e:
+            logger.error(f"Error saving compiled FAQ index: {e}")
+    
     async def load_faq_database(self):
         """Load existing FAQ database."""
         try:
@@ -124,9 +155,11 @@ class FAQRouter:
                 "unstuck in time"
             ]
             
+            # One automaton pass over the sentences finds every phrase
+            contexts = self.find_all_phrase_contexts(sentences, famous_phrases)
+            
             for phrase in famous_phrases:
-                matches = self.find_phrase_contexts(sentences, phrase)
-                for match in matches:
+                for match in contexts[phrase]:
                     entries.append({
                         'id': len(entries),
                         'type': 'famous_quote',
@@ -174,14 +207,25 @@ class FAQRouter:
     
     def find_phrase_contexts(self, sentences: List[str], phrase: str) -> List[str]:
         """Find sentences containing a specific phrase."""
-        matches = []
-        phrase_lower = phrase.lower()
+        return self.find_all_phrase_contexts(sentences, [phrase])[phrase]
+    
+    def find_all_phrase_contexts(self, sentences: List[str], phrases: List[str],
+                                 limit: int = 3) -> Dict[str, List[str]]:
+        """Find sentences containing each phrase (up to limit per phrase) in one pass."""
+        matcher = PhraseMatcher()
+        contexts = {phrase: [] for phrase in phrases}
+        # Phrases normalizing to the same words ("Listen:" / "listen") share an id
+        names = {}
+        for phrase in phrases:
+            names.setdefault(matcher.add(phrase), []).append(phrase)
         
         for sentence in sentences:
-            if phrase_lower in sentence.lower():
-                matches.append(sentence.strip())
+            for phrase_id in {phrase_id for _, phrase_id in matcher.find(sentence)}:
+                for phrase in names[phrase_id]:
+                    if len(contexts[phrase]) < limit:
+                        contexts[phrase].append(sentence.strip())
         
-        return matches[:3]  # Limit to 3 matches per phrase
+        return contexts
     
     def extract_question_responses(self, sentences: List[str]) -> List[Dict]:
         """Extract question-like statements and create Q&A pairs."""
@@ -390,7 +434,7 @@ class FAQRouter:
                 'created_at': datetime.now().isoformat(),
                 'source_transcript': self.transcript_path,
                 'total_entries': len(self.faq_entries),
-                'entries': self.faq_entries
+                'entries': list(self.faq_entries)
             }
             
             with open(self.faq_db_path, 'w', encoding='utf-8') as f:
@@ -407,55 +451,25 @@ class FAQRouter:
             # For now, use simple keyword-based matching
             # In production, you'd use sentence transformers or similar
             
-            # Create simple embeddings based on trigger phrases
-            self.embeddings = {}
-            
-            for entry in self.faq_entries:
-                entry_id = entry['id']
-                triggers = entry['trigger_phrases']
-                
-                # Create a simple bag-of-words embedding
-                all_words = ' '.join(triggers).lower().split()
-                word_counts = {}
-                
-                for word in all_words:
-                    word_counts[word] = word_counts.get(word, 0) + 1
-                
-                self.embeddings[entry_id] = word_counts
+            # Bag-of-words embeddings of the trigger phrases, compiled into one
+            # sparse term-by-entry matrix
+            self.trigger_index.build(self.faq_entries)
             
-            logger.info(f"Generated embeddings for {len(self.embeddings)} entries")
+            logger.info(f"Generated embeddings for {len(self.trigger_index)} entries "
+                        f"({len(self.trigger_index.vocabulary)} trigger tokens)")
             
         except Exception as e:
             logger.error(f"Error generating embeddings: {e}")
-            self.embeddings = {}
+            self.trigger_index.clear()
     
     def calculate_similarity(self, query: str, entry_id: int) -> float:
-        """Calculate similarity between query and FAQ entry."""
+        """Calculate similarity between query and the FAQ entry at position entry_id."""
         try:
-            if entry_id not in self.embeddings:
+            if not 0 <= entry_id < len(self.trigger_index):
                 return 0.0
             
-            query_words = query.lower().split()
-            entry_embedding = self.embeddings[entry_id]
-            
-            # Simple word overlap similarity
-            matches = 0
-            total_query_words = len(query_words)
-            
-            if total_query_words == 0:
-                return 0.0
-            
-            for word in query_words:
-                if word in entry_embedding:
-                    matches += entry_embedding[word]
-            
-            similarity = matches / total_query_words
-            
-            # Apply confidence boost
-            entry = self.faq_entries[entry_id]
-            confidence_boost = entry.get('confidence_boost', 0)
-            
-            return min(1.0, similarity + confidence_boost)
+            # Word overlap per query word plus the entry's confidence boost
+            return float(self.trigger_index.scores(query)[entry_id])
             
         except Exception as e:
             logger.error(f"Error calculating similarity: {e}")
@@ -475,19 +489,12 @@ class FAQRouter:
             if not self.faq_entries:
                 return None
             
-            best_match = None
-            best_score = 0.0
-            
-            # Check each FAQ entry
-            for entry in self.faq_entries:
-                similarity = self.calculate_similarity(query, entry['id'])
-                
-                if similarity > best_score:
-                    best_score = similarity
-                    best_match = entry
+            # One sparse product scores every entry
+            position, best_score = self.trigger_index.best_match(query)
+            best_match = self.faq_entries[position] if position is not None else None
             
             # Return match if above threshold
-            if best_score >= self.similarity_threshold:
+            if best_match is not None and best_score >= self.similarity_threshold:
                 logger.info(f"FAQ match found: {best_match['type']} (score: {best_score:.3f})")
                 
                 return {
@@ -523,17 +530,12 @@ class FAQRouter:
             
             self.faq_entries.append(new_entry)
             
-            # Update embeddings
-            all_words = ' '.join(triggers).lower().split()
-            word_counts = {}
-            
-            for word in all_words:
-                word_counts[word] = word_counts.get(word, 0) + 1
-            
-            self.embeddings[entry_id] = word_counts
+            # Update embeddings (folded into the matrix at the next check)
+            self.trigger_index.add(new_entry)
             
             # Save database
             await self.save_faq_database()
+            self.save_compiled_index()
             
             logger.info(f"Added new FAQ entry: {entry_id}")
             return entry_id
@@ -559,7 +561,7 @@ class FAQRouter:
             'types': types,
             'sources': sources,
             'similarity_threshold': self.similarity_threshold,
-            'has_embeddings': self.embeddings is not None
+            'has_embeddings': len(self.trigger_index) > 0
         }
 
 # Testing function
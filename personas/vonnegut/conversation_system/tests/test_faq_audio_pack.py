@@ -0,0 +1,106 @@
+import sys
+import types
+import asyncio
+import base64
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import faq_audio_pack
+from faq_audio_pack import AudioPack, build_audio_pack, text_key, to_pcm16
+
+
+class FakeTTS:
+    """Stands in for local_tts_lite.LocalTTSHandler: a tone whose length follows the text."""
+
+    sample_rate = 22050
+
+    async def initialize_engines(self):
+        pass
+
+    async def synthesize_speech(self, text):
+        if text.startswith('FAIL'):
+            return None
+        if text.startswith('SILENT'):
+            return np.zeros(0, dtype=np.float32)
+        n = self.sample_rate * len(text) // 50
+        return (0.5 * np.sin(np.arange(n) * 0.05)).astype(np.float32)
+
+
+@pytest.fixture
+def fake_tts(monkeypatch):
+    module = types.ModuleType('local_tts_lite')
+    module.LocalTTSHandler = FakeTTS
+    monkeypatch.setitem(sys.modules, 'local_tts_lite', module)
+    # Threads instead of processes: same initializer/worker protocol, fake engine visible
+    monkeypatch.setattr(faq_audio_pack, 'ProcessPoolExecutor', ThreadPoolExecutor)
+
+
+@pytest.fixture
+def pack(tmp_path):
+    return AudioPack.for_database(tmp_path / 'faq_database.json')
+
+
+def expected_clip(text):
+    audio = asyncio.run(FakeTTS().synthesize_speech(text))
+    return to_pcm16(audio, FakeTTS.sample_rate, faq_audio_pack.PACK_SAMPLE_RATE)
+
+
+def test_round_trip(pack):
+    clips = [(text_key('one'), np.arange(100, dtype=np.int16)), (text_key('two'), np.full(7, -3, dtype=np.int16))]
+    pack.write(clips, 16000)
+
+    loaded = AudioPack(pack.pcm_path, pack.index_path)
+    assert loaded.load()
+    assert loaded.sample_rate == 16000 and len(loaded) == 2
+    assert isinstance(loaded.samples, np.memmap)
+    assert np.array_equal(loaded.get('one'), np.arange(100))
+    assert np.array_equal(loaded.get('  two '), np.full(7, -3))  # keys ignore surrounding whitespace
+    assert loaded.get('three') is None
+    # The server base64-encodes the mapped slice as is
+    decoded = np.frombuffer(base64.b64decode(base64.b64encode(loaded.get('one'))), dtype='<i2')
+    assert np.array_equal(decoded, np.arange(100))
+
+
+def test_zero_length_clip_is_missing(pack):
+    pack.write([(text_key('empty'), np.zeros(0, dtype=np.int16)), (text_key('full'), np.ones(5, dtype=np.int16))], 16000)
+    assert pack.load()
+    assert pack.get('empty') is None
+    assert len(pack.get('full')) == 5
+
+
+def test_missing_or_truncated_pack(pack):
+    assert not pack.load()
+    pack.write([(text_key('one'), np.ones(50, dtype=np.int16))], 16000)
+    with open(pack.pcm_path, 'r+b') as f:
+        f.truncate(20)
+    assert not AudioPack(pack.pcm_path, pack.index_path).load()
+
+
+def test_build_synthesizes_and_reuses(fake_tts, pack):
+    entries = [
+        {'response': 'So it goes.'},
+        {'response': 'So it goes. '},  # same text, one clip
+        {'response': 'Listen: Billy Pilgrim has come unstuck in time.'},
+        {'response': 'FAIL to synthesize'},
+        {'response': 'SILENT response'},
+    ]
+    stats = asyncio.run(build_audio_pack(entries, pack, workers=2))
+    assert stats == {'synthesized': 2, 'reused': 0, 'failed': 2}
+
+    loaded = AudioPack(pack.pcm_path, pack.index_path)
+    assert loaded.load() and len(loaded) == 2
+    assert np.array_equal(loaded.get('So it goes.'), expected_clip('So it goes.'))
+    assert loaded.get('FAIL to synthesize') is None
+    assert loaded.get('SILENT response') is None  # no empty clip written; the server falls back to live TTS
+
+    entries.append({'response': 'A new entry.'})
+    stats = asyncio.run(build_audio_pack(entries, pack, workers=2))
+    assert stats['synthesized'] == 1 and stats['reused'] == 2
+
+    loaded = AudioPack(pack.pcm_path, pack.index_path)
+    assert loaded.load() and len(loaded) == 3
+    assert np.array_equal(loaded.get('Listen: Billy Pilgrim has come unstuck in time.'),
+                          expected_clip('Listen: Billy Pilgrim has come unstuck in time.'))
+    assert np.array_equal(loaded.get('A new entry.'), expected_clip('A new entry.'))
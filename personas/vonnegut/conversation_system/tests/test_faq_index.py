@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from faq_index import TriggerIndex, content_key
+
+ENTRIES = [
+    {'id': 1, 'trigger_phrases': ['so it goes', 'dresden'], 'response': 'And so on.', 'confidence_boost': 0.1},
+    {'id': 2, 'trigger_phrases': ['tralfamadore', 'unstuck in time'], 'response': 'All moments exist.'},
+    {'id': 1, 'trigger_phrases': ['indianapolis', 'shortridge high school'], 'response': 'Home.',
+     'confidence_boost': 0.05},
+]
+QUERIES = ['So it goes', 'tell me about Dresden', 'were you ever unstuck in time', 'Shortridge High School days',
+           'nothing relevant here', '']
+
+
+@pytest.fixture
+def index():
+    index = TriggerIndex()
+    index.build(ENTRIES)
+    return index
+
+
+def test_compiled_index_round_trip(index, tmp_path):
+    path = tmp_path / 'faq_database.index.npz'
+    index.save(path, 'key-1', ENTRIES)
+
+    loaded, entries = TriggerIndex.load(path, 'key-1')
+    assert list(entries) == ENTRIES
+    for query in QUERIES:
+        np.testing.assert_allclose(loaded.scores(query), index.scores(query))
+        assert loaded.best_match(query) == index.best_match(query)
+
+    # A loaded index keeps growing like a freshly built one
+    entry = {'id': 3, 'trigger_phrases': ['player piano'], 'response': 'Ilium.'}
+    assert loaded.add(entry) == index.add(entry) == 3
+    assert loaded.best_match('the player piano') == index.best_match('the player piano')
+
+
+def test_compiled_index_is_rebuilt_for_other_inputs(index, tmp_path):
+    path = tmp_path / 'faq_database.index.npz'
+    index.save(path, 'key-1', ENTRIES)
+    assert TriggerIndex.load(path, 'key-2') is None
+    assert TriggerIndex.load(tmp_path / 'missing.npz', 'key-1') is None
+
+    path.write_bytes(path.read_bytes()[:100])
+    assert TriggerIndex.load(path, 'key-1') is None
+
+
+def test_content_key_tracks_input_files(tmp_path):
+    database, transcript = tmp_path / 'faq_database.json', tmp_path / 'transcript.txt'
+    database.write_text('[]')
+    key = content_key([database, transcript])
+
+    assert content_key([database, transcript]) == key
+    transcript.write_text('')
+    assert content_key([database, transcript]) != key  # an empty file is not a missing one
+    transcript.unlink()
+    database.write_text('[{}]')
+    assert content_key([database, transcript]) != key
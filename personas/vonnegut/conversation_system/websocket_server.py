@@ -18,6 +18,7 @@ from datetime import datetime
 # Import local modules
 from vad_handler import VADHandler
 from faq_router import FAQRouter
+from faq_audio_pack import AudioPack
 from vonnegut_chatbot import VonnegutChatbot
 from local_tts_lite import LocalTTSHandler
 
@@ -45,6 +46,9 @@ class VoiceConversationServer:
             logger.error(f"Error creating FAQ router: {e}")
             self.faq_router = None
         
+        # Pre-rendered FAQ audio (mapped at startup, built by faq_audio_pack.py)
+        self.audio_pack = None
+        
         try:
             self.vonnegut_chatbot = VonnegutChatbot()
             logger.info("Vonnegut chatbot initialized")
@@ -237,8 +241,14 @@ class VoiceConversationServer:
             
             # Generate or load TTS audio
             response_audio = None
-            
-            if audio_file and Path(audio_file).exists():
+            audio_b64 = None
+            packed_audio = self.audio_pack.get(response_text) if faq_response and self.audio_pack else None
+            
+            if packed_audio is not None:
+                # Pre-rendered FAQ audio is already PCM16 at the server rate: encode straight from the mapping
+                audio_b64 = base64.b64encode(packed_audio).decode('utf-8')
+                logger.info(f"Streaming pre-rendered FAQ audio: {len(packed_audio)/self.sample_rate:.2f}s")
+            elif audio_file and Path(audio_file).exists():
                 # Use pre-generated FAQ audio
                 response_audio = await self.load_audio_file(audio_file)
                 logger.info(f"Loaded pre-generated audio: {audio_file}")
@@ -257,7 +267,8 @@ class VoiceConversationServer:
                 logger.info("Encoding audio for browser...")
                 audio_b64 = self.encode_audio_data(response_audio)
                 logger.info(f"Audio encoded: {len(audio_b64)} characters base64")
-                
+            
+            if audio_b64:
                 await self.send_message(client_id, {
                     'type': 'voice_response',
                     'text': response_text,
@@ -565,6 +576,15 @@ class VoiceConversationServer:
                 logger.error(f"Error initializing FAQ router: {e}")
                 self.faq_router = None
         
+        if self.faq_router:
+            pack = AudioPack.for_database(self.faq_router.faq_db_path)
+            if not pack.load():
+                logger.info("No FAQ audio pack - FAQ responses will use live TTS (run faq_audio_pack.py)")
+            elif pack.sample_rate != self.sample_rate:
+                logger.warning(f"FAQ audio pack is {pack.sample_rate} Hz, server is {self.sample_rate} Hz - not using it")
+            else:
+                self.audio_pack = pack
+        
         if self.local_tts and not getattr(self.local_tts, 'initialized', True):
             try:
                 await self.local_tts.initialize_engines()
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Retrieval benchmark for the Indiana Oracle RAG system
+Generates a synthetic corpus (10k / 100k / 1M chunks) from topic-skewed word
+distributions and embeds it with the deterministic local embedding provider,
+so runs need no network and are comparable between commits. Measures ingest throughput,
+load time, query p50/p99 latency, resident memory and recall@k against an
+exact brute-force scan, for the exact, quantized, reduced-dimension and ANN
+search paths.
+Each run is appended as one JSON line to the results file.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import tempfile
+import subprocess
+from typing import Dict, Iterator, List, Optional, Sequence
+import numpy as np
+
+from rag_store import DocumentChunks
+from rag_embeddings import LocalEmbeddingProvider
+from rag_vector_index import normalize_rows, top_k_indices
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+CORPUS_SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+VARIANTS = ("exact", "int8", "pca128", "ann")  # applied in order; pca<dim>/truncate<dim> also work
+RESULTS_FILE = "benchmark_results.jsonl"
+CATEGORIES = ("history", "culture", "literature", "general")
+VOCABULARY = 20_000
+TOPICS = 200
+TOPIC_WORDS = 150
+CHUNK_WORDS = 60
+CHUNKS_PER_DOCUMENT = 20
+
+
+class SyntheticCorpus:
+    """Chunks drawn mostly from one topic's words plus a Zipf-distributed background"""
+
+    def __init__(self, chunks: int, seed: int = 0):
+        self.chunks = chunks
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        self.topic_words = rng.integers(0, VOCABULARY, size=(TOPICS, TOPIC_WORDS))
+        background = 1.0 / np.arange(1, VOCABULARY + 1)
+        self.background = background / background.sum()
+
+    def chunk_words(self, rng: np.random.Generator, topic: int) -> List[str]:
+        from_topic = rng.random(CHUNK_WORDS) < 0.7
+        ids = np.where(from_topic,
+                       self.topic_words[topic, rng.integers(0, TOPIC_WORDS, CHUNK_WORDS)],
+                       rng.choice(VOCABULARY, CHUNK_WORDS, p=self.background))
+        return [f"w{i}" for i in ids]
+
+    def documents(self) -> Iterator[Dict]:
+        """Pipeline documents carrying pre-built chunks"""
+        rng = np.random.default_rng(self.seed + 1)
+        for start in range(0, self.chunks, CHUNKS_PER_DOCUMENT):
+            count = min(CHUNKS_PER_DOCUMENT, self.chunks - start)
+            topic = int(rng.integers(TOPICS))
+            texts = [" ".join(self.chunk_words(rng, topic)) for _ in range(count)]
+            spans, offset = [], 0
+            for text in texts:
+                spans.append((offset, offset + len(text)))
+                offset += len(text) + 1
+            yield {
+                "title": f"Synthetic {start // CHUNKS_PER_DOCUMENT}",
+                "source": "synthetic",
+                "category": CATEGORIES[topic % len(CATEGORIES)],
+                "chunks": DocumentChunks(" ".join(texts).encode("utf-8"), spans)
+            }
+
+    def queries(self, n: int, store) -> List[str]:
+        """Perturbed copies of random stored chunks (about a third of the words replaced)"""
+        rng = random.Random(self.seed + 2)
+        segments = [segment for segment in store.all_segments() if len(segment)]
+        queries = []
+        for _ in range(n):
+            segment = rng.choice(segments)
+            words = segment.chunks.text(rng.randrange(len(segment))).split()
+            for i in rng.sample(range(len(words)), len(words) // 3):
+                words[i] = f"w{rng.randrange(VOCABULARY)}"
+            queries.append(" ".join(words))
+        return queries
+
+
+def rss_mb() -> Optional[float]:
+    """Current resident set size"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3  # bytes on macOS, KiB elsewhere
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def exact_top_k(store, query_embeddings: np.ndarray, top_k: int) -> List[set]:
+    """Ground truth: chunk texts of the exact top_k by brute force over every live row"""
+    segments = [segment for segment in store.all_segments() if len(segment)]
+    truth = []
+    for q in normalize_rows(query_embeddings):
+        hits = []
+        for segment in segments:
+            scores = segment.index.vectors @ q
+            if segment.dead_mask is not None:
+                scores[segment.dead_mask] = -np.inf
+            hits.extend((float(scores[i]), segment, int(i)) for i in top_k_indices(scores, top_k))
+        hits.sort(key=lambda hit: hit[0], reverse=True)
+        truth.append({segment.chunks.text(row) for _, segment, row in hits[:top_k]})
+    return truth
+
+
+def _percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def measure_queries(rag, queries: List[str], top_k: int, mode: str,
+                    truth: Optional[List[set]] = None) -> Dict:
+    """Latency percentiles (and recall against truth) for one search mode"""
+    latencies, recalls = [], []
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        results = rag.search(query, top_k=top_k, mode=mode)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if truth is not None:
+            recalls.append(len({result["chunk"] for result in results} & truth[i]) / top_k)
+    measured = {"p50_ms": _percentile(latencies, 50), "p99_ms": _percentile(latencies, 99),
+                "mean_ms": float(np.mean(latencies)) if latencies else 0.0}
+    if truth is not None:
+        measured[f"recall@{top_k}"] = float(np.mean(recalls)) if recalls else 0.0
+    return measured
+
+
+def run_benchmark(chunks: int, dim: int = 384, n_queries: int = 200, top_k: int = 10,
+                  variants: Sequence[str] = VARIANTS, flush_chunks: int = 20_000, seed: int = 0,
+                  path: Optional[str] = None) -> Dict:
+    """Build a synthetic knowledge base of `chunks` chunks and measure it; returns one result record"""
+    from simple_rag_system import SimpleRAG
+
+    embedder = LocalEmbeddingProvider(dim)
+    corpus = SyntheticCorpus(chunks, seed)
+
+    def local_rag(**kwargs) -> "SimpleRAG":
+        return SimpleRAG(use_cache=False, result_cache_size=0, path=path, embedding_provider=embedder, **kwargs)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = path or tmp
+        record = {"commit": git_commit(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                  "chunks": chunks, "dim": dim, "queries": n_queries, "top_k": top_k, "seed": seed}
+
+        # Ingest in flush-sized slices, like ingest_directory
+        rag = local_rag(load=False)
+        start = time.perf_counter()
+        documents = corpus.documents()
+        ingested = 0
+        while ingested < chunks:
+            batch = []
+            while ingested < chunks and sum(len(doc["chunks"]) for doc in batch) < flush_chunks:
+                doc = next(documents)
+                batch.append(doc)
+                ingested += len(doc["chunks"])
+            rag.add_documents(batch, batch_size=256)
+            rag.save_knowledge_base()
+        ingest_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        rag.compact_knowledge_base()
+        record["ingest"] = {"seconds": ingest_seconds, "chunks_per_second": chunks / ingest_seconds,
+                            "compact_seconds": time.perf_counter() - start}
+        del rag
+
+        start = time.perf_counter()
+        rag = local_rag()
+        record["load_seconds"] = time.perf_counter() - start
+        record["rss_mb_after_load"] = rss_mb()
+
+        queries = corpus.queries(n_queries, rag.store)
+        truth = exact_top_k(rag.store, embedder.embed_many(queries), top_k)
+        record["variants"] = {}
+        for variant in variants:
+            start = time.perf_counter()
+            if variant in ("int8", "float16"):
+                rag.build_quantized_index(variant)
+            elif variant.startswith(("pca", "truncate")):
+                method = "pca" if variant.startswith("pca") else "truncate"
+                rag.build_reduced_index(int(variant[len(method):]), method)
+            elif variant == "ann":
+                rag.build_ann_index(min_chunks=0)
+            elif variant != "exact":
+                raise ValueError(f"Unknown benchmark variant: {variant}")
+            build_seconds = time.perf_counter() - start
+            record["variants"][variant] = dict(measure_queries(rag, queries, top_k, "dense", truth),
+                                               build_seconds=build_seconds)
+        record["lexical"] = measure_queries(rag, queries, top_k, "lexical")
+        record["hybrid"] = measure_queries(rag, queries, top_k, "hybrid")
+        record["rss_mb_after_queries"] = rss_mb()
+        record["peak_rss_mb"] = peak_rss_mb()
+    return record
+
+
+def load_results(path: str) -> List[Dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def print_record(record: Dict, previous: Optional[Dict] = None):
+    """Human-readable summary, with the change against the previous comparable run"""
+    def delta(now: float, before: Optional[float]) -> str:
+        if not before:
+            return ""
+        return f" ({(now - before) / before * 100:+.0f}%)"
+
+    top_k = record["top_k"]
+    before = previous or {}
+    print(f"{record['chunks']} chunks, dim {record['dim']} @ {record['commit'] or 'unknown commit'}"
+          + (f" vs {before.get('commit')}" if previous else ""))
+    print(f"  ingest {record['ingest']['chunks_per_second']:.0f} chunks/s"
+          f"{delta(record['ingest']['chunks_per_second'], before.get('ingest', {}).get('chunks_per_second'))}, "
+          f"load {record['load_seconds'] * 1000:.0f} ms{delta(record['load_seconds'], before.get('load_seconds'))}, "
+          f"peak RSS {record['peak_rss_mb'] or 0:.0f} MB")
+    rows = [(name, measured) for name, measured in record["variants"].items()]
+    rows += [("lexical", record["lexical"]), ("hybrid", record["hybrid"])]
+    print(f"  {'search':>8} {'p50 ms':>14} {'p99 ms':>14} {'recall@' + str(top_k):>10}")
+    for name, measured in rows:
+        old = before.get("variants", {}).get(name) or before.get(name) or {}
+        recall = measured.get(f"recall@{top_k}")
+        print(f"  {name:>8} {measured['p50_ms']:>7.2f}{delta(measured['p50_ms'], old.get('p50_ms')):>7} "
+              f"{measured['p99_ms']:>7.2f}{delta(measured['p99_ms'], old.get('p99_ms')):>7} "
+              f"{'' if recall is None else f'{recall:.3f}':>10}")
+
+
+def main():
+    """CLI: benchmark synthetic corpora and append the results"""
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="10k,100k", help=f"comma-separated, from {', '.join(CORPUS_SIZES)}")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--variants", default=",".join(VARIANTS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=RESULTS_FILE, help="JSON lines file the results are appended to")
+    args = parser.parse_args()
+
+    sizes = [size.strip().lower() for size in args.sizes.split(",") if size.strip()]
+    unknown = [size for size in sizes if size not in CORPUS_SIZES]
+    if unknown:
+        parser.error(f"Unknown corpus size(s): {', '.join(unknown)}")
+
+    history = load_results(args.output)
+    for size in sizes:
+        record = run_benchmark(CORPUS_SIZES[size], args.dim, args.queries, args.top_k,
+                               [variant.strip() for variant in args.variants.split(",")], seed=args.seed)
+        previous = next((old for old in reversed(history)
+                         if all(old.get(key) == record[key] for key in ("chunks", "dim", "queries", "top_k", "seed"))),
+                        None)
+        print_record(record, previous)
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+        history.append(record)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+"""
+BM25 inverted index for the Indiana Oracle RAG system
+Lexical scoring over the same chunk rows as the vector index, so proper nouns
+("Dunnkirk", "Comentale", "Harroun") that are weak in dense embeddings still
+rank, and confident keyword hits can be answered without an embedding call.
+
+A saved index is a directory of .npy arrays: the vocabulary as a sorted array
+of UTF-8 terms (looked up by binary search) and the postings in CSR form,
+indexed by position in that array. Loading memory-maps them, so a flushed
+segment's postings stay in the page cache rather than on the Python heap.
+"""
+
+import os
+import re
+import copy
+import math
+import logging
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+
+from rag_vector_index import top_k_indices
+
+logger = logging.getLogger(__name__)
+
+BM25_DIR = "bm25"
+BM25_FILE = "bm25.npz"  # older segments: the same arrays in one archive, term ids in insertion order
+BM25_ARRAYS = ("terms", "indptr", "rows", "tfs", "doc_lengths", "params")
+MERGE_BLOCK_POSTINGS = 1 << 22  # bounds the postings save_merged() holds in memory at once
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+# Function words and conversational filler carry no retrieval signal
+STOPWORDS = frozenset("""
+a about after all also an and any are as at be been but by can could did do does for from
+had has have he her him his how i if in into is it its just know me more most my no not
+of on or our she so some tell than that the their them then there these they this to
+us was we were what when where which who whom why will with would you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens without stopwords or possessive suffixes"""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token.endswith("'s"):
+            token = token[:-2]
+        if token not in STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    """Okapi BM25 over chunk rows, stored as compiled CSR postings plus a pending tail"""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.vocab: Dict[str, int] = {}
+        self._terms: Optional[np.ndarray] = None  # sorted UTF-8 terms of a saved index, replacing vocab
+
+        # Compiled postings: term t owns rows/tfs[indptr[t]:indptr[t + 1]]
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._rows = np.empty(0, dtype=np.int64)
+        self._tfs = np.empty(0, dtype=np.int32)
+
+        # Postings added since the last compile()
+        self._pending: Dict[int, List[Tuple[int, int]]] = {}
+
+        self._doc_lengths = np.empty(0, dtype=np.int32)
+        self._size = 0
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, texts: Iterable[str]):
+        """Append one row per text (rows must line up with the vector index)"""
+        if self._terms is not None:
+            raise ValueError("A BM25 index loaded from disk is read-only")
+        for text in texts:
+            counts = Counter(tokenize(text))
+            row = self._size
+
+            if row >= self._doc_lengths.shape[0]:
+                grown = np.empty(max(64, 2 * self._doc_lengths.shape[0]), dtype=np.int32)
+                grown[:row] = self._doc_lengths[:row]
+                self._doc_lengths = grown
+            length = sum(counts.values())
+            self._doc_lengths[row] = length
+            self._total_length += length
+            self._size += 1
+
+            for term, tf in counts.items():
+                term_id = self.vocab.get(term)
+                if term_id is None:
+                    term_id = self.vocab[term] = len(self.vocab)
+                self._pending.setdefault(term_id, []).append((row, tf))
+
+    def snapshot(self) -> "BM25Index":
+        """Read-only view of the rows added so far, sharing this index's arrays
+
+        The view keeps its row count, so rows add() appends afterwards (e.g.
+        from another thread while the view is searched) stay invisible to it.
+        """
+        return copy.copy(self)
+
+    def _term_id(self, term: str) -> Optional[int]:
+        """Postings id of a term, or None if no row contains it"""
+        if self._terms is None:
+            return self.vocab.get(term)
+        key = term.encode("utf-8")
+        term_id = int(np.searchsorted(self._terms, key))
+        if term_id < self._terms.shape[0] and self._terms[term_id] == key:
+            return term_id
+        return None
+
+    def _postings(self, term_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, term frequencies) for a term across compiled and pending postings"""
+        rows, tfs = self._rows[:0], self._tfs[:0]
+        if term_id + 1 < self._indptr.shape[0]:
+            start, end = self._indptr[term_id], self._indptr[term_id + 1]
+            rows, tfs = self._rows[start:end], self._tfs[start:end]
+        pending = self._pending.get(term_id)
+        if pending:
+            extra = np.asarray(pending, dtype=np.int64)
+            extra = extra[extra[:, 0] < self._size]  # postings of rows added after a snapshot()
+            rows = np.concatenate([rows, extra[:, 0]])
+            tfs = np.concatenate([tfs, extra[:, 1].astype(np.int32)])
+        return rows, tfs
+
+    def idf(self, df: int) -> float:
+        """Inverse document frequency of a term occurring in df rows"""
+        return math.log(1.0 + (self._size - df + 0.5) / (df + 0.5))
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every row for the query"""
+        scores = np.zeros(self._size, dtype=np.float32)
+        if self._size == 0:
+            return scores
+
+        lengths = self._doc_lengths[:self._size]
+        avg_length = max(self._total_length / self._size, 1e-9)
+        for term in set(tokenize(query)):
+            term_id = self._term_id(term)
+            if term_id is None:
+                continue
+            rows, tfs = self._postings(term_id)
+            norm = self.k1 * (1.0 - self.b + self.b * lengths[rows] / avg_length)
+            scores[rows] += self.idf(rows.shape[0]) * tfs * (self.k1 + 1.0) / (tfs + norm)
+        return scores
+
+    def search(self, query: str, top_k: int = 3,
+               exclude: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Top_k (row id, BM25 score) pairs with a non-zero score, skipping rows masked by exclude"""
+        scores = self.scores(query)
+        if exclude is not None:
+            scores[exclude[:self._size]] = 0.0
+        return [(int(i), float(scores[i])) for i in top_k_indices(scores, top_k) if scores[i] > 0]
+
+    def coverage(self, query: str, row: int) -> float:
+        """Share of the query's IDF mass whose terms occur in a row
+
+        Terms the corpus has never seen count at maximum IDF, so a query about
+        something the knowledge base lacks is never judged a confident hit.
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return 0.0
+        unseen_idf = math.log(1.0 + (self._size + 0.5) / 0.5)
+        total = matched = 0.0
+        for term in terms:
+            term_id = self._term_id(term)
+            rows = self._postings(term_id)[0] if term_id is not None else None
+            if rows is None or not rows.shape[0]:
+                total += unseen_idf
+                continue
+            weight = self.idf(rows.shape[0])
+            total += weight
+            if np.any(rows == row):
+                matched += weight
+        return matched / total if total > 0 else 0.0
+
+    def compile(self):
+        """Fold pending postings into the CSR arrays"""
+        if not self._pending:
+            return
+        n_terms = len(self.vocab)
+        counts = np.zeros(n_terms, dtype=np.int64)
+        old_counts = np.diff(self._indptr)
+        counts[:old_counts.shape[0]] = old_counts
+        for term_id, postings in self._pending.items():
+            counts[term_id] += len(postings)
+
+        indptr = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        rows = np.empty(indptr[-1], dtype=np.int64)
+        tfs = np.empty(indptr[-1], dtype=np.int32)
+        for term_id in range(n_terms):
+            term_rows, term_tfs = self._postings(term_id)
+            start = indptr[term_id]
+            rows[start:start + term_rows.shape[0]] = term_rows
+            tfs[start:start + term_tfs.shape[0]] = term_tfs
+
+        self._indptr, self._rows, self._tfs = indptr, rows, tfs
+        self._pending = {}
+
+    def _sorted_postings(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """(sorted terms, indptr, rows, tfs), the postings renumbered in term order"""
+        self.compile()
+        if self._terms is not None:
+            return self._terms, self._indptr, self._rows, self._tfs
+        terms = np.array([term.encode("utf-8") for term in sorted(self.vocab, key=self.vocab.get)], dtype=bytes)
+        order = np.argsort(terms, kind="stable")
+        counts = np.diff(self._indptr)[order]
+        indptr = np.zeros(order.shape[0] + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        # Where each posting sits in the insertion-ordered arrays, term by term in sorted order
+        take = np.repeat(self._indptr[:-1][order] - indptr[:-1], counts) + np.arange(indptr[-1])
+        return terms[order], indptr, self._rows[take], self._tfs[take]
+
+    def save(self, path: str):
+        """Write the compiled index as a directory of arrays for load() to map"""
+        terms, indptr, rows, tfs = self._sorted_postings()
+        arrays = {"terms": terms, "indptr": indptr, "rows": rows, "tfs": tfs,
+                  "doc_lengths": self._doc_lengths[:self._size], "params": np.array([self.k1, self.b])}
+        os.makedirs(path, exist_ok=True)
+        for name in BM25_ARRAYS:
+            np.save(os.path.join(path, name + ".npy"), arrays[name], allow_pickle=False)
+        logger.info(f"Saved BM25 index to {path} ({terms.shape[0]} terms)")
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        """Map an index written by save() (read-only); an older .npz archive is read into RAM"""
+        if path.endswith(".npz"):
+            with np.load(path, allow_pickle=False) as data:
+                arrays = {name: data[name] for name in BM25_ARRAYS}
+        else:
+            arrays = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r", allow_pickle=False)
+                      for name in BM25_ARRAYS}
+
+        k1, b = arrays["params"].tolist()
+        index = cls(k1, b)
+        index._indptr, index._rows, index._tfs = arrays["indptr"], arrays["rows"], arrays["tfs"]
+        index._doc_lengths = arrays["doc_lengths"]
+        if path.endswith(".npz"):
+            # Archived term ids follow insertion order; renumber them in term order
+            index.vocab = {term: i for i, term in enumerate(arrays["terms"].tolist())}
+            index._doc_lengths = index._doc_lengths.astype(np.int32)
+            index._terms, index._indptr, index._rows, index._tfs = index._sorted_postings()
+            index.vocab = {}
+        else:
+            index._terms = arrays["terms"]
+        index._size = index._doc_lengths.shape[0]
+        index._total_length = int(index._doc_lengths.sum())
+        return index
+
+
+def _renumbered_postings(postings: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray], row_map: np.ndarray,
+                         terms: np.ndarray) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """(term ids in terms, new rows, tfs) of the postings row_map keeps, in term order, a block at a time"""
+    index_terms, indptr, rows, tfs = postings
+    term_ids = np.searchsorted(terms, index_terms)
+    start = 0
+    while start < index_terms.shape[0]:
+        # Whole terms only, so each block continues where the last one stopped within every term
+        stop = int(np.searchsorted(indptr, indptr[start] + MERGE_BLOCK_POSTINGS, side="right")) - 1
+        stop = min(max(stop, start + 1), index_terms.shape[0])
+        low, high = indptr[start], indptr[stop]
+        new_rows = row_map[rows[low:high]]
+        keep = new_rows >= 0
+        block_terms = np.repeat(term_ids[start:stop], np.diff(indptr[start:stop + 1]))
+        yield block_terms[keep], new_rows[keep], tfs[low:high][keep]
+        start = stop
+
+
+def save_merged(path: str, parts: Sequence[Tuple[BM25Index, np.ndarray]], size: int):
+    """Save the postings of several indexes as one index for load(), without re-tokenizing
+
+    Each part pairs an index with the new row of each of its rows (-1 drops
+    the row); together the parts must fill rows 0..size-1. Postings are
+    renumbered and written straight into mapped output arrays.
+    """
+    k1, b = (parts[0][0].k1, parts[0][0].b) if parts else (1.2, 0.75)
+    postings = [index._sorted_postings() for index, _ in parts]
+    terms = np.unique(np.concatenate([part[0] for part in postings] or [np.array([], dtype=bytes)]))
+
+    # First pass: postings per term, so every term's slice of the output is known up front
+    counts = np.zeros(terms.shape[0], dtype=np.int64)
+    for part, (_, row_map) in zip(postings, parts):
+        for term_ids, _, _ in _renumbered_postings(part, row_map, terms):
+            counts += np.bincount(term_ids, minlength=terms.shape[0])
+    # Terms only dropped rows contained are left out
+    merged_terms = terms[counts > 0]
+    merged_ids = np.cumsum(counts > 0) - 1
+    indptr = np.zeros(merged_terms.shape[0] + 1, dtype=np.int64)
+    np.cumsum(counts[counts > 0], out=indptr[1:])
+
+    os.makedirs(path, exist_ok=True)
+    rows = np.lib.format.open_memmap(os.path.join(path, "rows.npy"), mode="w+", dtype=np.int64,
+                                     shape=(int(indptr[-1]),))
+    tfs = np.lib.format.open_memmap(os.path.join(path, "tfs.npy"), mode="w+", dtype=np.int32,
+                                    shape=(int(indptr[-1]),))
+
+    # Second pass: each block's postings go after what earlier blocks wrote for the same term
+    cursor = indptr[:-1].copy()
+    for part, (_, row_map) in zip(postings, parts):
+        for term_ids, new_rows, block_tfs in _renumbered_postings(part, row_map, terms):
+            term_ids = merged_ids[term_ids]
+            rank = np.arange(term_ids.shape[0]) - np.searchsorted(term_ids, term_ids)  # position within its term
+            positions = cursor[term_ids] + rank
+            rows[positions] = new_rows
+            tfs[positions] = block_tfs
+            cursor += np.bincount(term_ids, minlength=merged_terms.shape[0])
+    rows.flush()
+    tfs.flush()
+    del rows, tfs
+
+    doc_lengths = np.zeros(size, dtype=np.int32)
+    for index, row_map in parts:
+        kept = row_map >= 0
+        doc_lengths[row_map[kept]] = index._doc_lengths[:len(index)][kept]
+
+    np.save(os.path.join(path, "terms.npy"), merged_terms, allow_pickle=False)
+    np.save(os.path.join(path, "indptr.npy"), indptr, allow_pickle=False)
+    np.save(os.path.join(path, "doc_lengths.npy"), doc_lengths, allow_pickle=False)
+    np.save(os.path.join(path, "params.npy"), np.array([k1, b]), allow_pickle=False)
+    logger.info(f"Saved merged BM25 index to {path} ({merged_terms.shape[0]} terms, {indptr[-1]} postings)")
@@ -0,0 +1,110 @@
+"""
+Context assembly for the Indiana Oracle RAG system
+Turns search results into the shortest prompt context that carries what was
+retrieved: consecutive chunks of one document are stitched back together over
+their shared overlap, sentences already included are dropped, and the rest is
+packed best-first into a token budget.
+"""
+
+import re
+import math
+import logging
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKEN_BUDGET = 200
+TOKENS_PER_WORD = 4 / 3  # close to the OpenAI tokenizers for English prose
+MAX_OVERLAP_WORDS = 200
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])[\"')\]]*\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text.split()) * TOKENS_PER_WORD)
+
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence for sentence in _SENTENCE_END.split(text.strip()) if sentence]
+
+
+def _sentence_key(sentence: str) -> str:
+    return " ".join(re.findall(r"\w+", sentence.lower()))
+
+
+def _join_overlapping(first: str, second: str) -> str:
+    """first + second without the words second repeats from the end of first"""
+    a, b = first.split(), second.split()
+    for k in range(min(len(a), len(b), MAX_OVERLAP_WORDS), 0, -1):
+        if a[-k:] == b[:k]:
+            return " ".join(a + b[k:])
+    return " ".join(a + b)
+
+
+def merge_chunks(results: List[Dict]) -> List[Dict]:
+    """One passage per run of consecutive chunks of a document, best first
+
+    Results need "doc_id" and "chunk_index" (as SimpleRAG.search returns);
+    a passage keeps its best chunk's score.
+    """
+    by_doc: Dict = {}
+    for result in results:
+        by_doc.setdefault(result.get("doc_id", id(result)), []).append(result)
+
+    passages = []
+    for chunks in by_doc.values():
+        chunks.sort(key=lambda result: result.get("chunk_index", 0))
+        passage = None
+        for result in chunks:
+            index = result.get("chunk_index")
+            if passage is not None and index is not None and index == passage["last_index"] + 1:
+                passage["text"] = _join_overlapping(passage["text"], result["chunk"])
+                passage["score"] = max(passage["score"], result["score"])
+            else:
+                passage = {key: result[key] for key in ("title", "source", "category", "score")}
+                passage["text"] = result["chunk"]
+                passages.append(passage)
+            passage["last_index"] = index if index is not None else -2
+    for passage in passages:
+        del passage["last_index"]
+    return sorted(passages, key=lambda passage: passage["score"], reverse=True)
+
+
+def pack_context(results: List[Dict], token_budget: int = DEFAULT_TOKEN_BUDGET) -> List[Dict]:
+    """Merged, sentence-deduplicated passages that fit in token_budget
+
+    Passages are taken best first; one that does not fit whole keeps as many of
+    its leading sentences as still fit.
+    """
+    seen = set()
+    packed = []
+    remaining = token_budget
+    for passage in merge_chunks(results):
+        kept = []
+        for sentence in split_sentences(passage["text"]):
+            key = _sentence_key(sentence)
+            if not key or key in seen:
+                continue
+            cost = estimate_tokens(sentence)
+            if cost > remaining:
+                if not kept and not packed:
+                    # Nothing fits yet: cut the first sentence to the budget
+                    kept.append(" ".join(sentence.split()[:int(remaining / TOKENS_PER_WORD)]))
+                    remaining = 0
+                break
+            seen.add(key)
+            kept.append(sentence)
+            remaining -= cost
+        if kept:
+            packed.append(dict(passage, text=" ".join(kept)))
+        if remaining <= 0:
+            break
+    return packed
+
+
+def format_context(passages: List[Dict]) -> str:
+    """Prompt section for packed passages ("" when there are none)"""
+    if not passages:
+        return ""
+    lines = [f"- {passage['title']}: {passage['text']}" for passage in passages]
+    return "\n\nRELEVANT CONTEXT FROM KNOWLEDGE BASE:\n" + "\n".join(lines) + "\n"
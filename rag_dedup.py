@@ -0,0 +1,91 @@
+"""
+Near-duplicate chunk detection for the Indiana Oracle RAG system
+MinHash signatures over word shingles, bucketed with LSH banding so each new
+chunk is compared only against the few earlier chunks that share a band.
+Candidates are confirmed by their estimated Jaccard similarity.
+"""
+
+import zlib
+import logging
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+NUM_PERMUTATIONS = 128
+BANDS = 16  # 16 bands x 8 rows: pairs above ~0.7 Jaccard almost always collide
+SHINGLE_WORDS = 5
+DEFAULT_THRESHOLD = 0.8  # suggested threshold; detection is off unless one is given
+SIGNATURES_FILE = "signatures.npy"  # per-row signatures saved with a segment, reused by compaction
+_PRIME = (1 << 31) - 1  # shingle hashes stay below this so the rolling hash fits uint64
+_SHINGLE_BASE = 1_000_003
+
+
+class MinHasher:
+    """Fixed random permutations shared by every signature so they are comparable"""
+
+    def __init__(self, num_permutations: int = NUM_PERMUTATIONS, shingle_words: int = SHINGLE_WORDS,
+                 seed: int = 0):
+        rng = np.random.default_rng(seed)
+        # Multiply-shift hashing: odd 64-bit multipliers, keep the high 32 bits
+        self.a = rng.integers(0, 1 << 63, size=num_permutations, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.b = rng.integers(0, 1 << 63, size=num_permutations, dtype=np.uint64)
+        self.shingle_words = shingle_words
+
+    def shingles(self, text: str) -> np.ndarray:
+        """Stable 31-bit hashes of the lower-cased word shingles of text"""
+        words = text.lower().split() or [""]
+        word_hashes = np.fromiter((zlib.crc32(word.encode("utf-8")) for word in words),
+                                  dtype=np.uint64, count=len(words)) % _PRIME
+        # Rolling polynomial hash of each run of k word hashes
+        k = min(self.shingle_words, len(words))
+        hashes = word_hashes[:len(words) - k + 1].copy()
+        for offset in range(1, k):
+            hashes = (hashes * _SHINGLE_BASE + word_hashes[offset:len(words) - k + 1 + offset]) % _PRIME
+        return np.unique(hashes)
+
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature: per permutation, the minimum hash over all shingles"""
+        hashes = self.shingles(text)
+        return ((np.outer(hashes, self.a) + self.b) >> np.uint64(32)).min(axis=0).astype(np.uint32)
+
+
+class NearDuplicateIndex:
+    """LSH band tables over the signatures of indexed rows"""
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, bands: int = BANDS,
+                 hasher: Optional[MinHasher] = None):
+        self.threshold = threshold
+        self.hasher = hasher or MinHasher()
+        self.bands = bands
+        self.rows_per_band = self.hasher.a.shape[0] // bands
+        self._buckets: Dict[Tuple[int, bytes], List[int]] = {}
+        self._signatures: Dict[int, np.ndarray] = {}
+
+    def _band_keys(self, signature: np.ndarray):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows_per_band:(band + 1) * self.rows_per_band].tobytes()
+
+    def find(self, signature: np.ndarray, is_live=None) -> Optional[int]:
+        """Most similar indexed row at or above the threshold (optionally only live rows)"""
+        candidates = set()
+        for key in self._band_keys(signature):
+            candidates.update(self._buckets.get(key, ()))
+
+        best, best_similarity = None, self.threshold
+        for row in candidates:
+            if is_live is not None and not is_live(row):
+                continue
+            similarity = float(np.mean(self._signatures[row] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = row, similarity
+        return best
+
+    def signature(self, row: int) -> np.ndarray:
+        """Signature an indexed row was added with"""
+        return self._signatures[row]
+
+    def add(self, row: int, signature: np.ndarray):
+        self._signatures[row] = signature
+        for key in self._band_keys(signature):
+            self._buckets.setdefault(key, []).append(row)
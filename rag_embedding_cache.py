@@ -0,0 +1,216 @@
+"""
+Persistent embedding cache for the Indiana Oracle RAG system
+Content-addressed by (model name, normalized text hash) with an in-memory LRU
+tier in front of an on-disk SQLite tier that evicts least-recently-used rows
+once it grows past a size budget.
+"""
+
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MEMORY_ITEMS = 4096
+DEFAULT_MAX_DISK_BYTES = 512 * 1024 * 1024
+SQL_BATCH_KEYS = 500  # keys per IN (...) lookup, under SQLite's 999 bound-variable limit
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially different copies share an entry"""
+    return " ".join(text.split())
+
+
+def cache_key(model: str, text: str) -> str:
+    """Content address of a text under a model"""
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Two-tier (memory LRU + SQLite) cache of embedding vectors"""
+
+    def __init__(self, model: str, path: Optional[str] = None,
+                 memory_items: int = DEFAULT_MEMORY_ITEMS,
+                 max_disk_bytes: int = DEFAULT_MAX_DISK_BYTES):
+        self.model = model
+        self.memory_items = memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+        self._db = None
+        self._disk_bytes = 0
+        if path:
+            self._open(path)
+
+    def _open(self, path: str):
+        """Open (or create) the on-disk tier"""
+        try:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+            self._db.commit()
+            self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        except Exception as e:
+            logger.error(f"Embedding cache disabled on disk ({path}): {e}")
+            self._db = None
+
+    def _remember(self, key: str, vector: np.ndarray):
+        """Insert into the memory tier, evicting the least recently used entry"""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Cached vectors for texts (None where missing)"""
+        keys = [cache_key(self.model, text) for text in texts]
+        results: List[Optional[np.ndarray]] = [None] * len(keys)
+        disk_lookup = {}
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    results[i] = vector
+                else:
+                    disk_lookup.setdefault(key, []).append(i)
+
+            if disk_lookup and self._db is not None:
+                found = self._read_disk(list(disk_lookup))
+                for key, vector in found.items():
+                    self._remember(key, vector)
+                    for i in disk_lookup.pop(key):
+                        results[i] = vector
+                        self._counters["disk_hits"] += 1
+
+            self._counters["misses"] += sum(len(positions) for positions in disk_lookup.values())
+
+        return results
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        """Cached vector for one text, or None"""
+        return self.get_many([text])[0]
+
+    def _read_disk(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Fetch keys from SQLite and refresh their recency"""
+        found = {}
+        try:
+            for start in range(0, len(keys), SQL_BATCH_KEYS):
+                batch = keys[start:start + SQL_BATCH_KEYS]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+            if found:
+                now = time.time()
+                self._db.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                                     [(now, key) for key in found])
+                self._db.commit()
+        except Exception as e:
+            logger.error(f"Embedding cache read error: {e}")
+        return found
+
+    def put_many(self, texts: Sequence[str], vectors: Sequence[Sequence[float]]):
+        """Store vectors for texts in both tiers"""
+        rows_by_key = {}
+        now = time.time()
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = cache_key(self.model, text)
+                vector = np.asarray(vector, dtype=np.float32)
+                self._remember(key, vector)
+                blob = vector.tobytes()
+                rows_by_key[key] = (key, blob, len(blob), now)
+            rows = list(rows_by_key.values())
+            self._counters["writes"] += len(rows)
+
+            if self._db is not None and rows:
+                try:
+                    # Replaced rows are subtracted first so the running size stays exact
+                    replaced = 0
+                    for start in range(0, len(rows), SQL_BATCH_KEYS):
+                        batch = [row[0] for row in rows[start:start + SQL_BATCH_KEYS]]
+                        placeholders = ",".join("?" * len(batch))
+                        replaced += self._db.execute(
+                            f"SELECT COALESCE(SUM(size), 0) FROM embeddings WHERE key IN ({placeholders})", batch
+                        ).fetchone()[0]
+                    self._db.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+                    self._db.commit()
+                    self._disk_bytes += sum(row[2] for row in rows) - replaced
+                    self._evict()
+                except Exception as e:
+                    logger.error(f"Embedding cache write error: {e}")
+
+    def put(self, text: str, vector: Sequence[float]):
+        """Store the vector for one text"""
+        self.put_many([text], [vector])
+
+    def _evict(self):
+        """Drop least recently used disk rows until under 90% of the size budget"""
+        if self._disk_bytes <= self.max_disk_bytes:
+            return
+        target = int(self.max_disk_bytes * 0.9)
+        while self._disk_bytes > target:
+            rows = self._db.execute(
+                "SELECT key, size FROM embeddings ORDER BY last_used LIMIT 256"
+            ).fetchall()
+            if not rows:
+                self._disk_bytes = 0
+                break
+            victims = []
+            for key, size in rows:
+                victims.append((key,))
+                self._disk_bytes -= size
+                if self._disk_bytes <= target:
+                    break
+            self._db.executemany("DELETE FROM embeddings WHERE key = ?", victims)
+            self._counters["evictions"] += len(victims)
+        self._db.commit()
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and tier sizes"""
+        with self._lock:
+            counters = dict(self._counters)
+            lookups = counters["memory_hits"] + counters["disk_hits"] + counters["misses"]
+            counters.update({
+                "model": self.model,
+                "lookups": lookups,
+                "hit_rate": (counters["memory_hits"] + counters["disk_hits"]) / lookups if lookups else 0.0,
+                "memory_items": len(self._memory),
+                "disk_bytes": self._disk_bytes,
+                "disk_enabled": self._db is not None
+            })
+        return counters
+
+    def clear(self):
+        """Empty both tiers"""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM embeddings")
+                self._db.commit()
+                self._disk_bytes = 0
+
+    def close(self):
+        """Close the on-disk tier"""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,156 @@
+"""
+Embedding providers for the Indiana Oracle RAG system
+SimpleRAG embeds through whichever provider it is given: OpenAI over the
+network, or a CPU-only hashed n-gram embedder that needs no model files, no
+API key and well under a millisecond per query. Each provider has an identity
+(provider, model, dim, version) that knowledge bases record, so vectors from
+different providers are never searched together.
+"""
+
+import os
+import re
+import zlib
+import logging
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from openai import AsyncOpenAI, OpenAI
+
+from rag_vector_index import normalize_rows
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "text-embedding-3-small"  # More cost-effective
+EMBEDDING_DIM = 1536
+OPENAI_DIMS = {"text-embedding-3-small": 1536, "text-embedding-3-large": 3072, "text-embedding-ada-002": 1536}
+LOCAL_DIM = 384
+DEFAULT_PROVIDER = "openai"  # overridden by RAG_EMBEDDING_PROVIDER
+
+
+class EmbeddingProvider(ABC):
+    """Turns texts into vectors of one fixed vector space"""
+
+    provider = ""
+    model = ""
+    dim = 0
+    version = 1  # bump when the same model starts producing different vectors
+    cacheable = False  # whether an EmbeddingCache in front of it saves anything
+
+    @property
+    def identity(self) -> Dict:
+        """What a knowledge base records about the vectors it holds"""
+        return {"provider": self.provider, "model": self.model, "dim": self.dim, "version": self.version}
+
+    @property
+    def name(self) -> str:
+        return f"{self.provider}:{self.model}"
+
+    @abstractmethod
+    def embed_many(self, texts: Sequence[str]) -> List[List[float]]:
+        """Embeddings in input order (raises on failure)"""
+
+    async def embed_many_async(self, texts: Sequence[str]) -> List[List[float]]:
+        return self.embed_many(texts)
+
+    async def aclose(self):
+        pass
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """OpenAI embeddings API; clients are created on first use"""
+
+    provider = "openai"
+    cacheable = True
+
+    def __init__(self, model: str = EMBEDDING_MODEL, dim: Optional[int] = None, api_key: Optional[str] = None):
+        self.model = model
+        self.dim = dim or OPENAI_DIMS.get(model, EMBEDDING_DIM)
+        self.api_key = api_key
+        self._client: Optional[OpenAI] = None
+        self._async_client: Optional[AsyncOpenAI] = None  # created inside the event loop that uses it
+
+    @property
+    def client(self) -> OpenAI:
+        if self._client is None:
+            self._client = OpenAI(api_key=self.api_key or os.getenv("OPENAI_API_KEY"))
+        return self._client
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        """Async client; its HTTP connection pool is shared by every coroutine"""
+        if self._async_client is None:
+            self._async_client = AsyncOpenAI(api_key=self.api_key or os.getenv("OPENAI_API_KEY"))
+        return self._async_client
+
+    def embed_many(self, texts: Sequence[str]) -> List[List[float]]:
+        response = self.client.embeddings.create(model=self.model, input=list(texts))
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    async def embed_many_async(self, texts: Sequence[str]) -> List[List[float]]:
+        response = await self.async_client.embeddings.create(model=self.model, input=list(texts))
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+
+
+class LocalEmbeddingProvider(EmbeddingProvider):
+    """Hashed word and character n-gram features, signed-hashed into dim buckets
+
+    Signed feature hashing is a sparse random projection of the n-gram counts:
+    texts sharing words or word fragments land close together, with no model
+    to load and no network.
+    """
+
+    provider = "local"
+    version = 1
+    WORD_WEIGHT = 1.0
+    NGRAM_WEIGHT = 0.25
+
+    def __init__(self, dim: int = LOCAL_DIM, char_ngrams: Sequence[int] = (3, 4)):
+        self.dim = dim
+        self.char_ngrams = tuple(char_ngrams)
+        self.model = "hashed-ngram-" + "-".join(str(n) for n in self.char_ngrams)
+
+    def _features(self, text: str):
+        for word in re.findall(r"\w+", text.lower()):
+            yield "w:" + word, self.WORD_WEIGHT
+            padded = f"<{word}>"
+            for n in self.char_ngrams:
+                for i in range(len(padded) - n + 1):
+                    yield padded[i:i + n], self.NGRAM_WEIGHT
+
+    def embed_one(self, text: str) -> np.ndarray:
+        hashes, weights = [], []
+        for feature, weight in self._features(text):
+            hashes.append(zlib.crc32(feature.encode("utf-8")))
+            weights.append(weight)
+        if not hashes:
+            return np.zeros(self.dim, dtype=np.float32)
+        hashes = np.asarray(hashes, dtype=np.int64)
+        signs = np.where(hashes & (1 << 31), -1.0, 1.0) * np.asarray(weights)
+        return np.bincount(hashes % self.dim, weights=signs, minlength=self.dim).astype(np.float32)
+
+    def embed_many(self, texts: Sequence[str]) -> List[List[float]]:
+        if not len(texts):
+            return []
+        return normalize_rows(np.stack([self.embed_one(text) for text in texts])).tolist()
+
+
+PROVIDERS = {"openai": OpenAIEmbeddingProvider, "local": LocalEmbeddingProvider}
+
+
+def make_provider(spec: Optional[str] = None) -> EmbeddingProvider:
+    """Provider from a "name[:option]" spec: "openai", "openai:text-embedding-3-large", "local", "local:512"
+
+    Without a spec, RAG_EMBEDDING_PROVIDER (or DEFAULT_PROVIDER) decides.
+    """
+    spec = spec or os.getenv("RAG_EMBEDDING_PROVIDER", DEFAULT_PROVIDER)
+    name, _, option = spec.partition(":")
+    if name == "openai":
+        return OpenAIEmbeddingProvider(option or EMBEDDING_MODEL)
+    if name == "local":
+        return LocalEmbeddingProvider(int(option) if option else LOCAL_DIM)
+    raise ValueError(f"Unknown embedding provider: {spec} (expected one of {', '.join(PROVIDERS)})")
@@ -0,0 +1,72 @@
+"""
+Retrieval gating for the Indiana Oracle RAG system
+Decides locally, in microseconds, whether a message needs the knowledge base
+at all. Greetings, thanks and other small talk carry no retrieval signal, so
+they skip the embedding call, the search and the longer system prompt. The
+gate counts what it skipped and the latency that saved.
+"""
+
+import time
+import logging
+import threading
+from typing import Dict
+
+from rag_bm25 import tokenize
+
+logger = logging.getLogger(__name__)
+
+LONG_MESSAGE_WORDS = 12  # messages this long always retrieve
+
+# Conversational words that never need the knowledge base (on top of the BM25 stopwords)
+SMALL_TALK = frozenset("""
+hi hello hey hiya howdy yo greetings morning afternoon evening night good great nice cool
+awesome wow oh ah hmm um uh ok okay alright sure yes yeah yep no nope nah thanks thank
+thx ty please sorry bye goodbye later cya see soon welcome fine well doing going today
+day up new again too very really much so lol haha hah love like it's i'm you're that's
+what's how's fun interesting true right indeed agreed exactly wonderful amazing bad
+glad happy pleased meet nice talk talking chat chatting there back hear heard
+""".split())
+
+
+class RetrievalGate:
+    """Keyword-and-length classifier in front of search, with skip counters"""
+
+    def __init__(self, long_message_words: int = LONG_MESSAGE_WORDS):
+        self.long_message_words = long_message_words
+        self._lock = threading.Lock()
+        self._counters = {"checked": 0, "retrieved": 0, "skipped": 0}
+        self._gate_seconds = 0.0
+        self._search_seconds = 0.0
+
+    def needs_retrieval(self, message: str) -> bool:
+        """True unless the message is small talk: no word outside the filler vocabulary"""
+        start = time.perf_counter()
+        words = message.split()
+        needed = len(words) >= self.long_message_words or \
+            any(token not in SMALL_TALK for token in tokenize(message))
+        with self._lock:
+            self._counters["checked"] += 1
+            self._counters["retrieved" if needed else "skipped"] += 1
+            self._gate_seconds += time.perf_counter() - start
+        if not needed:
+            logger.debug(f"Skipping retrieval for small talk: {message!r}")
+        return needed
+
+    def record_search(self, seconds: float):
+        """Time a gated-through retrieval took (estimates what a skip saves)"""
+        with self._lock:
+            self._search_seconds += seconds
+
+    def stats(self) -> Dict:
+        """Decision counters, gate cost and the retrieval calls and latency saved"""
+        with self._lock:
+            counters = dict(self._counters)
+            gate_seconds, search_seconds = self._gate_seconds, self._search_seconds
+        checked, retrieved, skipped = counters["checked"], counters["retrieved"], counters["skipped"]
+        avg_search_ms = search_seconds / retrieved * 1000 if retrieved else 0.0
+        return dict(counters,
+                    skip_rate=skipped / checked if checked else 0.0,
+                    avg_gate_ms=gate_seconds / checked * 1000 if checked else 0.0,
+                    avg_search_ms=avg_search_ms,
+                    saved_searches=skipped,
+                    saved_ms=skipped * avg_search_ms)
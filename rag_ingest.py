@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Batched, concurrent embedding ingestion for the Indiana Oracle RAG system
+Groups chunks into multi-input embedding requests, keeps a bounded number of
+batches in flight, retries transient failures with backoff and checkpoints
+finished documents so an interrupted ingest can resume.
+"""
+
+import os
+import json
+import time
+import base64
+import random
+import tempfile
+import hashlib
+import logging
+import argparse
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# HTTP statuses worth retrying: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+def document_key(document: Dict) -> str:
+    """Stable identity of a document for checkpointing"""
+    if document.get("key"):
+        return str(document["key"])
+    digest = hashlib.sha1()
+    for field in ("title", "source", "content"):
+        digest.update(str(document.get(field, "")).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether an embedding request error is transient"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        return True  # connection errors, timeouts
+    return status in RETRYABLE_STATUS or status >= 500
+
+
+@dataclass
+class IngestStats:
+    """Counters for one ingestion run"""
+    documents: int = 0
+    chunks: int = 0
+    batches: int = 0
+    retries: int = 0
+    failed_documents: int = 0
+    skipped_documents: int = 0
+    resumed_documents: int = 0
+    seconds: float = 0.0
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.seconds if self.seconds > 0 else 0.0
+
+
+class IngestCheckpoint:
+    """Append-only record of finished documents and their vectors"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.log_path = self.path / "checkpoint.jsonl"
+        self.vectors_path = self.path / "checkpoint.f32"
+        self.done = set()
+
+    def replay(self) -> Iterator[Tuple[Dict, np.ndarray]]:
+        """Yield (record, vectors) for every document finished by an earlier run"""
+        if not self.log_path.exists():
+            return
+
+        with open(self.log_path, "r", encoding="utf-8") as log, open(self.vectors_path, "rb") as vectors:
+            for line in log:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # torn final line from a crash
+                count, dim = record["vector_count"], record["dim"]
+                data = vectors.read(count * dim * 4)
+                if len(data) < count * dim * 4:
+                    break
+                self.done.add(record["key"])
+                yield record, np.frombuffer(data, dtype=np.float32).reshape(count, dim)
+
+    def record(self, key: str, document: Dict, chunks: Sequence[str], vectors: np.ndarray):
+        """Durably append a finished document"""
+        self.path.mkdir(parents=True, exist_ok=True)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+
+        # Vectors go first so a logged record always has its rows on disk
+        with open(self.vectors_path, "ab") as f:
+            f.write(vectors.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+        record = {
+            "key": key,
+            "document": {k: v for k, v in document.items() if k != "content"},
+            "content": document.get("content", ""),
+            "chunks": list(chunks),
+            "vector_count": int(vectors.shape[0]),
+            "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0
+        }
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.done.add(key)
+
+    def clear(self):
+        """Remove the checkpoint once its documents are safely persisted"""
+        for path in (self.log_path, self.vectors_path):
+            if path.exists():
+                path.unlink()
+        self.done.clear()
+
+
+class IngestPipeline:
+    """Chunk documents, embed them in concurrent batches and commit whole documents"""
+
+    def __init__(self,
+                 embed_batch: Callable[[List[str]], List[List[float]]],
+                 chunker: Callable[[str], Sequence[str]],
+                 commit: Callable[[Dict, List[str], np.ndarray], None],
+                 batch_size: int = 64,
+                 max_in_flight: int = 4,
+                 max_retries: int = 4,
+                 backoff: float = 0.5,
+                 checkpoint_path: Optional[str] = None):
+        self.embed_batch = embed_batch
+        self.chunker = chunker
+        self.commit = commit
+        self.batch_size = max(1, batch_size)
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.checkpoint = IngestCheckpoint(checkpoint_path) if checkpoint_path else None
+        self._lock = threading.Lock()
+
+    def _embed_with_retry(self, texts: List[str], stats: IngestStats) -> np.ndarray:
+        """Embed one batch, retrying transient errors with exponential backoff"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return np.asarray(self.embed_batch(texts), dtype=np.float32)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = self.backoff * (2 ** attempt) * (1 + random.random() * 0.25)
+                logger.warning(f"Embedding batch failed ({e}); retrying in {delay:.2f}s")
+                with self._lock:
+                    stats.retries += 1
+                time.sleep(delay)
+
+    def _finish_document(self, state: Dict, stats: IngestStats):
+        """Commit a document once all of its chunks have vectors"""
+        if state["failed"]:
+            stats.failed_documents += 1
+            logger.error(f"Failed to embed document: {state['document'].get('title')}")
+            return
+
+        vectors = np.vstack(state["vectors"])
+        self.commit(state["document"], state["chunks"], vectors)
+        if self.checkpoint:
+            self.checkpoint.record(state["key"], state["document"], state["chunks"], vectors)
+        stats.documents += 1
+        stats.chunks += len(state["chunks"])
+
+    def _drain(self, in_flight: Dict, pending: Dict, stats: IngestStats):
+        """Wait for at least one batch and route its vectors back to documents"""
+        done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+        for future in done:
+            items = in_flight.pop(future)
+            try:
+                vectors = future.result()
+            except Exception as e:
+                logger.error(f"Embedding batch of {len(items)} chunks failed: {e}")
+                vectors = None
+
+            for position, (seq, chunk_index) in enumerate(items):
+                state = pending[seq]
+                if vectors is None:
+                    state["failed"] = True
+                else:
+                    state["vectors"][chunk_index] = vectors[position:position + 1]
+                state["remaining"] -= 1
+                if state["remaining"] == 0:
+                    self._finish_document(pending.pop(seq), stats)
+
+    def run(self, documents: Iterable[Dict]) -> IngestStats:
+        """Ingest documents ({"title", "content", "source", "category"}); returns counters
+        
+        A document may carry ready-made "chunks" instead of "content".
+        """
+        stats = IngestStats()
+        start = time.perf_counter()
+
+        # Restore documents finished by an interrupted run
+        if self.checkpoint:
+            for record, vectors in self.checkpoint.replay():
+                document = dict(record["document"], content=record["content"])
+                self.commit(document, record["chunks"], vectors)
+                stats.resumed_documents += 1
+
+        pending: Dict[int, Dict] = {}
+        in_flight: Dict = {}
+        batch: List[Tuple[int, int, str]] = []
+
+        def submit():
+            future = pool.submit(self._embed_with_retry, [text for _, _, text in batch], stats)
+            in_flight[future] = [(seq, index) for seq, index, _ in batch]
+            stats.batches += 1
+            # Bound memory and concurrency: never more than max_in_flight batches outstanding
+            while len(in_flight) >= self.max_in_flight:
+                self._drain(in_flight, pending, stats)
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as pool:
+            for seq, document in enumerate(documents):
+                key = document_key(document)
+                if self.checkpoint and key in self.checkpoint.done:
+                    stats.skipped_documents += 1
+                    continue
+
+                chunks = document["chunks"] if "chunks" in document else self.chunker(document.get("content", ""))
+                pending[seq] = {
+                    "key": key,
+                    "document": document,
+                    "chunks": chunks,
+                    "vectors": [None] * len(chunks),
+                    "remaining": len(chunks),
+                    "failed": False
+                }
+                if not chunks:
+                    self._finish_document(pending.pop(seq), stats)
+                    continue
+
+                for index, chunk in enumerate(chunks):
+                    batch.append((seq, index, chunk))
+                    if len(batch) >= self.batch_size:
+                        submit()
+                        batch = []
+
+            if batch:
+                submit()
+                batch = []
+            while in_flight:
+                self._drain(in_flight, pending, stats)
+
+        stats.seconds = time.perf_counter() - start
+        logger.info(f"Ingested {stats.documents} documents ({stats.chunks} chunks) in {stats.seconds:.2f}s "
+                    f"- {stats.chunks_per_second:.1f} chunks/sec, {stats.retries} retries, "
+                    f"{stats.failed_documents} failed, {stats.skipped_documents} already done")
+        return stats
+
+
+def mock_embedding(text: str, dim: int) -> np.ndarray:
+    """Deterministic pseudo-embedding for a text"""
+    seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def serve_mock_embeddings(port: int = 8765, latency: float = 0.05, dim: int = 1536) -> ThreadingHTTPServer:
+    """Start a local OpenAI-compatible /v1/embeddings endpoint in a background thread"""
+
+    class MockEmbeddingHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            inputs = body.get("input", [])
+            if isinstance(inputs, str):
+                inputs = [inputs]
+
+            # Simulated network round trip, paid once per request regardless of batch size
+            time.sleep(latency)
+
+            data = []
+            for i, text in enumerate(inputs):
+                vector = mock_embedding(text, dim)
+                if body.get("encoding_format") == "base64":
+                    embedding = base64.b64encode(vector.tobytes()).decode()
+                else:
+                    embedding = vector.tolist()
+                data.append({"object": "embedding", "index": i, "embedding": embedding})
+
+            payload = json.dumps({
+                "object": "list",
+                "data": data,
+                "model": body.get("model", "mock"),
+                "usage": {"prompt_tokens": 0, "total_tokens": 0}
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockEmbeddingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Mock embedding endpoint on http://127.0.0.1:{server.server_port}/v1 (latency {latency}s)")
+    return server
+
+
+def benchmark(documents: int, words: int, batch_size: int, max_in_flight: int, latency: float):
+    """Compare sequential and batched ingestion against the mock endpoint"""
+    from simple_rag_system import SimpleRAG
+
+    server = serve_mock_embeddings(port=0, latency=latency)
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "mock")
+
+    rng = random.Random(0)
+    vocabulary = ["hoosier", "limestone", "speedway", "vonnegut", "bloomington", "corydon",
+                  "wabash", "prairie", "library", "festival", "brickyard", "seminary"]
+    corpus = [
+        {"title": f"Doc {i}", "source": "mock", "category": "general",
+         "content": " ".join(rng.choice(vocabulary) for _ in range(words))}
+        for i in range(documents)
+    ]
+
+    for label, size, flight in (("sequential", 1, 1), ("batched", batch_size, max_in_flight)):
+        with tempfile.TemporaryDirectory() as path:
+            rag = SimpleRAG(load=False, use_cache=False, path=path)
+            stats = rag.add_documents(corpus, batch_size=size, max_in_flight=flight)
+        print(f"{label:>10}: {stats.chunks} chunks in {stats.seconds:.2f}s "
+              f"({stats.chunks_per_second:.1f} chunks/sec, {stats.batches} requests)")
+
+    server.shutdown()
+
+
+def main():
+    """CLI: run a mock embedding endpoint or benchmark ingestion against it"""
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    mock = sub.add_parser("mock-server", help="serve an OpenAI-compatible mock embedding endpoint")
+    mock.add_argument("--port", type=int, default=8765)
+    mock.add_argument("--latency", type=float, default=0.05)
+    mock.add_argument("--dim", type=int, default=1536)
+
+    bench = sub.add_parser("bench", help="measure ingestion throughput against the mock endpoint")
+    bench.add_argument("--documents", type=int, default=200)
+    bench.add_argument("--words", type=int, default=1200)
+    bench.add_argument("--batch-size", type=int, default=64)
+    bench.add_argument("--in-flight", type=int, default=4)
+    bench.add_argument("--latency", type=float, default=0.05)
+
+    args = parser.parse_args()
+    if args.command == "mock-server":
+        server = serve_mock_embeddings(args.port, args.latency, args.dim)
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
+    else:
+        benchmark(args.documents, args.words, args.batch_size, args.in_flight, args.latency)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Quantized embedding storage for the Indiana Oracle RAG system
+Keeps a compact int8 (per-row scale) or float16 copy of a segment's embedding
+matrix in RAM for a first scoring pass. The best candidates are then rescored
+against the full-precision float32 rows, which stay memory-mapped on disk and
+are only paged in for those candidates.
+"""
+
+import time
+import logging
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+from rag_vector_index import normalize_rows, top_k_indices
+
+logger = logging.getLogger(__name__)
+
+QUANTIZED_FILE = "quantized.npz"
+QUANTIZATION_MODES = ("int8", "float16")
+SCORE_BLOCK_ROWS = 65536  # bounds the float32 upcast while scoring compact rows
+
+
+class QuantizedMatrix:
+    """Compact copy of an embedding matrix used to shortlist rows for exact rescoring"""
+
+    def __init__(self, mode: str, codes: np.ndarray, scales: Optional[np.ndarray] = None, rescore: int = 4):
+        if mode not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization mode: {mode}")
+        self.mode = mode
+        self.codes = codes  # (rows, dim) int8 or float16
+        self.scales = scales  # int8 only: per-row multiplier back to float
+        self.rescore = rescore  # candidates rescored exactly = rescore * top_k
+
+    @property
+    def indexed_rows(self) -> int:
+        return self.codes.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, mode: str = "int8", rescore: int = 4) -> "QuantizedMatrix":
+        """Quantize a (pre-normalized) float32 matrix block by block"""
+        if mode not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization mode: {mode}")
+        n, dim = vectors.shape
+        codes = np.empty((n, dim), dtype=np.int8 if mode == "int8" else np.float16)
+        scales = np.empty(n, dtype=np.float32) if mode == "int8" else None
+
+        for start in range(0, n, SCORE_BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+            stop = start + block.shape[0]
+            if mode == "float16":
+                codes[start:stop] = block
+                continue
+            # Symmetric per-row scale: the largest component maps to +-127
+            peak = np.abs(block).max(axis=1)
+            peak[peak == 0] = 1.0
+            scales[start:stop] = peak / 127.0
+            codes[start:stop] = np.rint(block / scales[start:stop, None])
+
+        return cls(mode, codes, scales, rescore)
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        """Approximate similarity of a normalized query against every quantized row"""
+        scores = np.empty(self.indexed_rows, dtype=np.float32)
+        for start in range(0, self.indexed_rows, SCORE_BLOCK_ROWS):
+            block = self.codes[start:start + SCORE_BLOCK_ROWS]
+            scores[start:start + block.shape[0]] = block.astype(np.float32) @ query
+        if self.scales is not None:
+            scores *= self.scales
+        return scores
+
+    def search(self, vectors: np.ndarray, query: Sequence[float], top_k: int = 3,
+               exclude: Optional[np.ndarray] = None, rescore: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Top_k (row id, exact similarity) pairs: quantized shortlist, float32 rescoring"""
+        q = normalize_rows(query)[0]
+        scores = self.scores(q)
+
+        # Rows appended since the build have no quantized copy; score them exactly
+        if vectors.shape[0] > self.indexed_rows:
+            scores = np.concatenate([scores, vectors[self.indexed_rows:] @ q])
+        if exclude is not None:
+            scores[exclude[:scores.shape[0]]] = -np.inf
+
+        shortlist = top_k_indices(scores, top_k * (rescore or self.rescore))
+        shortlist = np.sort(shortlist[scores[shortlist] > -np.inf])  # sequential reads from the mapped matrix
+        if shortlist.size == 0:
+            return []
+
+        exact = vectors[shortlist] @ q
+        return [(int(shortlist[i]), float(exact[i])) for i in top_k_indices(exact, top_k)]
+
+    def save(self, path: str):
+        """Write the quantized matrix next to the segment's vectors"""
+        arrays = {"codes": self.codes, "rescore": np.int64(self.rescore)}
+        if self.scales is not None:
+            arrays["scales"] = self.scales
+        np.savez(path, **arrays)
+        logger.info(f"Saved {self.mode} quantized matrix to {path} ({self.nbytes / 1e6:.1f} MB)")
+
+    @classmethod
+    def load(cls, path: str) -> "QuantizedMatrix":
+        """Read a matrix written by save() into RAM"""
+        with np.load(path, allow_pickle=False) as data:
+            codes = data["codes"]
+            scales = data["scales"] if "scales" in data else None
+            mode = "int8" if codes.dtype == np.int8 else "float16"
+            return cls(mode, codes, scales, int(data["rescore"]))
+
+
+def evaluate_quantization(vectors: np.ndarray, modes: Sequence[str] = QUANTIZATION_MODES, top_k: int = 10,
+                          rescore: int = 4, n_queries: int = 200, noise: float = 0.05,
+                          seed: int = 1) -> List[Dict]:
+    """RAM footprint, recall@k and latency of each storage mode against exact float32 search
+
+    Queries are corpus rows with Gaussian noise added, as in rag_ann.evaluate_recall.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(vectors.shape[0], size=min(n_queries, vectors.shape[0]), replace=False)
+    queries = normalize_rows(vectors[rows] + rng.normal(0, noise, (rows.size, vectors.shape[1])))
+
+    exact, exact_seconds = [], 0.0
+    for q in queries:
+        start = time.perf_counter()
+        exact.append(set(top_k_indices(vectors @ q, top_k).tolist()))
+        exact_seconds += time.perf_counter() - start
+
+    report = [{"mode": "float32", "bytes": vectors.nbytes, "recall": 1.0,
+               "first_pass_recall": 1.0, "avg_ms": 1000 * exact_seconds / len(queries)}]
+    for mode in modes:
+        quantized = QuantizedMatrix.build(vectors, mode, rescore)
+        hits, first_pass_hits, seconds = 0, 0, 0.0
+        for q, truth in zip(queries, exact):
+            start = time.perf_counter()
+            found = quantized.search(vectors, q, top_k)
+            seconds += time.perf_counter() - start
+            hits += len(truth.intersection(row for row, _ in found))
+            first_pass_hits += len(truth.intersection(top_k_indices(quantized.scores(q), top_k).tolist()))
+        report.append({
+            "mode": mode,
+            "bytes": quantized.nbytes,
+            "recall": hits / (len(queries) * top_k),
+            "first_pass_recall": first_pass_hits / (len(queries) * top_k),
+            "avg_ms": 1000 * seconds / len(queries)
+        })
+    return report
+
+
+def main():
+    """CLI: quantize the segments of a knowledge base, or report footprint and recall per mode"""
+    from rag_segments import SegmentedStore
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("command", choices=["build", "eval"])
+    parser.add_argument("store", nargs="?", default="indiana_knowledge_base")
+    parser.add_argument("--mode", choices=QUANTIZATION_MODES, default="int8")
+    parser.add_argument("--rescore", type=int, default=4, help="rows rescored exactly per result")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    store = SegmentedStore(args.store)
+    if not store.open():
+        parser.error(f"No knowledge base at {args.store}")
+
+    if args.command == "build":
+        for segment in store.segments:
+            if len(segment):
+                QuantizedMatrix.build(segment.index.vectors, args.mode, args.rescore).save(
+                    str(Path(segment.path) / QUANTIZED_FILE))
+        return
+
+    vectors = np.concatenate([segment.index.vectors for segment in store.segments if len(segment)])
+    print(f"{'mode':>8} {'MB':>8} {'recall@' + str(args.top_k):>10} {'1st pass':>9} {'avg ms':>8}")
+    for row in evaluate_quantization(vectors, top_k=args.top_k, rescore=args.rescore, n_queries=args.queries):
+        print(f"{row['mode']:>8} {row['bytes'] / 1e6:>8.2f} {row['recall']:>10.3f} "
+              f"{row['first_pass_recall']:>9.3f} {row['avg_ms']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Reduced-dimension scoring for the Indiana Oracle RAG system
+Keeps a low-dimensional copy (256/384 dims) of a segment's embedding matrix in
+RAM for a first scoring pass: either a PCA projection fitted on the segment's
+own vectors, or, for Matryoshka-trained models such as text-embedding-3, the
+leading dimensions renormalized. A narrow corpus has most of its variance in
+a few hundred directions, so the shortlist keeps nearly all of the true
+neighbours; it is rescored against the full-dimension float32 rows, which stay
+memory-mapped on disk.
+"""
+
+import time
+import logging
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+from rag_vector_index import normalize_rows, top_k_indices
+
+logger = logging.getLogger(__name__)
+
+REDUCED_FILE = "reduced.npz"
+REDUCTION_METHODS = ("pca", "truncate")
+DEFAULT_DIMS = (256, 384)
+PCA_SAMPLE_ROWS = 20_000  # rows the covariance is estimated from
+PROJECT_BLOCK_ROWS = 65536  # bounds the float32 copy while projecting
+
+
+class ReducedMatrix:
+    """Low-dimensional copy of an embedding matrix used to shortlist rows for full-dimension rescoring"""
+
+    def __init__(self, method: str, codes: np.ndarray, components: Optional[np.ndarray] = None,
+                 mean: Optional[np.ndarray] = None, rescore: int = 4):
+        if method not in REDUCTION_METHODS:
+            raise ValueError(f"Unknown reduction method: {method}")
+        self.method = method
+        self.codes = codes  # (rows, dim) float32
+        self.components = components  # pca only: (full dim, dim) projection
+        self.mean = mean  # pca only: subtracted before projecting rows
+        self.rescore = rescore  # candidates rescored at full dimension = rescore * top_k
+
+    @property
+    def dim(self) -> int:
+        return self.codes.shape[1]
+
+    @property
+    def indexed_rows(self) -> int:
+        return self.codes.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.components.nbytes if self.components is not None else 0)
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, dim: int = 256, method: str = "pca", rescore: int = 4,
+              seed: int = 0) -> "ReducedMatrix":
+        """Fit the reduction on a (pre-normalized) float32 matrix and project it block by block"""
+        if method not in REDUCTION_METHODS:
+            raise ValueError(f"Unknown reduction method: {method}")
+        n, full_dim = vectors.shape
+        dim = min(dim, full_dim)
+        components = mean = None
+        if method == "pca":
+            rows = np.arange(n) if n <= PCA_SAMPLE_ROWS else \
+                np.sort(np.random.default_rng(seed).choice(n, PCA_SAMPLE_ROWS, replace=False))
+            sample = np.asarray(vectors[rows], dtype=np.float64)
+            mean = sample.mean(axis=0)
+            centered = sample - mean
+            # Leading eigenvectors of the covariance, largest variance first
+            _, eigenvectors = np.linalg.eigh(centered.T @ centered)
+            components = np.ascontiguousarray(eigenvectors[:, ::-1][:, :dim], dtype=np.float32)
+            mean = mean.astype(np.float32)
+
+        reduced = cls(method, np.empty((n, dim), dtype=np.float32), components, mean, rescore)
+        for start in range(0, n, PROJECT_BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + PROJECT_BLOCK_ROWS], dtype=np.float32)
+            reduced.codes[start:start + block.shape[0]] = reduced.project_rows(block)
+        return reduced
+
+    def project_rows(self, rows: np.ndarray) -> np.ndarray:
+        if self.method == "truncate":
+            return normalize_rows(rows[:, :self.dim])
+        # q . x ranks the same as q . (x - mean): the q . mean term is shared by every row
+        return (rows - self.mean) @ self.components
+
+    def project_query(self, query: np.ndarray) -> np.ndarray:
+        if self.method == "truncate":
+            return normalize_rows(query[:self.dim])[0]
+        return query @ self.components
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        """Approximate ranking scores of a normalized query against every reduced row"""
+        return self.codes @ self.project_query(query)
+
+    def search(self, vectors: np.ndarray, query: Sequence[float], top_k: int = 3,
+               exclude: Optional[np.ndarray] = None, rescore: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Top_k (row id, exact similarity) pairs: reduced shortlist, full-dimension rescoring"""
+        q = normalize_rows(query)[0]
+        scores = self.scores(q)
+
+        # Rows appended since the build have no reduced copy; they always make the shortlist
+        appended = np.arange(self.indexed_rows, vectors.shape[0])
+        if exclude is not None:
+            scores[exclude[:scores.shape[0]]] = -np.inf
+            appended = appended[~exclude[appended]] if appended.size else appended
+
+        shortlist = top_k_indices(scores, top_k * (rescore or self.rescore))
+        shortlist = shortlist[scores[shortlist] > -np.inf]
+        shortlist = np.sort(np.concatenate([shortlist, appended]))  # sequential reads from the mapped matrix
+        if shortlist.size == 0:
+            return []
+
+        exact = vectors[shortlist] @ q
+        return [(int(shortlist[i]), float(exact[i])) for i in top_k_indices(exact, top_k)]
+
+    def save(self, path: str):
+        """Write the reduced matrix and its projection next to the segment's vectors"""
+        arrays = {"codes": self.codes, "method": np.array(self.method), "rescore": np.int64(self.rescore)}
+        if self.components is not None:
+            arrays["components"] = self.components
+            arrays["mean"] = self.mean
+        np.savez(path, **arrays)
+        logger.info(f"Saved {self.method}-{self.dim} reduced matrix to {path} ({self.nbytes / 1e6:.1f} MB)")
+
+    @classmethod
+    def load(cls, path: str) -> "ReducedMatrix":
+        """Read a matrix written by save() into RAM"""
+        with np.load(path, allow_pickle=False) as data:
+            components = data["components"] if "components" in data else None
+            mean = data["mean"] if "mean" in data else None
+            return cls(str(data["method"]), data["codes"], components, mean, int(data["rescore"]))
+
+
+def evaluate_reduction(vectors: np.ndarray, dims: Sequence[int] = DEFAULT_DIMS, method: str = "pca",
+                       top_k: int = 10, rescore: int = 4, n_queries: int = 200, noise: float = 0.05,
+                       seed: int = 1) -> List[Dict]:
+    """RAM footprint, recall@k and latency of each reduced dimension against exact full-dimension search
+
+    Queries are corpus rows with Gaussian noise added, as in rag_quantize.evaluate_quantization.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(vectors.shape[0], size=min(n_queries, vectors.shape[0]), replace=False)
+    queries = normalize_rows(vectors[rows] + rng.normal(0, noise, (rows.size, vectors.shape[1])))
+
+    exact, exact_seconds = [], 0.0
+    for q in queries:
+        start = time.perf_counter()
+        exact.append(set(top_k_indices(vectors @ q, top_k).tolist()))
+        exact_seconds += time.perf_counter() - start
+
+    report = [{"dim": vectors.shape[1], "bytes": vectors.nbytes, "build_seconds": 0.0, "recall": 1.0,
+               "first_pass_recall": 1.0, "avg_ms": 1000 * exact_seconds / len(queries)}]
+    for dim in dims:
+        if dim >= vectors.shape[1]:
+            continue
+        start = time.perf_counter()
+        reduced = ReducedMatrix.build(vectors, dim, method, rescore)
+        build_seconds = time.perf_counter() - start
+        hits, first_pass_hits, seconds = 0, 0, 0.0
+        for q, truth in zip(queries, exact):
+            start = time.perf_counter()
+            found = reduced.search(vectors, q, top_k)
+            seconds += time.perf_counter() - start
+            hits += len(truth.intersection(row for row, _ in found))
+            first_pass_hits += len(truth.intersection(top_k_indices(reduced.scores(q), top_k).tolist()))
+        report.append({
+            "dim": dim,
+            "bytes": reduced.nbytes,
+            "build_seconds": build_seconds,
+            "recall": hits / (len(queries) * top_k),
+            "first_pass_recall": first_pass_hits / (len(queries) * top_k),
+            "avg_ms": 1000 * seconds / len(queries)
+        })
+    return report
+
+
+def main():
+    """CLI: reduce the segments of a knowledge base, or report speed and recall per dimension"""
+    from rag_segments import SegmentedStore
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("command", choices=["build", "eval"])
+    parser.add_argument("store", nargs="?", default="indiana_knowledge_base")
+    parser.add_argument("--method", choices=REDUCTION_METHODS, default="pca")
+    parser.add_argument("--dims", default=",".join(str(dim) for dim in DEFAULT_DIMS),
+                        help="comma-separated dimensions (build uses the first)")
+    parser.add_argument("--rescore", type=int, default=4, help="rows rescored at full dimension per result")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+    dims = [int(dim) for dim in args.dims.split(",")]
+
+    store = SegmentedStore(args.store)
+    if not store.open():
+        parser.error(f"No knowledge base at {args.store}")
+
+    if args.command == "build":
+        for segment in store.segments:
+            if len(segment):
+                ReducedMatrix.build(segment.index.vectors, dims[0], args.method, args.rescore).save(
+                    str(Path(segment.path) / REDUCED_FILE))
+        return
+
+    vectors = np.concatenate([segment.index.vectors for segment in store.segments if len(segment)])
+    print(f"{'dim':>6} {'MB':>8} {'build s':>8} {'recall@' + str(args.top_k):>10} {'1st pass':>9} "
+          f"{'avg ms':>8} {'speedup':>8}")
+    report = evaluate_reduction(vectors, dims, args.method, args.top_k, args.rescore, args.queries)
+    for row in report:
+        print(f"{row['dim']:>6} {row['bytes'] / 1e6:>8.2f} {row['build_seconds']:>8.2f} {row['recall']:>10.3f} "
+              f"{row['first_pass_recall']:>9.3f} {row['avg_ms']:>8.2f} {report[0]['avg_ms'] / row['avg_ms']:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
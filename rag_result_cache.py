@@ -0,0 +1,97 @@
+"""
+Semantic result cache for the Indiana Oracle RAG system
+Remembers the results of recent searches by query embedding. A new query whose
+embedding lies within max_distance (cosine) of a cached one, with the same
+search options, reuses those results instead of scoring the corpus again.
+Entries are evicted least-recently-used and dropped whenever the knowledge
+base generation changes.
+"""
+
+import logging
+import threading
+from typing import Dict, Hashable, List, Optional, Sequence
+import numpy as np
+
+from rag_vector_index import normalize_rows
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_DISTANCE = 0.05
+
+
+class SemanticResultCache:
+    """LRU cache of search results looked up by nearest query embedding"""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_distance: float = DEFAULT_MAX_DISTANCE):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self._queries: Optional[np.ndarray] = None  # (max_entries, dim) unit query embeddings
+        self._keys: List[Optional[Hashable]] = [None] * max_entries  # search options per slot
+        self._results: List[Optional[List[Dict]]] = [None] * max_entries
+        self._last_used = np.zeros(max_entries, dtype=np.int64)  # 0 = empty slot
+        self._clock = 0
+        self._generation = None
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def _check_generation(self, generation: int):
+        """Drop every entry once the knowledge base has changed"""
+        if generation != self._generation:
+            if self._generation is not None and self._last_used.any():
+                self._counters["invalidations"] += 1
+            self._last_used[:] = 0
+            self._results = [None] * self.max_entries
+            self._keys = [None] * self.max_entries
+            self._generation = generation
+
+    def get(self, embedding: Sequence[float], key: Hashable, generation: int) -> Optional[List[Dict]]:
+        """Cached results for a query within max_distance of this one, or None"""
+        q = normalize_rows(embedding)[0]
+        with self._lock:
+            self._check_generation(generation)
+            if self._queries is None or not q.any() or q.shape[0] != self._queries.shape[1]:
+                self._counters["misses"] += 1
+                return None
+
+            # One matrix-vector product against every cached query
+            similarities = self._queries @ q
+            similarities[self._last_used == 0] = -np.inf
+            for slot in np.argsort(-similarities):
+                if similarities[slot] < 1.0 - self.max_distance:
+                    break
+                if self._keys[slot] == key:
+                    self._clock += 1
+                    self._last_used[slot] = self._clock
+                    self._counters["hits"] += 1
+                    return [dict(result) for result in self._results[slot]]
+            self._counters["misses"] += 1
+            return None
+
+    def put(self, embedding: Sequence[float], key: Hashable, generation: int, results: List[Dict]):
+        """Remember results, evicting the least recently used entry when full"""
+        q = normalize_rows(embedding)[0]
+        if not q.any():
+            return  # a failed (zero) embedding says nothing about the query
+        with self._lock:
+            self._check_generation(generation)
+            if self._queries is None or self._queries.shape[1] != q.shape[0]:
+                self._queries = np.zeros((self.max_entries, q.shape[0]), dtype=np.float32)
+                self._last_used[:] = 0
+            slot = int(np.argmin(self._last_used))
+            self._clock += 1
+            self._queries[slot] = q
+            self._keys[slot] = key
+            self._results[slot] = [dict(result) for result in results]
+            self._last_used[slot] = self._clock
+
+    def clear(self):
+        with self._lock:
+            self._last_used[:] = 0
+            self._results = [None] * self.max_entries
+            self._keys = [None] * self.max_entries
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            return dict(self._counters, entries=int(np.count_nonzero(self._last_used)))
@@ -0,0 +1,780 @@
+"""
+Append-only segmented knowledge base for the Indiana Oracle RAG system
+
+A knowledge base directory holds a manifest plus immutable segment directories
+(each one a memory-mapped store from rag_store with its BM25 index and optional
+IVF index, quantized matrix and reduced-dimension matrix). New documents collect in an in-memory segment
+and are flushed as a new small segment, so adding a document costs work
+proportional to that document.
+Deletes are tombstones in the manifest; a compactor merges segments and drops
+dead documents in the background.
+
+Rows are stored grouped by category, so a category-filtered search scans a few
+contiguous slices of a segment instead of the whole matrix.
+
+With near-duplicate detection on (a dedup_threshold), segments being built
+(the in-memory segment and a compaction's output) drop near-duplicate chunks:
+a chunk whose MinHash signature matches a live row of the same category is not
+stored again, and that row lists the document among its sources instead.
+Duplicates across segments collapse at the next compaction, which reads the
+signatures saved with each segment instead of hashing every row again.
+
+The manifest records which embedding provider produced the vectors (provider,
+model, dim, version); opening a knowledge base with a different one fails
+instead of mixing vector spaces.
+
+Tombstones carry the segment sequence number current at deletion time: a copy
+of a document in a segment with seq <= the tombstone is dead, while a copy
+written afterwards (an update) survives.
+"""
+
+import os
+import json
+import time
+import uuid
+import shutil
+import logging
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Collection, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+import numpy as np
+
+from rag_vector_index import VectorIndex, normalize_rows, top_k_indices
+from rag_store import ChunkTable, DocumentChunks, StoreWriter, is_store, load_store
+from rag_bm25 import BM25_DIR, BM25_FILE, BM25Index, save_merged
+from rag_ann import ANN_FILE, IVFIndex
+from rag_quantize import QUANTIZED_FILE, QuantizedMatrix
+from rag_reduce import REDUCED_FILE, ReducedMatrix
+from rag_dedup import NUM_PERMUTATIONS, SIGNATURES_FILE, MinHasher, NearDuplicateIndex
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = ".lock"
+DOC_ID_BLOCK = 1024  # doc ids reserved from the manifest per writer round trip
+# Knowledge bases written before the manifest recorded their embeddings used this model
+UNVERSIONED_EMBEDDING = {"provider": "openai", "model": "text-embedding-3-small", "dim": 1536, "version": 1}
+
+
+class Segment:
+    """Documents, chunk table, vectors and lexical postings for one batch of documents"""
+
+    def __init__(self, seq: int, documents: Dict[int, Dict], chunks: ChunkTable, index: VectorIndex,
+                 lexical: BM25Index, ann: Optional[IVFIndex] = None, path: Optional[Path] = None,
+                 quantized: Optional[QuantizedMatrix] = None, provenance: Optional[Dict[int, List[int]]] = None,
+                 reduced: Optional[ReducedMatrix] = None):
+        self.seq = seq
+        self.documents = documents  # doc id -> metadata incl. first_chunk / chunk_count
+        self.chunks = chunks
+        self.index = index
+        self.lexical = lexical
+        self.ann = ann
+        self.quantized = quantized  # compact in-RAM copy of index.vectors for first-pass scoring
+        self.reduced = reduced  # low-dimensional in-RAM copy of index.vectors for first-pass scoring
+        self.path = path
+        self.provenance = provenance or {}  # row -> other doc ids whose near-duplicate chunk it stands for
+        self.dedup: Optional[NearDuplicateIndex] = None  # set while the segment is being built
+        self.signatures: Optional[np.ndarray] = None  # saved MinHash signature per row (written while dedup is on)
+        self.dead_docs: Set[int] = set()
+        self.retired_rows: Set[int] = set()  # rows of an earlier version of a re-added document
+        self._dead_mask: Optional[Tuple[Set[int], np.ndarray]] = None
+        self._category_ranges: Optional[Dict[str, List[Tuple[int, int]]]] = None
+        self._snapshot: Optional["Segment"] = None
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @property
+    def name(self) -> str:
+        return self.path.name if self.path else "memtable"
+
+    @classmethod
+    def empty(cls, dedup_threshold: Optional[float] = None) -> "Segment":
+        segment = cls(-1, {}, ChunkTable(), VectorIndex(), BM25Index())
+        if dedup_threshold is not None:
+            segment.dedup = NearDuplicateIndex(dedup_threshold)
+        return segment
+
+    @classmethod
+    def load(cls, path: Path, seq: int) -> "Segment":
+        """Map a segment directory written by save()"""
+        documents, chunks, index, metadata = load_store(str(path))
+        provenance = {int(row): sources for row, sources in metadata.get("provenance", {}).items()}
+
+        if (path / BM25_DIR).is_dir():
+            lexical = BM25Index.load(str(path / BM25_DIR))
+        elif (path / BM25_FILE).exists():
+            lexical = BM25Index.load(str(path / BM25_FILE))
+        else:
+            lexical = BM25Index()
+            lexical.add(chunks.text(row) for row in range(len(chunks)))
+
+        ann = None
+        if (path / ANN_FILE).exists():
+            ann = IVFIndex.load(str(path / ANN_FILE))
+            if ann.indexed_rows > len(index):
+                logger.warning(f"Ignoring stale ANN index in {path}")
+                ann = None
+
+        quantized = None
+        if (path / QUANTIZED_FILE).exists():
+            quantized = QuantizedMatrix.load(str(path / QUANTIZED_FILE))
+            if quantized.indexed_rows > len(index):
+                logger.warning(f"Ignoring stale quantized matrix in {path}")
+                quantized = None
+
+        reduced = None
+        if (path / REDUCED_FILE).exists():
+            reduced = ReducedMatrix.load(str(path / REDUCED_FILE))
+            if reduced.indexed_rows > len(index):
+                logger.warning(f"Ignoring stale reduced matrix in {path}")
+                reduced = None
+
+        segment = cls(seq, {doc["id"]: doc for doc in documents}, chunks, index, lexical, ann, path,
+                      quantized, provenance, reduced)
+        if (path / SIGNATURES_FILE).exists():
+            segment.signatures = np.load(path / SIGNATURES_FILE, mmap_mode="r", allow_pickle=False)
+            if segment.signatures.shape[0] != len(index):
+                logger.warning(f"Ignoring stale signatures in {path}")
+                segment.signatures = None
+        return segment
+
+    def add_document(self, doc: Dict, chunks: Sequence[str], embeddings) -> List[int]:
+        """Append a document (in-memory segment only); returns the row holding each chunk
+
+        While near-duplicate detection is on, a chunk matching a live row of the
+        same category is not stored: the row it matched records the document as
+        another source.
+        
+        Re-adding a document that is already here (an update before flush)
+        retires the rows of its earlier version.
+        """
+        doc_id = doc["id"]
+        if doc_id in self.documents:
+            self._retire(doc_id)
+        first_chunk = len(self.chunks)
+        rows = list(range(first_chunk, first_chunk + len(chunks)))
+        if self.dedup is not None:
+            keep, rows = self._collapse_duplicates(doc, chunks)
+            if len(keep) < len(chunks):
+                if isinstance(chunks, DocumentChunks):
+                    chunks = DocumentChunks(chunks.data, [chunks.spans[i] for i in keep])
+                else:
+                    chunks = [chunks[i] for i in keep]
+                embeddings = [embeddings[i] for i in keep]
+
+        self.documents[doc_id] = dict(doc, first_chunk=first_chunk, chunk_count=len(chunks))
+        self.chunks.append_document(doc_id, chunks)
+        self.index.add(embeddings)
+        self.lexical.add(chunks)
+        self._dead_mask = None
+        self._category_ranges = None
+        self._snapshot = None
+        return rows
+
+    def _collapse_duplicates(self, doc: Dict, chunks: Sequence[str]) -> Tuple[List[int], List[int]]:
+        """(indexes of chunks to store, row each chunk will live in) for a new document"""
+        category = doc.get("category") or "general"
+        next_row = len(self.chunks)
+
+        def shareable(row: int) -> bool:
+            if row >= len(self.chunks):
+                return True  # an earlier chunk of this same document
+            return self.is_live_row(row) and \
+                (self.documents[self.chunks.doc_id(row)].get("category") or "general") == category
+
+        keep: List[int] = []
+        rows: List[int] = []
+        for i in range(len(chunks)):
+            signature = self.dedup.hasher.signature(chunks[i])
+            row = self.dedup.find(signature, shareable)
+            if row is None:
+                row = next_row + len(keep)
+                keep.append(i)
+                self.dedup.add(row, signature)
+            elif row < len(self.chunks):
+                self.add_source(row, doc["id"])
+            rows.append(row)
+        return keep, rows
+
+    def _retire(self, doc_id: int):
+        """Detach an earlier version of a document from its rows and from the chunks it shared"""
+        self.retired_rows.update(self.doc_rows(doc_id))
+        for sources in self.provenance.values():
+            if doc_id in sources:
+                sources.remove(doc_id)
+        self.dead_docs.discard(doc_id)
+        self._dead_mask = None
+    
+    def add_source(self, row: int, doc_id: int):
+        """Record that a document also contains the chunk in a row"""
+        sources = self.provenance.setdefault(row, [])
+        if doc_id != self.chunks.doc_id(row) and doc_id not in sources:
+            sources.append(doc_id)
+            self._dead_mask = None
+            self._snapshot = None
+
+    def signature(self, row: int, hasher: MinHasher) -> np.ndarray:
+        """MinHash signature of a row: the saved one when it came from the same hasher, else computed"""
+        if self.signatures is not None and self.signatures.shape[1] == hasher.a.shape[0]:
+            return np.asarray(self.signatures[row])
+        return hasher.signature(self.chunks.text(row))
+
+    def owner_is_live(self, row: int) -> bool:
+        """Whether the document that stored a row still holds it"""
+        return self.chunks.doc_id(row) not in self.dead_docs and row not in self.retired_rows
+
+    def is_live_row(self, row: int) -> bool:
+        """Whether any document holding a row is still live"""
+        return self.owner_is_live(row) or \
+            any(doc_id not in self.dead_docs for doc_id in self.provenance.get(row, ()))
+
+    def sources(self, row: int) -> List[Dict]:
+        """Live documents containing a row's chunk, its owner first"""
+        doc_ids = ([self.chunks.doc_id(row)] if row not in self.retired_rows else []) + self.provenance.get(row, [])
+        return [self.documents[doc_id] for doc_id in doc_ids
+                if doc_id not in self.dead_docs and doc_id in self.documents]
+
+    def doc_rows(self, doc_id: int) -> range:
+        """Chunk rows of a document in this segment"""
+        doc = self.documents.get(doc_id)
+        if doc is None:
+            return range(0)
+        return range(doc["first_chunk"], doc["first_chunk"] + doc["chunk_count"])
+
+    def mark_dead(self, doc_ids):
+        """Hide documents from search without touching the segment files"""
+        doc_ids = set(doc_ids).intersection(self.documents) - self.dead_docs
+        if doc_ids:
+            # A new set, so a search iterating the old one is not disturbed
+            self.dead_docs = self.dead_docs | doc_ids
+            self._dead_mask = None
+            self._snapshot = None
+
+    def snapshot(self) -> "Segment":
+        """Frozen copy of a segment being built, searchable while documents keep arriving
+
+        Take it under the store lock. Vectors and postings are shared, not
+        copied: the copy just stops at the rows present when it was taken.
+        """
+        if self._snapshot is None:
+            snapshot = Segment(self.seq, dict(self.documents), self.chunks.snapshot(),
+                               VectorIndex.from_matrix(self.index.vectors, normalized=True), self.lexical.snapshot(),
+                               self.ann, self.path, self.quantized,
+                               {row: list(sources) for row, sources in self.provenance.items()}, self.reduced)
+            snapshot.dead_docs = set(self.dead_docs)
+            snapshot.retired_rows = set(self.retired_rows)
+            self._snapshot = snapshot
+        return self._snapshot
+
+    @property
+    def dead_mask(self) -> Optional[np.ndarray]:
+        """Boolean row mask of deleted chunks (None when every row is live)"""
+        dead_docs = self.dead_docs  # mark_dead() swaps in a new set rather than growing this one
+        if not dead_docs and not self.retired_rows:
+            return None
+        cached = self._dead_mask
+        # Keyed by the set it was built from, so a search racing mark_dead() cannot cache a stale mask
+        if cached is not None and cached[0] is dead_docs and cached[1].shape[0] == len(self):
+            return cached[1]
+        mask = np.zeros(len(self), dtype=bool)
+        for doc_id in dead_docs:
+            rows = self.doc_rows(doc_id)
+            mask[rows.start:rows.stop] = True
+        mask[list(self.retired_rows)] = True
+        # A shared chunk stays searchable while another of its documents is live
+        for row, sources in self.provenance.items():
+            if mask[row] and any(doc_id not in dead_docs for doc_id in sources):
+                mask[row] = False
+        self._dead_mask = (dead_docs, mask)
+        return mask
+
+    def category_ranges(self) -> Dict[str, List[Tuple[int, int]]]:
+        """(start, stop) chunk row spans per category, adjacent documents coalesced"""
+        if self._category_ranges is None:
+            ranges: Dict[str, List[Tuple[int, int]]] = {}
+            for doc in sorted(self.documents.values(), key=lambda doc: doc["first_chunk"]):
+                if not doc["chunk_count"]:
+                    continue
+                start, stop = doc["first_chunk"], doc["first_chunk"] + doc["chunk_count"]
+                spans = ranges.setdefault(doc.get("category") or "general", [])
+                if spans and spans[-1][1] == start:
+                    spans[-1] = (spans[-1][0], stop)
+                else:
+                    spans.append((start, stop))
+            self._category_ranges = ranges
+        return self._category_ranges
+
+    def partition_ranges(self, categories: Collection[str]) -> List[Tuple[int, int]]:
+        """Row spans holding the given categories, in row order"""
+        ranges = self.category_ranges()
+        return sorted(span for category in categories for span in ranges.get(category, []))
+
+    def excluded_rows(self, categories: Optional[Collection[str]] = None) -> Optional[np.ndarray]:
+        """Row mask of deleted chunks plus, when filtering, chunks outside the categories"""
+        if categories is None:
+            return self.dead_mask
+        mask = np.ones(len(self), dtype=bool)
+        for start, stop in self.partition_ranges(categories):
+            mask[start:stop] = False
+        if self.dead_mask is not None:
+            mask |= self.dead_mask
+        return mask
+
+    def live_documents(self) -> Iterator[Dict]:
+        for doc_id, doc in self.documents.items():
+            if doc_id not in self.dead_docs:
+                yield doc
+
+    def live_rows(self) -> Iterator[Tuple[Dict, List[int]]]:
+        """Each live document with the rows it keeps, grouped by category
+
+        Shared rows of a deleted document pass to their first live source.
+        """
+        adopted: Dict[int, List[int]] = {}
+        for row, sources in sorted(self.provenance.items()):
+            if not self.owner_is_live(row):
+                heir = next((doc_id for doc_id in sources if doc_id not in self.dead_docs), None)
+                if heir is not None:
+                    adopted.setdefault(heir, []).append(row)
+
+        documents = sorted(self.live_documents(), key=lambda doc: (doc.get("category") or "general", doc["first_chunk"]))
+        for doc in documents:
+            yield doc, list(self.doc_rows(doc["id"])) + adopted.get(doc["id"], [])
+
+    def live_sources(self, row: int, owner: int) -> List[int]:
+        """Live documents besides owner that a row stands for"""
+        return [doc_id for doc_id in self.provenance.get(row, ())
+                if doc_id != owner and doc_id not in self.dead_docs]
+
+    def dense_search(self, query_embedding, top_k: int, nprobe: Optional[int] = None,
+                     categories: Optional[Collection[str]] = None) -> List[Tuple[int, float]]:
+        """(row, cosine similarity) pairs from the ANN index, the reduced or quantized matrix or an exact scan"""
+        if len(self) == 0:
+            return []
+        if categories is not None:
+            return self._partition_search(query_embedding, top_k, categories)
+        if self.ann is not None:
+            return self.ann.search(self.index.vectors, query_embedding, top_k, nprobe, self.dead_mask)
+        if self.reduced is not None:
+            return self.reduced.search(self.index.vectors, query_embedding, top_k, self.dead_mask)
+        if self.quantized is not None:
+            return self.quantized.search(self.index.vectors, query_embedding, top_k, self.dead_mask)
+        # Score every chunk with one matrix-vector product
+        return self.index.search(query_embedding, top_k, self.dead_mask)
+
+    def _partition_search(self, query_embedding, top_k: int, categories: Collection[str]) -> List[Tuple[int, float]]:
+        """Exact scan of just the row slices holding the categories"""
+        ranges = self.partition_ranges(categories)
+        if not ranges:
+            return []
+        q = normalize_rows(query_embedding)[0]
+        rows = np.concatenate([np.arange(start, stop) for start, stop in ranges])
+        scores = np.concatenate([self.index.vectors[start:stop] @ q for start, stop in ranges])
+        if self.dead_mask is not None:
+            scores[self.dead_mask[rows]] = -np.inf
+        return [(int(rows[i]), float(scores[i])) for i in top_k_indices(scores, top_k) if scores[i] > -np.inf]
+
+    def lexical_search(self, query: str, top_k: int,
+                       categories: Optional[Collection[str]] = None) -> List[Tuple[int, float]]:
+        """(row, BM25 score) pairs"""
+        return self.lexical.search(query, top_k, self.excluded_rows(categories))
+
+    def save(self, path: Path):
+        """Write the live rows as an immutable segment directory, grouped by category"""
+        plan: List[Tuple["Segment", Dict, List[int]]] = []
+        provenance: Dict[int, List[int]] = {}
+        rows: List[int] = []
+        for doc, doc_rows in self.live_rows():
+            plan.append((self, doc, doc_rows))
+            for row in doc_rows:
+                sources = self.live_sources(row, doc["id"])
+                if sources:
+                    provenance[len(rows)] = sources
+                rows.append(row)
+        # Signatures computed while deduplicating are saved for compaction to reuse
+        signature = (lambda new_row: self.dedup.signature(rows[new_row])) if self.dedup is not None else None
+        write_segment(path, plan, provenance, signature)
+
+
+def write_segment(path: Path, plan: Sequence[Tuple[Segment, Dict, List[int]]], provenance: Dict[int, List[int]],
+                  signature: Optional[Callable[[int], np.ndarray]] = None):
+    """Stream the planned rows of existing segments into a new segment directory
+
+    plan lists (source segment, document, its rows there) in output order.
+    Text and vectors are copied document by document from the sources into
+    mapped output files, and the sources' BM25 postings are renumbered into
+    the new rows instead of tokenizing the text again. With a signature
+    function (output row -> MinHash signature) the signatures are saved too.
+    """
+    n_rows = sum(len(rows) for _, _, rows in plan)
+    dim = next((segment.index.dim for segment, _, _ in plan if segment.index.dim), 0)
+    row_maps: Dict[int, Tuple[Segment, np.ndarray]] = {}  # source -> new row of each of its rows (-1: dropped)
+    writer = StoreWriter(str(path), n_rows, dim)
+    signatures = writer.add_array(SIGNATURES_FILE, np.uint32, (n_rows, NUM_PERMUTATIONS)) \
+        if signature is not None else None
+    for segment, doc, rows in plan:
+        _, row_map = row_maps.setdefault(id(segment), (segment, np.full(len(segment), -1, dtype=np.int64)))
+        rows = np.asarray(rows, dtype=np.int64)
+        row_map[rows] = np.arange(writer.row_count, writer.row_count + rows.shape[0])
+        if signatures is not None:
+            for new_row in range(writer.row_count, writer.row_count + rows.shape[0]):
+                signatures[new_row] = signature(new_row)
+        writer.add_document({key: value for key, value in doc.items() if key not in ("first_chunk", "chunk_count")},
+                            segment.chunks.document_chunks(rows.tolist()), segment.index.vectors[rows])
+    writer.commit({"provenance": {str(row): sources for row, sources in provenance.items()}} if provenance else None)
+    save_merged(str(path / BM25_DIR), [(segment.lexical, row_map) for segment, row_map in row_maps.values()], n_rows)
+
+
+def merge_segments(segments: List["Segment"], path: Path, seq: int,
+                   dedup_threshold: Optional[float] = None) -> "Segment":
+    """Write the live documents of several segments as one new segment
+
+    Rows stream from the mapped inputs to the output (see write_segment), so
+    the merged corpus is never assembled in memory.
+    """
+    build_ann = any(segment.ann is not None for segment in segments)
+    nprobe = max((segment.ann.nprobe for segment in segments if segment.ann is not None), default=8)
+    quantized = next((segment.quantized for segment in segments if segment.quantized is not None), None)
+    reduced = next((segment.reduced for segment in segments if segment.reduced is not None), None)
+    dedup = NearDuplicateIndex(dedup_threshold) if dedup_threshold is not None else None
+
+    # Oldest first within each category, so every category stays one contiguous span
+    live = [(doc.get("category") or "general", position, doc["first_chunk"], segment, doc, rows)
+            for position, segment in enumerate(segments) for doc, rows in segment.live_rows()]
+    plan: List[Tuple[Segment, Dict, List[int]]] = []
+    provenance: Dict[int, List[int]] = {}
+    owners: List[int] = []  # document storing each output row
+    category, category_start = None, 0
+    for doc_category, _, _, segment, doc, rows in sorted(live, key=lambda item: item[:3]):
+        if doc_category != category:
+            category, category_start = doc_category, len(owners)
+        kept: List[int] = []
+        for row in rows:
+            sources = [doc["id"]] + segment.live_sources(row, doc["id"])
+            merged_row = None
+            if dedup is not None:
+                # A near-duplicate of an output row of the same category collapses into it
+                signature = segment.signature(row, dedup.hasher)
+                merged_row = dedup.find(signature, lambda other: other >= category_start)
+                if merged_row is None:
+                    dedup.add(len(owners), signature)
+            if merged_row is None:
+                merged_row = len(owners)
+                owners.append(doc["id"])
+                kept.append(row)
+            for source in sources:
+                if source != owners[merged_row] and source not in provenance.get(merged_row, ()):
+                    provenance.setdefault(merged_row, []).append(source)
+        plan.append((segment, doc, kept))
+
+    write_segment(path, plan, provenance, dedup.signature if dedup is not None else None)
+    merged = Segment.load(path, seq)
+    if build_ann and len(merged):
+        IVFIndex.build(merged.index.vectors, nprobe=nprobe).save(str(path / ANN_FILE))
+    if quantized is not None and len(merged):
+        QuantizedMatrix.build(merged.index.vectors, quantized.mode, quantized.rescore).save(str(path / QUANTIZED_FILE))
+    if reduced is not None and len(merged):
+        ReducedMatrix.build(merged.index.vectors, reduced.dim, reduced.method, reduced.rescore).save(
+            str(path / REDUCED_FILE))
+    return Segment.load(path, seq)
+
+
+def describe_embedding(identity: Dict) -> str:
+    return f"{identity['provider']}:{identity['model']} (dim {identity['dim']}, v{identity['version']})"
+
+
+class SegmentedStore:
+    """Manifest-managed set of immutable segments plus an in-memory segment for new documents"""
+
+    def __init__(self, path: str, dedup_threshold: Optional[float] = None,
+                 embedding: Optional[Dict] = None):
+        self.path = Path(path)
+        self.embedding = embedding  # provider identity the vectors must match (None: not checked)
+        self.dedup_threshold = dedup_threshold  # MinHash Jaccard for collapsing chunks; None disables
+        self.segments: List[Segment] = []
+        self.memtable = Segment.empty(dedup_threshold)
+        self.tombstones: Dict[int, int] = {}  # doc id -> seq of the newest segment it is dead in
+        self.generation = 0  # bumped whenever search results may change
+        self._lock = threading.RLock()
+        self._doc_ids = iter(())
+        self._compactor: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    # Manifest handling
+
+    @contextmanager
+    def _manifest_lock(self):
+        """Serialise manifest read-modify-write across threads and processes"""
+        with self._lock:
+            self.path.mkdir(parents=True, exist_ok=True)
+            with open(self.path / LOCK_FILE, "a") as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_manifest(self) -> Dict:
+        manifest_path = self.path / MANIFEST_FILE
+        if not manifest_path.exists():
+            return {"segments": [], "next_seq": 0, "next_doc_id": 0, "tombstones": {}}
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        self._check_embedding(manifest)
+        return manifest
+
+    def _check_embedding(self, manifest: Dict):
+        """Refuse a knowledge base whose vectors came from another embedding provider"""
+        recorded = manifest.get("embedding") or (UNVERSIONED_EMBEDDING if manifest["segments"] else None)
+        if self.embedding is not None and recorded is not None and recorded != self.embedding:
+            raise ValueError(f"Knowledge base {self.path} holds {describe_embedding(recorded)} vectors, "
+                             f"not {describe_embedding(self.embedding)}; use a separate path per provider")
+
+    def _write_manifest(self, manifest: Dict):
+        if self.embedding is not None and not manifest.get("embedding"):
+            manifest["embedding"] = self.embedding
+        tmp_path = self.path / (MANIFEST_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path / MANIFEST_FILE)
+
+    def _sync(self, manifest: Dict):
+        """Bring the open segments and tombstones in line with a manifest"""
+        tombstones = {int(doc_id): seq for doc_id, seq in manifest.get("tombstones", {}).items()}
+        if tombstones != self.tombstones or [entry["name"] for entry in manifest["segments"]] != \
+                [segment.name for segment in self.segments]:
+            self.mark_changed()
+        self.tombstones = tombstones
+        open_segments = {segment.name: segment for segment in self.segments}
+        segments = []
+        for entry in manifest["segments"]:
+            segment = open_segments.get(entry["name"]) or Segment.load(self.path / entry["name"], entry["seq"])
+            segments.append(segment)
+        for segment in segments:
+            self._apply_tombstones(segment)
+        self.segments = segments
+
+    def mark_changed(self):
+        """Record that searches may now return different results"""
+        self.generation += 1
+
+    def _apply_tombstones(self, segment: Segment):
+        segment.mark_dead(doc_id for doc_id, seq in self.tombstones.items() if segment.seq <= seq)
+
+    def _migrate_single_store(self):
+        """Move a pre-segment store (rag_store layout at the top level) into a first segment"""
+        segment_name = "seg-000000"
+        (self.path / segment_name).mkdir()
+        for entry in os.listdir(self.path):
+            if entry not in (segment_name, LOCK_FILE):
+                shutil.move(str(self.path / entry), str(self.path / segment_name / entry))
+        with open(self.path / segment_name / "metadata.json", "r", encoding="utf-8") as f:
+            doc_ids = [doc["id"] for doc in json.load(f)["documents"]]
+        self._write_manifest({
+            "segments": [{"name": segment_name, "seq": 0}],
+            "next_seq": 1,
+            "next_doc_id": max(doc_ids, default=-1) + 1,
+            "tombstones": {},
+            "embedding": UNVERSIONED_EMBEDDING
+        })
+        logger.info(f"Migrated single-file store {self.path} to a segmented knowledge base")
+
+    def open(self) -> bool:
+        """Load the manifest and map every segment; False if there is no knowledge base yet"""
+        if not (self.path / MANIFEST_FILE).exists():
+            if not is_store(str(self.path)):
+                return False
+            with self._manifest_lock():
+                self._migrate_single_store()
+
+        with self._manifest_lock():
+            self._sync(self._read_manifest())
+        return True
+
+    def refresh(self):
+        """Pick up segments written by other processes"""
+        with self._manifest_lock():
+            self._sync(self._read_manifest())
+
+    # Reads
+
+    def all_segments(self) -> List[Segment]:
+        """Snapshot of the segments searches fan out across (flushed first, then in-memory)
+
+        The in-memory segment comes as a frozen copy, so searching it needs no
+        lock while add() keeps appending to the original.
+        """
+        with self._lock:
+            return self.segments + [self.memtable.snapshot()]
+
+    def chunk_count(self) -> int:
+        return sum(len(segment) - int(segment.dead_mask.sum() if segment.dead_mask is not None else 0)
+                   for segment in self.all_segments())
+
+    def document_count(self) -> int:
+        return sum(len(segment.documents) - len(segment.dead_docs) for segment in self.all_segments())
+
+    def get_document(self, doc_id: int) -> Optional[Dict]:
+        """Live metadata for a document id"""
+        for segment in reversed(self.all_segments()):
+            if doc_id in segment.documents and doc_id not in segment.dead_docs:
+                return segment.documents[doc_id]
+        return None
+
+    # Writes
+
+    def allocate_doc_id(self) -> int:
+        """Unique document id, reserved from the manifest in blocks so concurrent writers never collide"""
+        with self._lock:
+            doc_id = next(self._doc_ids, None)
+            if doc_id is None:
+                with self._manifest_lock():
+                    manifest = self._read_manifest()
+                    start = manifest["next_doc_id"]
+                    manifest["next_doc_id"] = start + DOC_ID_BLOCK
+                    self._write_manifest(manifest)
+                self._doc_ids = iter(range(start, start + DOC_ID_BLOCK))
+                doc_id = next(self._doc_ids)
+            return doc_id
+
+    def add(self, doc: Dict, chunks: Sequence[str], embeddings) -> int:
+        """Stage a document in the in-memory segment until the next flush
+
+        Returns how many of its chunks collapsed into near-duplicates already staged.
+        """
+        with self._lock:
+            rows = self.memtable.add_document(doc, chunks, embeddings)
+            self.mark_changed()
+            return len(rows) - self.memtable.documents[doc["id"]]["chunk_count"]
+
+    def delete(self, doc_id: int) -> bool:
+        """Delete a document by id; False if it does not exist"""
+        with self._manifest_lock():
+            manifest = self._read_manifest()
+            self._sync(manifest)
+            found = self.get_document(doc_id) is not None
+            if found:
+                self.mark_changed()
+
+            self.memtable.mark_dead([doc_id])
+            flushed = [segment for segment in self.segments if doc_id in segment.documents]
+            if flushed:
+                manifest["tombstones"][str(doc_id)] = max(segment["seq"] for segment in manifest["segments"])
+                self._write_manifest(manifest)
+                self._sync(manifest)
+        return found
+
+    def flush(self) -> Optional[Segment]:
+        """Write the in-memory segment as a new immutable segment"""
+        with self._lock:
+            memtable = self.memtable
+            if not memtable.documents or len(memtable.dead_docs) == len(memtable.documents):
+                self.memtable = Segment.empty(self.dedup_threshold)
+                return None
+
+            with self._manifest_lock():
+                manifest = self._read_manifest()
+                seq = manifest["next_seq"]
+                name = f"seg-{seq:06d}"
+                memtable.save(self.path / name)
+                self._compress_like_existing(self.path / name)
+
+                manifest["segments"].append({"name": name, "seq": seq})
+                manifest["next_seq"] = seq + 1
+                self._write_manifest(manifest)
+                self.memtable = Segment.empty(self.dedup_threshold)
+                self._sync(manifest)
+
+        logger.info(f"Flushed {len(memtable.documents)} documents to segment {name}")
+        return self.segments[-1]
+
+    def _compress_like_existing(self, path: Path):
+        """Give a new segment the same quantized and reduced first-pass matrices as the existing ones"""
+        quantized = next((segment.quantized for segment in self.segments if segment.quantized is not None), None)
+        reduced = next((segment.reduced for segment in self.segments if segment.reduced is not None), None)
+        if quantized is None and reduced is None:
+            return
+        _, _, index, _ = load_store(str(path))
+        if not len(index):
+            return
+        if quantized is not None:
+            QuantizedMatrix.build(index.vectors, quantized.mode, quantized.rescore).save(str(path / QUANTIZED_FILE))
+        if reduced is not None:
+            ReducedMatrix.build(index.vectors, reduced.dim, reduced.method, reduced.rescore).save(
+                str(path / REDUCED_FILE))
+
+    def compact(self, min_segments: int = 2) -> Optional[Segment]:
+        """Merge every flushed segment into one, dropping deleted documents"""
+        with self._lock:
+            inputs = list(self.segments)
+        if len(inputs) < min_segments and not any(segment.dead_docs for segment in inputs):
+            return None
+
+        start = time.perf_counter()
+        seq = max(segment.seq for segment in inputs)
+        name = f"seg-{seq:06d}-{uuid.uuid4().hex[:8]}"
+        input_tombstones = dict(self.tombstones)
+
+        # The merge reads immutable segments, so searches keep running meanwhile
+        merged = merge_segments(inputs, self.path / name, seq, self.dedup_threshold)
+
+        with self._manifest_lock():
+            manifest = self._read_manifest()
+            input_names = {segment.name for segment in inputs}
+            if not input_names.issubset(entry["name"] for entry in manifest["segments"]):
+                logger.warning("Segments changed during compaction; discarding merged segment")
+                shutil.rmtree(self.path / name, ignore_errors=True)
+                return None
+
+            remaining = [entry for entry in manifest["segments"] if entry["name"] not in input_names]
+            manifest["segments"] = [{"name": name, "seq": seq}] + remaining
+
+            # Tombstones fully applied by this merge are no longer needed
+            for doc_id, tomb_seq in input_tombstones.items():
+                if manifest["tombstones"].get(str(doc_id)) == tomb_seq and not remaining:
+                    del manifest["tombstones"][str(doc_id)]
+
+            self._write_manifest(manifest)
+            self.segments = [merged] + [segment for segment in self.segments if segment.name not in input_names]
+            self._sync(manifest)
+
+        for segment in inputs:
+            shutil.rmtree(self.path / segment.name, ignore_errors=True)
+
+        logger.info(f"Compacted {len(inputs)} segments into {name} ({len(merged)} chunks) "
+                    f"in {time.perf_counter() - start:.1f}s")
+        return merged
+
+    def start_compactor(self, interval: float = 300.0, min_segments: int = 8):
+        """Compact in a background thread whenever min_segments segments accumulate"""
+        if self._compactor and self._compactor.is_alive():
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    if len(self.segments) >= min_segments or any(s.dead_docs for s in self.segments):
+                        self.compact(min_segments=1)
+                except Exception as e:
+                    logger.error(f"Background compaction failed: {e}")
+
+        self._compactor = threading.Thread(target=run, name="rag-compactor", daemon=True)
+        self._compactor.start()
+
+    def stop_compactor(self):
+        self._stop.set()
+        if self._compactor:
+            self._compactor.join()
+            self._compactor = None
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Sharded multi-process dense retrieval for the Indiana Oracle RAG system
+The rows of the flushed segments are split into one shard per worker process.
+Workers memory-map the segment vector files themselves, so the corpus is held
+once in the shared page cache: a query ships only the query vector and row
+spans to each worker and gets back that shard's partial top-k, which the
+caller merges. Scoring then uses every core instead of one.
+"""
+
+import os
+import math
+import time
+import logging
+import argparse
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Collection, List, Optional, Tuple
+import numpy as np
+
+from rag_store import VECTORS_FILE
+from rag_vector_index import normalize_rows, top_k_indices
+
+logger = logging.getLogger(__name__)
+
+MIN_SHARD_ROWS = 50_000  # smaller shards cost more in process round trips than they save
+MAPPED_SEGMENTS = 64  # vector files each worker keeps mapped
+
+Span = Tuple[str, int, int, np.ndarray]  # segment path, start row, stop row, dead rows inside
+
+# Per-process cache of mapped vector files (lives in each worker)
+_mapped: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+
+def _vectors(path: str) -> np.ndarray:
+    vectors = _mapped.pop(path, None)
+    if vectors is None:
+        vectors = np.load(Path(path) / VECTORS_FILE, mmap_mode="r", allow_pickle=False)
+    _mapped[path] = vectors
+    while len(_mapped) > MAPPED_SEGMENTS:
+        _mapped.popitem(last=False)
+    return vectors
+
+
+def score_shard(query: np.ndarray, spans: List[Span], top_k: int) -> List[Tuple[str, int, float]]:
+    """(segment path, row, cosine similarity) top-k of one shard"""
+    hits = []
+    for path, start, stop, dead in spans:
+        scores = _vectors(path)[start:stop] @ query
+        if len(dead):
+            scores[dead - start] = -np.inf
+        hits.extend((path, start + int(i), float(scores[i]))
+                    for i in top_k_indices(scores, top_k) if scores[i] > -np.inf)
+    return sorted(hits, key=lambda hit: hit[2], reverse=True)[:top_k]
+
+
+class ShardPool:
+    """Worker processes that score row shards of flushed segments"""
+
+    def __init__(self, workers: Optional[int] = None, min_shard_rows: int = MIN_SHARD_ROWS):
+        self.workers = workers or os.cpu_count() or 1
+        self.min_shard_rows = min_shard_rows
+        # spawn: the parent runs embedding and compaction threads, which fork would copy mid-flight
+        self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def plan(self, segments, categories: Optional[Collection[str]] = None) -> List[List[Span]]:
+        """Split the rows to scan into at most one shard per worker, of near-equal size"""
+        spans = []
+        for segment in segments:
+            ranges = segment.partition_ranges(categories) if categories is not None else [(0, len(segment))]
+            dead = segment.dead_mask
+            for start, stop in ranges:
+                if stop > start:
+                    spans.append((str(segment.path), start, stop, dead))
+        total = sum(stop - start for _, start, stop, _ in spans)
+        if not total:
+            return []
+
+        shard_rows = math.ceil(total / max(1, min(self.workers, total // self.min_shard_rows)))
+        shards: List[List[Span]] = [[]]
+        room = shard_rows
+        for path, start, stop, dead in spans:
+            while start < stop:
+                if not room:
+                    shards.append([])
+                    room = shard_rows
+                end = min(stop, start + room)
+                dead_rows = np.flatnonzero(dead[start:end]) + start if dead is not None else np.empty(0, np.int64)
+                shards[-1].append((path, start, end, dead_rows))
+                room -= end - start
+                start = end
+        return shards
+
+    def search(self, segments, query_embedding, top_k: int,
+               categories: Optional[Collection[str]] = None) -> List[Tuple[object, int, float]]:
+        """(segment, row, cosine similarity) best top_k across the shards"""
+        shards = self.plan(segments, categories)
+        if not shards:
+            return []
+        q = normalize_rows(query_embedding)[0]
+        if len(shards) == 1:
+            partials = [score_shard(q, shards[0], top_k)]  # not worth a round trip
+        else:
+            futures = [self._pool.submit(score_shard, q, shard, top_k) for shard in shards]
+            partials = [future.result() for future in futures]
+
+        by_path = {str(segment.path): segment for segment in segments}
+        hits = [(by_path[path], row, score) for partial in partials for path, row, score in partial]
+        return sorted(hits, key=lambda hit: hit[2], reverse=True)[:top_k]
+
+    def close(self):
+        self._pool.shutdown()
+
+
+def main():
+    """CLI: time dense queries over a knowledge base with 1..N worker processes"""
+    from rag_segments import SegmentedStore
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("store", nargs="?", default="indiana_knowledge_base")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+
+    store = SegmentedStore(args.store)
+    if not store.open():
+        parser.error(f"No knowledge base at {args.store}")
+    segments = [segment for segment in store.segments if len(segment)]
+    dim = segments[0].index.vectors.shape[1] if segments else parser.error("Knowledge base is empty")
+    queries = np.random.default_rng(0).standard_normal((args.queries, dim)).astype(np.float32)
+
+    counts = sorted({1, args.workers} | {2 ** i for i in range(1, args.workers.bit_length()) if 2 ** i < args.workers})
+    print(f"{'workers':>8} {'avg ms':>8} {'qps':>8}")
+    for workers in counts:
+        pool = ShardPool(workers, min_shard_rows=1)
+        pool.search(segments, queries[0], args.top_k)  # start the workers and map the files
+        start = time.perf_counter()
+        for query in queries:
+            pool.search(segments, query, args.top_k)
+        elapsed = time.perf_counter() - start
+        pool.close()
+        print(f"{workers:>8} {elapsed / len(queries) * 1000:>8.2f} {len(queries) / elapsed:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
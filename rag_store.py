@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+"""
+Memory-mapped knowledge-base store for the Indiana Oracle RAG system
+
+A store is a directory holding:
+  vectors.npy    float32 (n_chunks, dim), rows pre-normalized, opened with mmap
+  chunks.npy     int64 (n_chunks, 3): doc_id, text start, text end
+  text.bin       UTF-8 document text, each document once; chunks are (possibly
+                 overlapping) byte ranges of it given by chunks.npy
+  metadata.json  format version, dimension and per-document title/source/category
+
+Every file is opened read-only and mapped, so several server processes can
+share one corpus through the page cache with next to no startup cost.
+"""
+
+import os
+import sys
+import json
+import shutil
+import pickle
+import logging
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+
+from rag_vector_index import VectorIndex, normalize_rows
+
+logger = logging.getLogger(__name__)
+
+STORE_FORMAT_VERSION = 1
+VECTORS_FILE = "vectors.npy"
+CHUNKS_FILE = "chunks.npy"
+TEXT_FILE = "text.bin"
+METADATA_FILE = "metadata.json"
+
+
+class DocumentChunks(Sequence):
+    """A document's text held once, with its chunks as (start, end) byte ranges into it
+
+    Indexing decodes a single chunk on demand, so overlapping chunks never
+    cost a second copy of the text.
+    """
+
+    def __init__(self, data: bytes, spans: List[Tuple[int, int]]):
+        self.data = data
+        self.spans = spans
+
+    @classmethod
+    def from_text(cls, text: str, spans: List[Tuple[int, int]]) -> "DocumentChunks":
+        """Wrap text and character-offset spans (converted to UTF-8 byte offsets)"""
+        data = text.encode("utf-8")
+        if len(data) == len(text):
+            return cls(data, spans)
+
+        # Non-ASCII text: measure the encoded length between consecutive boundaries
+        byte_offset, position, offsets = 0, 0, {}
+        for boundary in sorted({offset for span in spans for offset in span}):
+            byte_offset += len(text[position:boundary].encode("utf-8"))
+            offsets[boundary] = byte_offset
+            position = boundary
+        return cls(data, [(offsets[start], offsets[end]) for start, end in spans])
+
+    def __len__(self) -> int:
+        return len(self.spans)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        start, end = self.spans[index]
+        return self.data[start:end].decode("utf-8")
+
+
+class ChunkTable:
+    """Row-aligned chunk metadata (owning document and text) for a VectorIndex"""
+
+    def __init__(self, rows: Optional[np.ndarray] = None, text: Optional[np.ndarray] = None):
+        # Mapped base rows from disk, followed by rows appended since loading
+        self._rows = rows if rows is not None else np.empty((0, 3), dtype=np.int64)
+        self._text = text if text is not None else np.empty(0, dtype=np.uint8)
+        self._buffers: List[bytes] = []  # one interned text per appended document
+        self._new_rows: List[Tuple[int, int, int, int]] = []  # doc_id, buffer, start, end
+
+    def __len__(self) -> int:
+        return self._rows.shape[0] + len(self._new_rows)
+
+    def __getitem__(self, row: int) -> Dict:
+        return {"doc_id": self.doc_id(row), "chunk": self.text(row)}
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+    def append(self, doc_id: int, chunk: str):
+        """Add a chunk row holding its own text"""
+        self.append_document(doc_id, DocumentChunks.from_text(chunk, [(0, len(chunk))]))
+
+    def append_document(self, doc_id: int, chunks: Sequence[str]):
+        """Add a document's chunk rows, interning its text once when given DocumentChunks"""
+        if not isinstance(chunks, DocumentChunks):
+            for chunk in chunks:
+                self.append(doc_id, chunk)
+            return
+        buffer = len(self._buffers)
+        self._buffers.append(chunks.data)
+        self._new_rows.extend((doc_id, buffer, start, end) for start, end in chunks.spans)
+
+    def snapshot(self) -> "ChunkTable":
+        """Copy that later appends do not reach (buffers and mapped rows are shared)"""
+        table = ChunkTable(self._rows, self._text)
+        table._buffers = list(self._buffers)
+        table._new_rows = list(self._new_rows)
+        return table
+
+    def _locate(self, row: int) -> Tuple[int, Optional[int], Sequence, int, int]:
+        """(doc_id, buffer id or None for mapped rows, buffer, start, end) of a row"""
+        base = self._rows.shape[0]
+        if row < base:
+            doc_id, start, end = self._rows[row].tolist()
+            return doc_id, None, self._text, start, end
+        doc_id, buffer, start, end = self._new_rows[row - base]
+        return doc_id, buffer, self._buffers[buffer], start, end
+
+    def spans(self) -> Iterator[Tuple[int, Optional[int], Sequence, int, int]]:
+        """_locate() for every row in order"""
+        for row in range(len(self)):
+            yield self._locate(row)
+
+    def doc_id(self, row: int) -> int:
+        """Document id owning a chunk row"""
+        return self._locate(row)[0]
+
+    def text(self, row: int) -> str:
+        """Decode the text of a chunk row"""
+        _, _, buffer, start, end = self._locate(row)
+        return bytes(buffer[start:end]).decode("utf-8")
+
+    def document_chunks(self, rows: Sequence[int]) -> DocumentChunks:
+        """Copy of the text behind rows of one document, as DocumentChunks
+
+        Runs of rows whose ranges overlap or touch in the same buffer (a
+        document's consecutive chunks) are copied once; anything else is laid
+        end to end.
+        """
+        runs: List[Tuple[Sequence, int, int, List[Tuple[int, int]]]] = []  # buffer, low, high, spans
+        for _, _, buffer, start, end in (self._locate(row) for row in rows):
+            if runs and runs[-1][0] is buffer and runs[-1][1] <= end and start <= runs[-1][2]:
+                _, low, high, spans = runs[-1]
+                spans.append((start, end))
+                runs[-1] = (buffer, min(low, start), max(high, end), spans)
+            else:
+                runs.append((buffer, start, end, [(start, end)]))
+
+        pieces, spans, offset = [], [], 0
+        for buffer, low, high, run_spans in runs:
+            pieces.append(bytes(buffer[low:high]))
+            spans.extend((offset + start - low, offset + end - low) for start, end in run_spans)
+            offset += high - low
+        return DocumentChunks(b"".join(pieces), spans)
+
+    def doc_ids(self) -> np.ndarray:
+        """Document id of every row as one array"""
+        new_doc_ids = np.asarray([row[0] for row in self._new_rows], dtype=np.int64)
+        return np.concatenate([self._rows[:, 0], new_doc_ids])
+
+
+def _write_store(path: Path, documents: List[Dict], chunks: ChunkTable, vectors: np.ndarray,
+                 extra_metadata: Optional[Dict] = None):
+    """Write the store files into path"""
+    path.mkdir(parents=True, exist_ok=True)
+
+    rows = np.empty((len(chunks), 3), dtype=np.int64)
+    offset = 0
+    written: Dict[int, int] = {}  # interned buffer -> its offset in text.bin
+    with open(path / TEXT_FILE, "wb") as f:
+        for row, (doc_id, buffer_id, buffer, start, end) in enumerate(chunks.spans()):
+            if buffer_id is None:
+                data = bytes(buffer[start:end])
+                f.write(data)
+                rows[row] = (doc_id, offset, offset + len(data))
+                offset += len(data)
+                continue
+            # Each document's text is written once; its chunks point into it
+            if buffer_id not in written:
+                f.write(buffer)
+                written[buffer_id] = offset
+                offset += len(buffer)
+            rows[row] = (doc_id, written[buffer_id] + start, written[buffer_id] + end)
+
+    np.save(path / CHUNKS_FILE, rows, allow_pickle=False)
+    np.save(path / VECTORS_FILE, np.ascontiguousarray(vectors, dtype=np.float32), allow_pickle=False)
+
+    # Record each document's chunk range so callers can walk a document without a scan
+    first_chunk: Dict[int, int] = {}
+    chunk_count: Dict[int, int] = {}
+    for row, doc_id in enumerate(rows[:, 0].tolist()):
+        first_chunk.setdefault(doc_id, row)
+        chunk_count[doc_id] = chunk_count.get(doc_id, 0) + 1
+
+    # Content and chunk copies are not duplicated into the sidecar
+    metadata = {
+        "format_version": STORE_FORMAT_VERSION,
+        "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+        "chunk_count": len(chunks),
+        "documents": [
+            {
+                **{key: doc.get(key) for key in ("id", "title", "source", "category")},
+                "first_chunk": first_chunk.get(doc["id"], 0),
+                "chunk_count": chunk_count.get(doc["id"], 0)
+            }
+            for doc in documents
+        ]
+    }
+    metadata.update(extra_metadata or {})
+    with open(path / METADATA_FILE, "w", encoding="utf-8") as f:
+        json.dump(metadata, f, ensure_ascii=False)
+
+
+def _replace_directory(tmp_path: Path, path: Path):
+    """Swap a fully written directory into place so readers never observe a half-written store"""
+    old_path = path.with_name(path.name + ".old")
+    shutil.rmtree(old_path, ignore_errors=True)
+    if path.exists():
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def save_store(path: str, documents: List[Dict], chunks: ChunkTable, vectors: np.ndarray,
+               extra_metadata: Optional[Dict] = None):
+    """Atomically write a knowledge-base store directory"""
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+
+    _write_store(tmp_path, documents, chunks, vectors, extra_metadata)
+    _replace_directory(tmp_path, path)
+
+    logger.info(f"Saved knowledge base store to {path} ({len(chunks)} chunks)")
+
+
+class StoreWriter:
+    """Writes a store directory one document at a time
+
+    chunks.npy and vectors.npy are created at their final size and filled
+    through memory maps, so rows can stream in from other mapped stores
+    without the whole store ever being held in memory. Files go to a
+    temporary directory that commit() swaps into place.
+    """
+
+    def __init__(self, path: str, n_chunks: int, dim: int):
+        self.path = Path(path)
+        self.tmp_path = self.path.with_name(self.path.name + ".tmp")
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+        self.tmp_path.mkdir(parents=True)
+
+        self.documents: List[Dict] = []
+        self.row_count = 0
+        self.dim = dim
+        self._rows = np.lib.format.open_memmap(self.tmp_path / CHUNKS_FILE, mode="w+", dtype=np.int64,
+                                               shape=(n_chunks, 3))
+        self._vectors = np.lib.format.open_memmap(self.tmp_path / VECTORS_FILE, mode="w+", dtype=np.float32,
+                                                  shape=(n_chunks, dim))
+        self._text = open(self.tmp_path / TEXT_FILE, "wb")
+        self._offset = 0
+        self._extra: List[np.ndarray] = []
+
+    def add_array(self, name: str, dtype, shape: Tuple[int, ...]) -> np.ndarray:
+        """Mapped .npy file written along with the store (e.g. a per-row sidecar); fill it before commit()"""
+        array = np.lib.format.open_memmap(self.tmp_path / name, mode="w+", dtype=dtype, shape=shape)
+        self._extra.append(array)
+        return array
+
+    def add_document(self, doc: Dict, chunks: DocumentChunks, vectors: np.ndarray):
+        """Append a document's chunk rows: its text once, each chunk a byte range of it"""
+        start, stop = self.row_count, self.row_count + len(chunks)
+        self._text.write(chunks.data)
+        self._rows[start:stop, 0] = doc["id"]
+        self._rows[start:stop, 1:] = np.asarray(chunks.spans, dtype=np.int64).reshape(-1, 2) + self._offset
+        self._vectors[start:stop] = vectors
+        self._offset += len(chunks.data)
+        self.row_count = stop
+        self.documents.append({
+            **{key: doc.get(key) for key in ("id", "title", "source", "category")},
+            "first_chunk": start,
+            "chunk_count": stop - start
+        })
+
+    def commit(self, extra_metadata: Optional[Dict] = None):
+        """Finish the files and move the store into place"""
+        if self.row_count != self._rows.shape[0]:
+            raise ValueError(f"Store writer got {self.row_count} of {self._rows.shape[0]} chunks")
+        self._text.close()
+        for array in [self._rows, self._vectors] + self._extra:
+            array.flush()
+        self._rows = self._vectors = None  # unmap before the directory is renamed
+        self._extra = []
+
+        metadata = {
+            "format_version": STORE_FORMAT_VERSION,
+            "dim": self.dim,
+            "chunk_count": self.row_count,
+            "documents": self.documents
+        }
+        metadata.update(extra_metadata or {})
+        with open(self.tmp_path / METADATA_FILE, "w", encoding="utf-8") as f:
+            json.dump(metadata, f, ensure_ascii=False)
+        _replace_directory(self.tmp_path, self.path)
+
+        logger.info(f"Saved knowledge base store to {self.path} ({self.row_count} chunks)")
+
+
+def is_store(path: str) -> bool:
+    """Whether path looks like a knowledge-base store directory"""
+    return (Path(path) / METADATA_FILE).is_file()
+
+
+def load_store(path: str):
+    """Map a store directory; returns (documents, chunks, index, metadata)"""
+    path = Path(path)
+    with open(path / METADATA_FILE, "r", encoding="utf-8") as f:
+        metadata = json.load(f)
+
+    version = metadata.get("format_version")
+    if version != STORE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported knowledge base store version: {version}")
+
+    vectors = np.load(path / VECTORS_FILE, mmap_mode="r", allow_pickle=False)
+    rows = np.load(path / CHUNKS_FILE, mmap_mode="r", allow_pickle=False)
+
+    # np.memmap refuses zero-length files
+    text_path = path / TEXT_FILE
+    if text_path.stat().st_size > 0:
+        text = np.memmap(text_path, dtype=np.uint8, mode="r")
+    else:
+        text = np.empty(0, dtype=np.uint8)
+
+    documents = metadata.pop("documents")
+    index = VectorIndex.from_matrix(vectors, normalized=True)
+    return documents, ChunkTable(rows, text), index, metadata
+
+
+def convert_pickle(pickle_path: str, store_path: str):
+    """One-shot conversion of a legacy pickled knowledge base into a store"""
+    with open(pickle_path, "rb") as f:
+        data = pickle.load(f)
+
+    from rag_stream import chunk_document
+
+    # Group chunk rows per document so each document's text is stored once
+    rows_by_doc: Dict[int, List[Dict]] = {}
+    for emb in data["embeddings"]:
+        rows_by_doc.setdefault(emb["doc_id"], []).append(emb)
+    contents = {doc["id"]: doc.get("content", "") for doc in data["documents"]}
+
+    chunks, ordered = ChunkTable(), []
+    for doc_id, rows in rows_by_doc.items():
+        doc_chunks: Sequence[str] = [emb["chunk"] for emb in rows]
+        # Re-chunking the content gives the same chunks as offsets into one copy of it
+        rechunked = chunk_document(contents.get(doc_id, ""))
+        if list(rechunked) == doc_chunks:
+            doc_chunks = rechunked
+        chunks.append_document(doc_id, doc_chunks)
+        ordered.extend(rows)
+
+    dim = len(ordered[0]["embedding"]) if ordered else 0
+    vectors = normalize_rows(np.asarray([emb["embedding"] for emb in ordered], dtype=np.float32).reshape(-1, dim))
+
+    save_store(store_path, data["documents"], chunks, vectors)
+    logger.info(f"Converted {pickle_path} -> {store_path} ({len(data['documents'])} documents)")
+
+
+def main():
+    """Convert a pickled knowledge base: rag_store.py [input.pkl] [output_dir]"""
+    logging.basicConfig(level=logging.INFO)
+    pickle_path = sys.argv[1] if len(sys.argv) > 1 else "indiana_knowledge_base.pkl"
+    store_path = sys.argv[2] if len(sys.argv) > 2 else str(Path(pickle_path).with_suffix(""))
+    convert_pickle(pickle_path, store_path)
+
+
+if __name__ == "__main__":
+    main()
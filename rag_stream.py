@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Streaming directory ingestion for the Indiana Oracle RAG system
+Walks a directory of text, markdown and transcript files and feeds them
+through reader -> chunker -> embedder -> index writer. Each stage is a
+generator or a bounded queue, and SimpleRAG flushes its in-memory segment
+every few thousand chunks, so an archive of any size ingests in constant
+memory.
+"""
+
+import re
+import queue
+import logging
+import argparse
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from rag_store import DocumentChunks
+
+logger = logging.getLogger(__name__)
+
+TEXT_EXTENSIONS = (".txt", ".md", ".markdown")
+TRANSCRIPT_EXTENSIONS = (".srt", ".vtt")
+READ_BLOCK_CHARS = 1 << 20
+PART_CHUNKS = 256  # chunks per streamed document part; bounds what one pipeline document holds
+QUEUE_PARTS = 8  # parts read ahead of the embedder
+
+_CUE_TIMING = re.compile(r"^\s*(\d+|WEBVTT.*|NOTE.*|[\d:.,]+\s*-->.*)\s*$")
+_DONE = object()
+
+
+def iter_words(text: str) -> Iterator[str]:
+    """Whitespace-separated words of a string, without building a list"""
+    for match in re.finditer(r"\S+", text):
+        yield match.group()
+
+
+def chunk_spans(text: str, chunk_size: int = 500, overlap: int = 50,
+                final: bool = True) -> List[Tuple[int, int]]:
+    """(start, end) character offsets of overlapping chunk_size-word windows every
+    chunk_size - overlap words
+
+    With final=False the trailing windows that run past the end of text are left
+    out, because the next block of a stream will complete them.
+    """
+    step = chunk_size - overlap
+    spans: List[Tuple[int, int]] = []
+    open_windows: deque = deque()  # (first word index, start offset)
+    last_end = 0
+    for index, match in enumerate(re.finditer(r"\S+", text)):
+        if index % step == 0:
+            open_windows.append((index, match.start()))
+        if open_windows and open_windows[0][0] + chunk_size - 1 == index:
+            spans.append((open_windows.popleft()[1], match.end()))
+        last_end = match.end()
+    if final:
+        spans.extend((start, last_end) for _, start in open_windows)
+    return spans
+
+
+def chunk_document(text: str, chunk_size: int = 500, overlap: int = 50) -> DocumentChunks:
+    """Chunks of text as offsets into one whitespace-normalized copy of it"""
+    normalized = " ".join(text.split())
+    return DocumentChunks.from_text(normalized, chunk_spans(normalized, chunk_size, overlap))
+
+
+def read_text_words(path: Path) -> Iterator[str]:
+    """Words of a text or markdown file, read in fixed-size blocks"""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        carry = ""
+        while True:
+            block = f.read(READ_BLOCK_CHARS)
+            if not block:
+                break
+            block = carry + block
+            # A word cut by the block boundary is completed by the next block
+            tail = re.search(r"\S+\Z", block)
+            carry = tail.group() if tail else ""
+            yield from iter_words(block[:tail.start()] if tail else block)
+        if carry:
+            yield from iter_words(carry)
+
+
+def read_transcript_words(path: Path) -> Iterator[str]:
+    """Spoken words of an .srt/.vtt transcript, skipping cue numbers and timings"""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if not _CUE_TIMING.match(line):
+                yield from iter_words(line)
+
+
+def read_words(path: Path) -> Iterator[str]:
+    if path.suffix.lower() in TRANSCRIPT_EXTENSIONS:
+        return read_transcript_words(path)
+    return read_text_words(path)
+
+
+def iter_files(root: Path, extensions: Sequence[str] = TEXT_EXTENSIONS + TRANSCRIPT_EXTENSIONS) -> Iterator[Path]:
+    """Supported files under root in a stable order"""
+    for path in sorted(root.rglob("*")):
+        if path.is_file() and path.suffix.lower() in extensions:
+            yield path
+
+
+def iter_documents(root: str, chunk_size: int = 500, overlap: int = 50,
+                   part_chunks: int = PART_CHUNKS) -> Iterator[Dict]:
+    """Pre-chunked pipeline documents for every file under root
+
+    Large files are split into parts of part_chunks consecutive chunks; parts
+    share overlap words so the chunks match chunking the whole file at once.
+    The category is the file's top-level folder under root ("general" at the root).
+    """
+    root = Path(root)
+    step = chunk_size - overlap
+    part_words = part_chunks * step + overlap
+    for path in iter_files(root):
+        relative = path.relative_to(root)
+        category = relative.parts[0] if len(relative.parts) > 1 else "general"
+        title = path.stem.replace("_", " ").replace("-", " ")
+        stat = path.stat()
+
+        words: List[str] = []
+        part_index = 0
+        for word in read_words(path):
+            words.append(word)
+            if len(words) == part_words:
+                text = " ".join(words)
+                chunks = DocumentChunks.from_text(text, chunk_spans(text, chunk_size, overlap, final=False))
+                yield _part_document(title, relative, category, stat, part_index, chunks)
+                del words[:part_chunks * step]
+                part_index += 1
+        if words:
+            text = " ".join(words)
+            chunks = DocumentChunks.from_text(text, chunk_spans(text, chunk_size, overlap))
+            yield _part_document(title, relative, category, stat, part_index, chunks)
+
+
+def _part_document(title: str, relative: Path, category: str, stat, index: int,
+                   chunks: DocumentChunks) -> Dict:
+    return {
+        "key": f"{relative.as_posix()}#{index}:{stat.st_size}:{int(stat.st_mtime)}",
+        "title": title if index == 0 else f"{title} (part {index + 1})",
+        "source": relative.as_posix(),
+        "category": category,
+        "chunks": chunks
+    }
+
+
+def read_ahead(documents: Iterator[Dict], max_queued: int = QUEUE_PARTS) -> Iterator[Dict]:
+    """Produce documents on a reader thread through a bounded queue
+
+    File reading and chunking overlap with embedding, and the reader blocks
+    once max_queued documents are waiting.
+    """
+    buffer: "queue.Queue" = queue.Queue(maxsize=max_queued)
+    stop = threading.Event()
+    errors: List[BaseException] = []
+
+    def produce():
+        try:
+            for document in documents:
+                while not stop.is_set():
+                    try:
+                        buffer.put(document, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            buffer.put(_DONE)
+
+    reader = threading.Thread(target=produce, name="rag-reader", daemon=True)
+    reader.start()
+    try:
+        while True:
+            document = buffer.get()
+            if document is _DONE:
+                break
+            yield document
+    finally:
+        stop.set()
+        # Unblock a reader waiting on a full queue
+        while reader.is_alive():
+            try:
+                buffer.get_nowait()
+            except queue.Empty:
+                reader.join(0.1)
+    if errors:
+        raise errors[0]
+
+
+def main():
+    """CLI: stream a directory into the knowledge base"""
+    from simple_rag_system import SimpleRAG
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("directory")
+    parser.add_argument("--store", help="knowledge base directory (default: the provider's own)")
+    parser.add_argument("--embedding", help='embedding provider spec, e.g. "openai" or "local"')
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--in-flight", type=int, default=4)
+    parser.add_argument("--flush-chunks", type=int, default=20_000,
+                        help="flush the in-memory segment after this many chunks")
+    args = parser.parse_args()
+
+    rag = SimpleRAG(path=args.store, embedding_provider=args.embedding)
+    stats = rag.ingest_directory(args.directory, args.batch_size, args.in_flight, args.flush_chunks)
+    print(f"{stats.documents} document parts, {stats.chunks} chunks in {stats.seconds:.1f}s "
+          f"({stats.chunks_per_second:.1f} chunks/sec, {stats.failed_documents} failed)")
+
+
+if __name__ == "__main__":
+    main()
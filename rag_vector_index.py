@@ -0,0 +1,100 @@
+"""
+Vector index for the Indiana Oracle RAG system
+Holds all chunk embeddings in one contiguous, pre-normalized float32 matrix
+"""
+
+import logging
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Scale each row to unit length (zero rows stay zero)"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Indices of the top_k highest scores, best first, using partial selection"""
+    n = scores.shape[0]
+    if n == 0 or top_k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if top_k >= n:
+        return np.argsort(-scores, kind="stable")
+
+    # argpartition is O(n); only the k winners get a full sort
+    candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class VectorIndex:
+    """Exact cosine-similarity index backed by a single float32 matrix"""
+
+    def __init__(self, dim: Optional[int] = None):
+        self.dim = dim
+        self._matrix = np.empty((0, dim or 0), dtype=np.float32)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """View of the populated rows of the matrix"""
+        return self._matrix[:self._size]
+
+    def _reserve(self, rows: int):
+        """Grow the backing matrix geometrically so appends stay amortized O(1)"""
+        needed = self._size + rows
+        if needed <= self._matrix.shape[0] and self._matrix.flags.writeable:
+            return
+        capacity = max(needed, 2 * self._matrix.shape[0], 64)
+        matrix = np.empty((capacity, self.dim), dtype=np.float32)
+        if self._size:
+            matrix[:self._size] = self._matrix[:self._size]
+        self._matrix = matrix
+
+    def add(self, embeddings: Sequence[Sequence[float]]) -> List[int]:
+        """Append embeddings and return their row ids"""
+        if len(embeddings) == 0:
+            return []
+        vectors = normalize_rows(embeddings)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index dimension {self.dim}")
+
+        self._reserve(vectors.shape[0])
+        start = self._size
+        self._matrix[start:start + vectors.shape[0]] = vectors
+        self._size += vectors.shape[0]
+        return list(range(start, self._size))
+
+    def scores(self, query: Sequence[float]) -> np.ndarray:
+        """Cosine similarity of the query against every row"""
+        q = normalize_rows(query)[0]
+        return self.vectors @ q
+
+    def search(self, query: Sequence[float], top_k: int = 3,
+               exclude: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Return (row id, similarity) pairs for the top_k rows not masked by exclude"""
+        if self._size == 0:
+            return []
+        scores = self.scores(query)
+        if exclude is not None:
+            scores[exclude[:self._size]] = -np.inf
+        return [(int(i), float(scores[i])) for i in top_k_indices(scores, top_k) if scores[i] > -np.inf]
+
+    @classmethod
+    def from_matrix(cls, matrix: np.ndarray, normalized: bool = False) -> "VectorIndex":
+        """Wrap an existing matrix (e.g. loaded from disk) without re-appending row by row"""
+        index = cls(matrix.shape[1] if matrix.ndim == 2 else None)
+        index._matrix = matrix if normalized else normalize_rows(matrix)
+        index._size = index._matrix.shape[0]
+        return index
@@ -2,16 +2,37 @@
 """
 Simple RAG (Retrieval-Augmented Generation) system for Indiana Oracle
 Loads key Indiana documents and provides semantic search
+Embeddings come from a pluggable provider (rag_embeddings): OpenAI by default,
+or the offline local embedder with RAG_EMBEDDING_PROVIDER=local.
 """
 
-import os
-import json
+import time
 import pickle
-from typing import List, Dict, Tuple
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Collection, FrozenSet, Iterable, List, Dict, Optional, Sequence, Tuple, Union
 import numpy as np
-from openai import OpenAI
 from dotenv import load_dotenv
 import logging
+from rag_vector_index import normalize_rows
+from rag_ingest import IngestPipeline, IngestStats
+from rag_embedding_cache import EmbeddingCache
+from rag_ann import ANN_FILE, IVFIndex
+from rag_quantize import QUANTIZED_FILE, QuantizedMatrix
+from rag_reduce import REDUCED_FILE, ReducedMatrix
+from rag_segments import UNVERSIONED_EMBEDDING, Segment, SegmentedStore
+from rag_stream import chunk_document, iter_documents, read_ahead
+from rag_result_cache import SemanticResultCache
+from rag_shards import MIN_SHARD_ROWS, ShardPool
+from rag_embeddings import EmbeddingProvider, make_provider
+from rag_context import DEFAULT_TOKEN_BUDGET, format_context, pack_context
+from rag_gate import RetrievalGate
+
+try:
+    import yaml
+except ImportError:  # persona scopes fall back to searching everything
+    yaml = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -19,208 +40,775 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+KNOWLEDGE_BASE_PATH = "indiana_knowledge_base"  # segmented, memory-mapped store directory
+LEGACY_KNOWLEDGE_BASE_FILE = "indiana_knowledge_base.pkl"
+EMBEDDING_CACHE_PATH = "embedding_cache.sqlite"
+SEARCH_MODES = ("dense", "lexical", "hybrid", "auto")
+SEARCH_WORKERS = 4  # threads for CPU-bound scoring behind the async API
+
+PERSONAS_CONFIG = Path(__file__).resolve().parent / "config" / "personas_detailed.yaml"
+
+Hit = Tuple[Segment, int, float]  # (segment, chunk row, score)
+
+
+def load_knowledge_bases(config_path: Path = PERSONAS_CONFIG
+                         ) -> Tuple[Dict[str, Optional[Tuple[str, ...]]], Dict[str, str]]:
+    """Category scope per knowledge base (None = all) and knowledge base per persona, from the persona config"""
+    if yaml is None or not config_path.exists():
+        logger.warning(f"Persona knowledge bases unavailable ({config_path}); searches are unscoped")
+        return {}, {}
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f) or {}
+    scopes = {name: tuple(categories) if categories is not None else None
+              for name, categories in (config.get("knowledge_bases") or {}).items()}
+    personas = {persona: settings["knowledge_base"] for persona, settings in (config.get("personas") or {}).items()
+                if settings.get("knowledge_base")}
+    return scopes, personas
+
+
+# Categories searched for each knowledge base, and the knowledge base of each persona
+KNOWLEDGE_BASES, PERSONA_KNOWLEDGE_BASES = load_knowledge_bases()
+
+
+def knowledge_base_path(provider: EmbeddingProvider) -> str:
+    """Default knowledge base directory for a provider (the original one for the original model)"""
+    if provider.identity == UNVERSIONED_EMBEDDING:
+        return KNOWLEDGE_BASE_PATH
+    return f"{KNOWLEDGE_BASE_PATH}-{provider.provider}-{provider.dim}"
+
+
 class SimpleRAG:
-    def __init__(self):
-        """Initialize simple RAG system"""
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.documents = []
-        self.embeddings = []
+    def __init__(self, load: bool = True, cache_path: Optional[str] = EMBEDDING_CACHE_PATH,
+                 use_cache: bool = True, path: Optional[str] = None, result_cache_size: int = 256,
+                 dedup_threshold: Optional[float] = None,
+                 embedding_provider: Union[EmbeddingProvider, str, None] = None):
+        """Initialize simple RAG system
+        
+        embedding_provider is a provider or a make_provider() spec ("openai",
+        "local", ...). Without a path each provider gets its own knowledge base
+        directory, and a store refuses vectors from any other provider.
+        """
+        if not isinstance(embedding_provider, EmbeddingProvider):
+            embedding_provider = make_provider(embedding_provider)
+        self.embedder = embedding_provider
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.shards: Optional[ShardPool] = None  # worker processes for exact dense scans (start_sharded_search)
+        # Only remote embeddings are worth caching; the local provider is faster than a lookup
+        self.embedding_cache = EmbeddingCache(self.embedder.model, cache_path) \
+            if use_cache and self.embedder.cacheable else None
+        # Reuses results for paraphrased queries; tune result_cache.max_distance (cosine)
+        self.result_cache = SemanticResultCache(result_cache_size) if result_cache_size > 0 else None
+        # Keeps small talk away from the knowledge base in build_context (None always retrieves)
+        self.gate: Optional[RetrievalGate] = RetrievalGate()
+        # Immutable segments + in-memory segment for new documents; chunks whose MinHash
+        # similarity reaches dedup_threshold share one row. Off by default (None keeps every
+        # chunk) because hashing dominates commit time; rag_dedup.DEFAULT_THRESHOLD is a good start
+        self.dedup_threshold = dedup_threshold
+        self.store = SegmentedStore(path or knowledge_base_path(self.embedder), dedup_threshold,
+                                    self.embedder.identity)
         self.loaded = False
         
+        # Retrieval tuning
+        self.search_mode = "auto"  # one of SEARCH_MODES
+        self.hybrid_alpha = 0.7  # weight of dense vs. lexical score when fusing
+        self.lexical_min_coverage = 0.75  # share of query IDF the top lexical hit must contain
+        self.lexical_min_margin = 1.5  # top lexical score must beat the runner-up by this factor
+        
         # Load knowledge base if it exists
-        self.load_knowledge_base()
+        if load:
+            self.load_knowledge_base()
     
     def add_document(self, title: str, content: str, source: str, category: str = "general"):
         """Add a document to the knowledge base"""
-        doc = {
-            "id": len(self.documents),
+        self.add_documents([{
             "title": title,
             "content": content,
             "source": source,
-            "category": category,
-            "chunks": self.chunk_text(content)
-        }
-        self.documents.append(doc)
+            "category": category
+        }])
+    
+    async def add_document_async(self, title: str, content: str, source: str, category: str = "general",
+                                 batch_size: int = 64):
+        """Add a document without blocking the event loop
         
-        # Generate embeddings for each chunk
-        for chunk in doc["chunks"]:
-            embedding = self.get_embedding(chunk)
-            self.embeddings.append({
-                "doc_id": doc["id"],
-                "chunk": chunk,
-                "embedding": embedding
-            })
+        Chunk batches are embedded concurrently over the pooled async client;
+        chunking and indexing run in the executor.
+        """
+        loop = asyncio.get_running_loop()
+        chunks = await loop.run_in_executor(self.executor, chunk_document, content)
+        batches = [chunks[i:i + batch_size] for i in range(0, len(chunks), batch_size)]
+        results = await asyncio.gather(*(self.get_embeddings_async(batch) for batch in batches))
+        embeddings = [embedding for batch in results for embedding in batch]
         
-        logger.info(f"Added document: {title} ({len(doc['chunks'])} chunks)")
+        document = {"title": title, "content": content, "source": source, "category": category}
+        await loop.run_in_executor(self.executor, self._commit_document, document, chunks, embeddings)
     
-    def chunk_text(self, text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]:
-        """Split text into overlapping chunks"""
-        words = text.split()
-        chunks = []
+    def add_documents(self, documents: Iterable[Dict], batch_size: int = 64, max_in_flight: int = 4,
+                      checkpoint_path: Optional[str] = None) -> IngestStats:
+        """Add many documents, embedding their chunks in concurrent multi-input batches
+        
+        With checkpoint_path set, finished documents are logged as they complete;
+        rerunning after an interruption skips them, and the checkpoint is removed
+        once the knowledge base has been saved.
+        """
+        pipeline = IngestPipeline(
+            embed_batch=self.get_embeddings,
+            chunker=chunk_document,
+            commit=self._commit_document,
+            batch_size=batch_size,
+            max_in_flight=max_in_flight,
+            checkpoint_path=checkpoint_path
+        )
+        stats = pipeline.run(documents)
+        
+        if pipeline.checkpoint and stats.failed_documents == 0:
+            self.save_knowledge_base()
+            pipeline.checkpoint.clear()
+        
+        return stats
+    
+    def ingest_directory(self, directory: str, batch_size: int = 64, max_in_flight: int = 4,
+                         flush_chunks: int = 20_000) -> IngestStats:
+        """Stream every text/markdown/transcript file under directory into the knowledge base
+        
+        Files are read and chunked lazily on a reader thread feeding a bounded
+        queue, and the in-memory segment is flushed every flush_chunks chunks,
+        so memory stays flat however large the archive is.
+        """
+        progress = {"chunks": 0, "next_report": flush_chunks, "start": time.perf_counter()}
+        
+        def commit(document: Dict, chunks: List[str], embeddings):
+            self._commit_document(document, chunks, embeddings)
+            progress["chunks"] += len(chunks)
+            if len(self.store.memtable) >= flush_chunks:
+                self.save_knowledge_base()
+            if progress["chunks"] >= progress["next_report"]:
+                progress["next_report"] += flush_chunks
+                rate = progress["chunks"] / (time.perf_counter() - progress["start"])
+                logger.info(f"Streamed {progress['chunks']} chunks ({rate:.1f} chunks/sec)")
+        
+        pipeline = IngestPipeline(
+            embed_batch=self.get_embeddings,
+            chunker=chunk_document,
+            commit=commit,
+            batch_size=batch_size,
+            max_in_flight=max_in_flight
+        )
+        stats = pipeline.run(read_ahead(iter_documents(directory)))
+        self.save_knowledge_base()
+        return stats
+    
+    def update_document(self, doc_id: int, title: str, content: str, source: str,
+                        category: str = "general") -> bool:
+        """Replace a document's content, keeping its id"""
+        if not self.store.delete(doc_id):
+            return False
+        stats = self.add_documents([{
+            "id": doc_id,
+            "title": title,
+            "content": content,
+            "source": source,
+            "category": category
+        }])
+        return stats.failed_documents == 0
+    
+    def delete_document(self, doc_id: int) -> bool:
+        """Delete a document by id (space is reclaimed at the next compaction)"""
+        return self.store.delete(doc_id)
+    
+    def _commit_document(self, document: Dict, chunks: Sequence[str], embeddings):
+        """Stage an embedded document in the in-memory segment
         
-        for i in range(0, len(words), chunk_size - overlap):
-            chunk = " ".join(words[i:i + chunk_size])
-            if len(chunk.strip()) > 0:
-                chunks.append(chunk)
+        Only metadata is kept on the document; its text lives once in the chunk
+        table, which DocumentChunks fills without copying overlapping chunks.
+        """
+        doc = {
+            "id": document["id"] if document.get("id") is not None else self.store.allocate_doc_id(),
+            "title": document["title"],
+            "source": document.get("source", ""),
+            "category": document.get("category", "general")
+        }
+        duplicates = self.store.add(doc, chunks, embeddings)
         
-        return chunks
+        logger.info(f"Added document: {doc['title']} ({len(chunks)} chunks"
+                    + (f", {duplicates} near-duplicates shared)" if duplicates else ")"))
+    
+    def chunk_text(self, text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]:
+        """Split text into overlapping chunks"""
+        return list(chunk_document(text, chunk_size, overlap))
     
     def get_embedding(self, text: str) -> List[float]:
-        """Get OpenAI embedding for text"""
+        """Embedding of text (a zero vector, logged, if the provider fails)"""
+        embedding = self._query_embedding(text)
+        return embedding if embedding is not None else [0.0] * self.embedder.dim
+    
+    def _query_embedding(self, text: str) -> Optional[List[float]]:
+        """Embedding of text, or None (logged) if the provider fails"""
         try:
-            response = self.client.embeddings.create(
-                model="text-embedding-3-small",  # More cost-effective
-                input=text
-            )
-            return response.data[0].embedding
+            return list(self.get_embeddings([text])[0])
         except Exception as e:
             logger.error(f"Embedding error: {e}")
-            return [0.0] * 1536  # Default embedding size
+            return None
+    
+    def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Embeddings for many texts in one provider call (raises on failure)"""
+        embeddings = self.embedding_cache.get_many(texts) if self.embedding_cache else [None] * len(texts)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if not missing:
+            return embeddings
+        
+        # Only texts the cache has never seen go to the provider
+        fetched = self.embedder.embed_many([texts[i] for i in missing])
+        for i, embedding in zip(missing, fetched):
+            embeddings[i] = embedding
+        if self.embedding_cache:
+            self.embedding_cache.put_many([texts[i] for i in missing], fetched)
+        return embeddings
+    
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """Worker threads for scoring and indexing (NumPy releases the GIL in the matrix products)"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="rag-search")
+        return self._executor
     
-    def search(self, query: str, top_k: int = 3) -> List[Dict]:
-        """Search for relevant documents"""
-        if not self.embeddings:
+    async def get_embedding_async(self, text: str) -> List[float]:
+        """get_embedding() without blocking the event loop"""
+        embedding = await self._query_embedding_async(text)
+        return embedding if embedding is not None else [0.0] * self.embedder.dim
+    
+    async def _query_embedding_async(self, text: str) -> Optional[List[float]]:
+        try:
+            return list((await self.get_embeddings_async([text]))[0])
+        except Exception as e:
+            logger.error(f"Embedding error: {e}")
+            return None
+    
+    async def get_embeddings_async(self, texts: List[str]) -> List[List[float]]:
+        """Async counterpart of get_embeddings (raises on failure)"""
+        loop = asyncio.get_running_loop()
+        if self.embedding_cache:
+            embeddings = await loop.run_in_executor(self.executor, self.embedding_cache.get_many, texts)
+        else:
+            embeddings = [None] * len(texts)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if not missing:
+            return embeddings
+        
+        fetched = await self.embedder.embed_many_async([texts[i] for i in missing])
+        for i, embedding in zip(missing, fetched):
+            embeddings[i] = embedding
+        if self.embedding_cache:
+            await loop.run_in_executor(self.executor, self.embedding_cache.put_many,
+                                       [texts[i] for i in missing], fetched)
+        return embeddings
+    
+    async def aclose(self):
+        """Release the provider's async HTTP connection pool and the scoring threads"""
+        await self.embedder.aclose()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+    
+    def cache_stats(self) -> Dict:
+        """Embedding cache hit/miss counters"""
+        return self.embedding_cache.stats() if self.embedding_cache else {}
+    
+    def result_cache_stats(self) -> Dict:
+        """Semantic result cache hit/miss counters"""
+        return self.result_cache.stats() if self.result_cache else {}
+    
+    def retrieval_gate_stats(self) -> Dict:
+        """Retrieval gate decisions and the searches and latency it saved"""
+        return self.gate.stats() if self.gate else {}
+    
+    def search(self, query: str, top_k: int = 3, nprobe: Optional[int] = None,
+               mode: Optional[str] = None, categories: Optional[Collection[str]] = None,
+               knowledge_base: Optional[str] = None) -> List[Dict]:
+        """Search for relevant documents
+        
+        mode is one of SEARCH_MODES (default self.search_mode):
+          dense   - embedding similarity only
+          lexical - BM25 only, no embedding call
+          hybrid  - dense and BM25 scores fused
+          auto    - BM25 answers alone when its top hit is confident (dense hits
+                    fill in when it finds fewer than top_k), else hybrid
+        Every segment is searched and the partial top-k lists are merged. Dense
+        scoring uses a segment's IVF index when one has been built (nprobe
+        overrides its default recall/latency setting).
+        
+        categories and/or a KNOWLEDGE_BASES name restrict the search to those
+        partitions; only their row slices are scored.
+        
+        Each result carries "score" (what the results are ranked by: cosine,
+        fused or BM25 relative to the best hit), "similarity" (the query-chunk
+        cosine, always a float: 0.0 when BM25 answered without a query
+        embedding) and "bm25" (the raw BM25 score; None for chunks not scored
+        lexically).
+        """
+        categories = self._resolve_categories(categories, knowledge_base)
+        segments = self._searchable_segments(categories)
+        if not segments:
             return []
+        mode = self._resolve_mode(mode)
         
-        # Get query embedding
-        query_embedding = self.get_embedding(query)
-        
-        # Calculate similarities
-        similarities = []
-        for i, emb_data in enumerate(self.embeddings):
-            similarity = self.cosine_similarity(query_embedding, emb_data["embedding"])
-            similarities.append({
-                "index": i,
-                "similarity": similarity,
-                "doc_id": emb_data["doc_id"],
-                "chunk": emb_data["chunk"]
-            })
+        results = self._search_without_embedding(segments, query, top_k, mode, categories)
+        if results is None:
+            # Get query embedding
+            query_embedding = self._query_embedding(query)
+            if query_embedding is None:
+                # A zero vector would rank arbitrarily; BM25 still answers
+                return self._search_without_embedding(segments, query, top_k, "lexical", categories)
+            results = self._search_with_embedding(segments, query, query_embedding, top_k, nprobe, mode, categories)
+        return results
+    
+    async def search_async(self, query: str, top_k: int = 3, nprobe: Optional[int] = None,
+                           mode: Optional[str] = None, categories: Optional[Collection[str]] = None,
+                           knowledge_base: Optional[str] = None) -> List[Dict]:
+        """search() for async callers
         
-        # Sort by similarity and return top results
-        similarities.sort(key=lambda x: x["similarity"], reverse=True)
+        The query embedding is awaited on the pooled async client and scoring
+        runs in the executor, so the event loop keeps serving other requests.
+        """
+        categories = self._resolve_categories(categories, knowledge_base)
+        segments = self._searchable_segments(categories)
+        if not segments:
+            return []
+        mode = self._resolve_mode(mode)
+        
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(self.executor, self._search_without_embedding,
+                                             segments, query, top_k, mode, categories)
+        if results is None:
+            query_embedding = await self._query_embedding_async(query)
+            if query_embedding is None:
+                return await loop.run_in_executor(self.executor, self._search_without_embedding,
+                                                  segments, query, top_k, "lexical", categories)
+            results = await loop.run_in_executor(self.executor, self._search_with_embedding,
+                                                 segments, query, query_embedding, top_k, nprobe, mode, categories)
+        return results
+    
+    def build_context(self, query: str, token_budget: int = DEFAULT_TOKEN_BUDGET, top_k: int = 4,
+                      **search_kwargs) -> str:
+        """Prompt context for a query: search results merged, deduplicated and packed into token_budget
+        
+        Small talk is turned away by the retrieval gate without searching.
+        search_kwargs go to search(); an empty string means nothing was found.
+        """
+        if self.gate and not self.gate.needs_retrieval(query):
+            return ""
+        start = time.perf_counter()
+        results = self.search(query, top_k=top_k, **search_kwargs)
+        if self.gate:
+            self.gate.record_search(time.perf_counter() - start)
+        return format_context(pack_context(results, token_budget))
+    
+    async def build_context_async(self, query: str, token_budget: int = DEFAULT_TOKEN_BUDGET, top_k: int = 4,
+                                  **search_kwargs) -> str:
+        """build_context() for async callers"""
+        if self.gate and not self.gate.needs_retrieval(query):
+            return ""
+        start = time.perf_counter()
+        results = await self.search_async(query, top_k=top_k, **search_kwargs)
+        if self.gate:
+            self.gate.record_search(time.perf_counter() - start)
+        return format_context(pack_context(results, token_budget))
+    
+    def _resolve_mode(self, mode: Optional[str]) -> str:
+        mode = mode or self.search_mode
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode}")
+        return mode
+    
+    @staticmethod
+    def _resolve_categories(categories: Optional[Collection[str]],
+                            knowledge_base: Optional[str]) -> Optional[FrozenSet[str]]:
+        """Category filter from explicit categories and a knowledge base name (None = everything)
+        
+        A knowledge base the persona config does not define is searched unscoped.
+        """
+        if knowledge_base is not None:
+            if knowledge_base not in KNOWLEDGE_BASES:
+                logger.warning(f"Unknown knowledge base {knowledge_base}; searching all categories")
+            scope = KNOWLEDGE_BASES.get(knowledge_base)
+            if scope is not None:
+                categories = set(scope) if categories is None else set(scope).intersection(categories)
+        return frozenset(categories) if categories is not None else None
+    
+    def _searchable_segments(self, categories: Optional[FrozenSet[str]]) -> List[Segment]:
+        """Non-empty segments holding at least one of the categories"""
+        segments = [segment for segment in self.store.all_segments() if len(segment)]
+        if categories is None:
+            return segments
+        return [segment for segment in segments if segment.partition_ranges(categories)]
+    
+    def _search_without_embedding(self, segments: List[Segment], query: str, top_k: int, mode: str,
+                                  categories: Optional[FrozenSet[str]] = None) -> Optional[List[Dict]]:
+        """Results when BM25 alone can answer, else None (an embedding is needed)"""
+        if mode not in ("lexical", "auto"):
+            return None
+        lexical_hits = self._lexical_search(segments, query, top_k, categories)
+        # A confident but short list still needs dense hits to fill it
+        if mode == "lexical" or (len(lexical_hits) >= top_k and self.is_confident_lexical(query, lexical_hits)):
+            return self._format_results(self._relative_scores(lexical_hits), bm25=self._hit_scores(lexical_hits))
+        return None
+    
+    def _search_with_embedding(self, segments: List[Segment], query: str, query_embedding, top_k: int,
+                               nprobe: Optional[int], mode: str,
+                               categories: Optional[FrozenSet[str]] = None) -> List[Dict]:
+        """Dense, hybrid or backfilled lexical results for an embedded query
+        
+        Dense and hybrid results are reused from a near-identical cached query.
+        """
+        if mode == "auto":
+            lexical_hits = self._lexical_search(segments, query, top_k, categories)
+            if self.is_confident_lexical(query, lexical_hits):
+                return self._backfill_search(segments, lexical_hits, query_embedding, top_k, nprobe, categories)
+        
+        # Every option that changes the results is part of the key
+        key = (top_k, nprobe, mode, categories, self.hybrid_alpha if mode != "dense" else None)
+        generation = self.store.generation
+        if self.result_cache:
+            cached = self.result_cache.get(query_embedding, key, generation)
+            if cached is not None:
+                return cached
+        
+        if mode == "dense":
+            hits = self._dense_search(segments, query_embedding, top_k, nprobe, categories)
+            results = self._format_results(hits, similarity=self._hit_scores(hits))
+        else:
+            hits, similarity, bm25 = self._hybrid_search(segments, query, query_embedding, top_k, nprobe, categories)
+            results = self._format_results(hits, similarity, bm25)
+        
+        if self.result_cache:
+            self.result_cache.put(query_embedding, key, generation, results)
+        return results
+    
+    @staticmethod
+    def _merge_hits(hits: List[Hit], top_k: int) -> List[Hit]:
+        """Best top_k of the per-segment partial results"""
+        return sorted(hits, key=lambda hit: hit[2], reverse=True)[:top_k]
+    
+    def _dense_search(self, segments: List[Segment], query_embedding, top_k: int,
+                      nprobe: Optional[int] = None, categories: Optional[FrozenSet[str]] = None) -> List[Hit]:
+        """(segment, row, cosine similarity) hits across segments"""
+        hits = []
+        if self.shards is not None:
+            # Exact scans of flushed segments fan out to the worker processes
+            sharded = [segment for segment in segments
+                       if segment.path is not None and segment.ann is None
+                       and segment.quantized is None and segment.reduced is None]
+            hits.extend(self.shards.search(sharded, query_embedding, top_k, categories))
+            segments = [segment for segment in segments if segment not in sharded]
+        for segment in segments:
+            hits.extend((segment, row, score)
+                        for row, score in segment.dense_search(query_embedding, top_k, nprobe, categories))
+        return self._merge_hits(hits, top_k)
+    
+    def _lexical_search(self, segments: List[Segment], query: str, top_k: int,
+                        categories: Optional[FrozenSet[str]] = None) -> List[Hit]:
+        """(segment, row, BM25 score) hits across segments"""
+        hits = []
+        for segment in segments:
+            hits.extend((segment, row, score) for row, score in segment.lexical_search(query, top_k, categories))
+        return self._merge_hits(hits, top_k)
+    
+    def _backfill_search(self, segments: List[Segment], lexical_hits: List[Hit], query_embedding, top_k: int,
+                         nprobe: Optional[int] = None, categories: Optional[FrozenSet[str]] = None) -> List[Dict]:
+        """Confident lexical hits first, then the best dense hits not among them, up to top_k"""
+        found = {(id(segment), row) for segment, row, _ in lexical_hits}
+        dense_hits = [hit for hit in self._dense_search(segments, query_embedding, top_k, nprobe, categories)
+                      if (id(hit[0]), hit[1]) not in found]
+        hits = self._relative_scores(lexical_hits) + dense_hits[:top_k - len(lexical_hits)]
+        
+        similarity = self._hit_scores(dense_hits)
+        q = normalize_rows(query_embedding)[0]
+        for segment, row, _ in lexical_hits:
+            similarity[(id(segment), row)] = float(segment.index.vectors[row] @ q)
+        return self._format_results(hits, similarity, self._hit_scores(lexical_hits))
+    
+    def _hybrid_search(self, segments: List[Segment], query: str, query_embedding, top_k: int,
+                       nprobe: Optional[int] = None, categories: Optional[FrozenSet[str]] = None
+                       ) -> Tuple[List[Hit], Dict[Tuple[int, int], float], Dict[Tuple[int, int], float]]:
+        """Fuse dense cosine and max-normalized BM25 over the union of both candidate sets
+        
+        Returns the fused hits with the cosine and raw BM25 score of every candidate.
+        """
+        pool = max(top_k * 4, 20)
+        lexical_hits = self._lexical_search(segments, query, pool, categories)
+        lexical = self._hit_scores(lexical_hits)
+        top_lexical = lexical_hits[0][2] if lexical_hits else 0.0
+        
+        candidates: Dict[int, set] = {}
+        for segment, row, _ in lexical_hits + self._dense_search(segments, query_embedding, pool, nprobe, categories):
+            candidates.setdefault(id(segment), set()).add(row)
+        
+        q = normalize_rows(query_embedding)[0]
+        fused_hits = []
+        similarity = {}
+        for segment in segments:
+            if id(segment) not in candidates:
+                continue
+            rows = np.fromiter(sorted(candidates[id(segment)]), dtype=np.int64)
+            dense_scores = segment.index.vectors[rows] @ q
+            for row, dense in zip(rows.tolist(), dense_scores.tolist()):
+                similarity[(id(segment), row)] = dense
+                lexical_score = lexical.get((id(segment), row), 0.0) / top_lexical if top_lexical > 0 else 0.0
+                fused = self.hybrid_alpha * dense + (1.0 - self.hybrid_alpha) * lexical_score
+                fused_hits.append((segment, row, fused))
+        return self._merge_hits(fused_hits, top_k), similarity, lexical
+    
+    def is_confident_lexical(self, query: str, hits: List[Hit]) -> bool:
+        """Whether the top BM25 hit is strong enough to skip the embedding call"""
+        if not hits:
+            return False
+        if len(hits) > 1 and hits[0][2] < self.lexical_min_margin * hits[1][2]:
+            return False
+        segment, row, _ = hits[0]
+        return segment.lexical.coverage(query, row) >= self.lexical_min_coverage
+    
+    @staticmethod
+    def _relative_scores(hits: List[Hit]) -> List[Hit]:
+        """Scale BM25 scores into (0, 1] relative to the best hit"""
+        if not hits:
+            return []
+        top = hits[0][2]
+        return [(segment, row, score / top) for segment, row, score in hits]
+    
+    @staticmethod
+    def _hit_scores(hits: List[Hit]) -> Dict[Tuple[int, int], float]:
+        """Score of each hit keyed by (segment id, row)"""
+        return {(id(segment), row): score for segment, row, score in hits}
+    
+    def _format_results(self, hits: List[Hit], similarity: Optional[Dict[Tuple[int, int], float]] = None,
+                        bm25: Optional[Dict[Tuple[int, int], float]] = None) -> List[Dict]:
+        """Turn (segment, row, score) hits into search result dicts
         
+        similarity holds the cosine of each hit when the query was embedded
+        (0.0 otherwise); bm25 the raw BM25 score of the hits that have one.
+        """
+        similarity = similarity or {}
+        bm25 = bm25 or {}
         results = []
-        for sim in similarities[:top_k]:
-            doc = self.documents[sim["doc_id"]]
+        for segment, row, score in hits:
+            # A shared chunk is credited to its first live document and lists the rest
+            doc, *also_in = segment.sources(row)
+            rows = segment.doc_rows(doc["id"])
             results.append({
+                "doc_id": doc["id"],
+                "chunk_index": row - rows.start if row in rows else None,
                 "title": doc["title"],
                 "source": doc["source"],
                 "category": doc["category"],
-                "chunk": sim["chunk"],
-                "similarity": sim["similarity"]
+                "chunk": segment.chunks.text(row),
+                "score": score,
+                "similarity": similarity.get((id(segment), row), 0.0),
+                "bm25": bm25.get((id(segment), row)),
+                "also_in": [{"title": other["title"], "source": other["source"]} for other in also_in]
             })
         
         return results
     
+    def build_ann_index(self, n_lists: Optional[int] = None, nprobe: int = 8, min_chunks: int = 10_000):
+        """Build IVF indexes for flushed segments with at least min_chunks chunks
+        
+        Each index is written into its segment directory; later compactions
+        rebuild it for the merged segment.
+        """
+        self.save_knowledge_base()
+        for segment in self.store.segments:
+            if len(segment) >= min_chunks:
+                segment.ann = IVFIndex.build(segment.index.vectors, n_lists, nprobe)
+                segment.ann.save(str(segment.path / ANN_FILE))
+        self.store.mark_changed()
+    
+    def build_quantized_index(self, mode: str = "int8", rescore: int = 4):
+        """Store a quantized copy of every flushed segment's vectors for first-pass scoring
+        
+        Searches shortlist rescore * top_k rows from the int8/float16 copy held in
+        RAM and rescore them against the memory-mapped float32 vectors. Segments
+        flushed or compacted later are quantized the same way.
+        """
+        self.save_knowledge_base()
+        for segment in self.store.segments:
+            if len(segment):
+                segment.quantized = QuantizedMatrix.build(segment.index.vectors, mode, rescore)
+                segment.quantized.save(str(segment.path / QUANTIZED_FILE))
+        self.store.mark_changed()
+    
+    def build_reduced_index(self, dim: int = 256, method: str = "pca", rescore: int = 4):
+        """Store a reduced-dimension copy of every flushed segment's vectors for first-pass scoring
+        
+        method "pca" projects onto the segment's leading principal components;
+        "truncate" keeps the leading dimensions, for Matryoshka-trained models
+        (text-embedding-3). Searches shortlist rescore * top_k rows from the
+        reduced copy and rescore them at full dimension; segments flushed or
+        compacted later are reduced the same way. rag_reduce's eval command
+        reports the recall and speed of each dimension.
+        """
+        self.save_knowledge_base()
+        for segment in self.store.segments:
+            if len(segment):
+                segment.reduced = ReducedMatrix.build(segment.index.vectors, dim, method, rescore)
+                segment.reduced.save(str(segment.path / REDUCED_FILE))
+        self.store.mark_changed()
+    
     def cosine_similarity(self, a: List[float], b: List[float]) -> float:
         """Calculate cosine similarity between two vectors"""
         a = np.array(a)
         b = np.array(b)
         return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
     
-    def save_knowledge_base(self, filename: str = "indiana_knowledge_base.pkl"):
-        """Save knowledge base to file"""
-        data = {
-            "documents": self.documents,
-            "embeddings": self.embeddings
-        }
-        
-        with open(filename, 'wb') as f:
-            pickle.dump(data, f)
+    def save_knowledge_base(self):
+        """Flush newly added documents to a new immutable segment"""
+        segment = self.store.flush()
+        if segment is not None:
+            logger.info(f"Saved knowledge base with {self.store.document_count()} documents")
+    
+    def compact_knowledge_base(self):
+        """Merge all segments into one and drop deleted documents"""
+        self.save_knowledge_base()
+        self.store.compact(min_segments=1)
+    
+    def start_sharded_search(self, workers: Optional[int] = None, min_shard_rows: int = MIN_SHARD_ROWS):
+        """Score exact dense searches in worker processes, one shard of rows each
         
-        logger.info(f"Saved knowledge base with {len(self.documents)} documents")
+        The workers map the segment files, so the corpus is shared rather than
+        copied; documents still in memory are searched in this process. Call
+        from under `if __name__ == "__main__":` since workers are spawned.
+        """
+        self.stop_sharded_search()
+        self.shards = ShardPool(workers, min_shard_rows)
+    
+    def stop_sharded_search(self):
+        if self.shards is not None:
+            self.shards.close()
+            self.shards = None
     
-    def load_knowledge_base(self, filename: str = "indiana_knowledge_base.pkl"):
-        """Load knowledge base from file"""
+    def start_background_compaction(self, interval: float = 300.0, min_segments: int = 8):
+        """Merge segments in a background thread as they accumulate"""
+        self.store.start_compactor(interval, min_segments)
+    
+    def load_knowledge_base(self, path: Optional[str] = None,
+                            legacy_filename: str = LEGACY_KNOWLEDGE_BASE_FILE):
+        """Load knowledge base, preferring the segmented store over the legacy pickle"""
         try:
-            with open(filename, 'rb') as f:
-                data = pickle.load(f)
-            
-            self.documents = data["documents"]
-            self.embeddings = data["embeddings"]
-            self.loaded = True
+            if path is not None and path != str(self.store.path):
+                self.store = SegmentedStore(path, self.dedup_threshold, self.embedder.identity)
+            if not self.store.open():
+                # The pickle holds vectors of the original OpenAI model only
+                if self.embedder.identity == UNVERSIONED_EMBEDDING:
+                    self.load_legacy_pickle(legacy_filename)
+            self.loaded = self.store.document_count() > 0
             
-            logger.info(f"Loaded knowledge base with {len(self.documents)} documents")
+            logger.info(f"Loaded knowledge base with {self.store.document_count()} documents "
+                        f"in {len(self.store.segments)} segments")
         except FileNotFoundError:
             logger.info("No existing knowledge base found - will create new one")
         except Exception as e:
             logger.error(f"Error loading knowledge base: {e}")
     
+    def load_legacy_pickle(self, filename: str = LEGACY_KNOWLEDGE_BASE_FILE):
+        """Stage a pickled knowledge base in memory (save_knowledge_base() writes it as a segment)"""
+        with open(filename, 'rb') as f:
+            data = pickle.load(f)
+        
+        # Group chunk rows per document and give each document a store-allocated id
+        rows_by_doc: Dict[int, List[Dict]] = {}
+        for emb in data["embeddings"]:
+            rows_by_doc.setdefault(emb["doc_id"], []).append(emb)
+        for doc in data["documents"]:
+            rows = rows_by_doc.get(doc["id"], [])
+            new_doc = {key: value for key, value in doc.items() if key not in ("id", "content", "chunks")}
+            new_doc["id"] = self.store.allocate_doc_id()
+            chunks: Sequence[str] = [emb["chunk"] for emb in rows]
+            # Re-chunking the content gives the same chunks as offsets into one copy of it
+            rechunked = chunk_document(doc.get("content", ""))
+            if list(rechunked) == chunks:
+                chunks = rechunked
+            self.store.add(new_doc, chunks, [emb["embedding"] for emb in rows])
+        
+        logger.warning(f"Loaded legacy pickle {filename}; call save_knowledge_base() to convert it")
+    
     def initialize_indiana_knowledge(self):
         """Initialize with key Indiana documents and facts"""
+        documents = []
         
         # Indiana Statehood
-        self.add_document(
+        documents.append(dict(
             title="Indiana Statehood History",
             content="""Indiana became the 19th state on December 11, 1816. The territory was originally part of the Northwest Territory established in 1787. The Indiana Territory was created in 1800 with William Henry Harrison as its first governor. The Enabling Act of 1816 authorized Indiana to form a state government and draft a constitution. The constitutional convention met in Corydon from June 10-29, 1816. Corydon served as the first state capital until 1825 when the capital moved to Indianapolis. The state's name means "Land of the Indians" reflecting the numerous Native American tribes that lived in the region including the Miami, Potawatomi, Delaware, and Shawnee peoples.""",
             source="Indiana Historical Bureau",
             category="history"
-        )
+        ))
         
         # Indiana University
-        self.add_document(
+        documents.append(dict(
             title="Indiana University History",
             content="""Indiana University was founded in 1820 as the State Seminary. It was renamed Indiana College in 1828 and became Indiana University in 1838. The Bloomington campus is known for its beautiful limestone buildings quarried locally. Herman B Wells served as president from 1938-1962 and transformed IU into a major research university. The Little 500 bicycle race began in 1951 and was featured in the movie "Breaking Away" (1979). The Kinsey Institute for Research in Sex, Gender, and Reproduction was established by Alfred Kinsey. Notable alumni include songwriter Hoagy Carmichael who composed "Stardust" while a law student.""",
             source="IU Libraries",
             category="education"
-        )
+        ))
         
         # Vonnegut biographical info
-        self.add_document(
+        documents.append(dict(
             title="Kurt Vonnegut Jr. Biography",
             content="""Kurt Vonnegut Jr. was born November 11, 1922, in Indianapolis, Indiana to Kurt Vonnegut Sr. and Edith Lieber. He attended Shortridge High School in Indianapolis. During World War II, he served in the 106th Infantry Division and was captured during the Battle of the Bulge in December 1944. As a prisoner of war, he survived the Allied bombing of Dresden while being held in an underground meat locker. This experience became the basis for his novel "Slaughterhouse-Five" (1969). He wrote 14 novels total including "Cat's Cradle," "The Sirens of Titan," and "Breakfast of Champions." He died April 11, 2007, in Manhattan at age 84. He was known for his anti-war views, dark humor, and humanist philosophy.""",
             source="Kurt Vonnegut Museum & Library",
             category="literature"
-        )
+        ))
         
         # Indianapolis 500
-        self.add_document(
+        documents.append(dict(
             title="Indianapolis Motor Speedway History",
             content="""The Indianapolis Motor Speedway was built in 1909 by Carl G. Fisher and partners as a testing ground for automobiles. The first Indianapolis 500-Mile Race was held on May 30, 1911, won by Ray Harroun driving a Marmon Wasp. The track is a 2.5-mile rectangular oval and is known as "The Brickyard" because it was originally paved with bricks. The famous phrase "Gentlemen, start your engines" (later updated to include ladies) begins each race. The Indianapolis 500 is part of the Triple Crown of Motorsport along with the Monaco Grand Prix and 24 Hours of Le Mans. The race is traditionally held on Memorial Day weekend and is called "The Greatest Spectacle in Racing.""",
             source="Indianapolis Motor Speedway",
             category="sports"
-        )
+        ))
         
         # Indiana Limestone
-        self.add_document(
+        documents.append(dict(
             title="Indiana Limestone Industry",
             content="""Indiana limestone, quarried primarily in Lawrence and Monroe counties around Bedford and Bloomington, has been used to build many famous structures. The Empire State Building, Pentagon, Washington National Cathedral, and numerous university buildings across America were built with Indiana limestone. The stone was formed 330 million years ago during the Mississippian period when Indiana was covered by a shallow sea. The limestone is prized for its uniform color, durability, and ease of carving. Major limestone companies included Indiana Limestone Company and Bedford Stone Company. The industry peaked in the early 20th century but continues today, earning the nickname "Indiana's gift to the world.""",
             source="Indiana Geological Survey",
             category="industry"
-        )
+        ))
         
         # Bloomington-specific anecdotes and stories
-        self.add_document(
+        documents.append(dict(
             title="Granfalloon Festival and Bloomington Vonnegut Legacy",
             content="""The Granfalloon Festival is an annual celebration of Kurt Vonnegut's work held in Bloomington, Indiana, founded by Professor Ed Comentale (pronounced "common-tah-lay") from Indiana University. The festival has featured major musical acts including the Flaming Lips, Father John Misty, and Khruangbin, creating a unique fusion of literature and music. Scholar Caleb Weintraub penned an influential essay titled "The Asshole and the Proto-Emoji" analyzing Vonnegut's simple drawings as early forms of visual compression, similar to modern emojis. The original Vonnegut drawings and manuscripts are housed at IU's Lilly Library, where researchers can examine his artistic process up close. The festival celebrates not just Vonnegut's novels but his entire creative output, including his artwork and philosophy of human decency.""",
             source="Granfalloon Festival Archives",
             category="culture"
-        )
+        ))
         
         # Upland Brewing and local hangouts
-        self.add_document(
+        documents.append(dict(
             title="Upland Brewing and Bloomington Campus Culture",
             content="""Upland Brewing Company, founded in 1998, became a beloved campus hangout near Indiana University. Located on North Walnut Street, it serves as a gathering place for students, faculty, and locals. The brewery is known for its wheat ales and seasonal offerings, creating a distinctly Bloomington social scene. Before Upland, students would frequent Nick's English Hut (established 1927) for stromboli and beer, or the Bluebird nightclub for live music. The brewery represents the evolution of Bloomington from a traditional college town to a more sophisticated cultural hub, while maintaining its Midwestern charm and affordability that makes it accessible to students.""",
             source="Bloomington Restaurant History",
             category="culture"
-        )
+        ))
         
         # Architectural curiosities 
-        self.add_document(
+        documents.append(dict(
             title="Mies van der Rohe Glass House and IU Architecture",
             content="""One of Indiana University's most unusual buildings was originally designed by architect Ludwig Mies van der Rohe as a glass fraternity house in the 1950s. The modernist glass box design was considered radical for a fraternity, with its transparent walls offering no privacy for typical Greek life activities. The project was eventually adapted for academic use, becoming part of IU's architectural legacy. This represents the clash between European modernism and American college traditions. Other notable IU buildings include the Gothic Revival-style Memorial Hall and the limestone buildings quarried locally from Monroe County. The campus architecture tells the story of Indiana University's evolution from a frontier seminary to a major research institution.""",
             source="IU Architecture Survey",
             category="architecture"
-        )
+        ))
         
         # Bloomington nightlife and hidden gems
-        self.add_document(
+        documents.append(dict(
             title="The Dunnkirk Library and Bloomington Speakeasy Culture",
             content="""The Dunnkirk Library is Bloomington's actual speakeasy, a hidden cocktail bar that captures the prohibition-era atmosphere. Unlike typical college bars, this establishment focuses on craft cocktails and intimate conversation. The speakeasy culture in Bloomington reflects the town's evolution from a simple college town to a more sophisticated cultural destination. Other notable Bloomington nightlife includes the historic Bluebird nightclub which has hosted touring acts since the 1980s, and the Buskirk-Chumley Theater which presents both films and live performances. These venues represent the artistic and cultural depth that extends beyond the university campus.""",
             source="Bloomington Entertainment Guide",
             category="nightlife"
-        )
+        ))
 
+        # Embed all documents together in batched requests
+        self.add_documents(documents)
+        
         # Save the knowledge base
         self.save_knowledge_base()
         logger.info("Initialized Indiana knowledge base with enhanced Bloomington stories")
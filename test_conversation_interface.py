@@ -15,7 +15,7 @@ from openai import OpenAI
 import os
 from dotenv import load_dotenv
 import aiohttp
-from simple_rag_system import SimpleRAG
+from simple_rag_system import PERSONA_KNOWLEDGE_BASES, SimpleRAG
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -223,6 +223,15 @@ BLOOMINGTON/IU CONNECTIONS (speak about these warmly):
                 "webp_exists": os.path.exists(os.path.join(assets_path, "oracle-frame.webp"))
             }
         
+        @self.app.get("/rag-stats")
+        async def rag_stats():
+            """Retrieval gate and cache counters"""
+            return {
+                "retrieval_gate": self.rag.retrieval_gate_stats(),
+                "result_cache": self.rag.result_cache_stats(),
+                "embedding_cache": self.rag.cache_stats()
+            }
+        
         @self.app.post("/verify-password")
         async def verify_password(data: dict):
             """Verify Oracle access password"""
@@ -274,12 +283,10 @@ BLOOMINGTON/IU CONNECTIONS (speak about these warmly):
             system_prompt = self.personas.get(persona, self.personas["indiana-oracle"])
             
             # Enhance both personas with RAG search for local knowledge
-            rag_results = self.rag.search(user_text, top_k=2)
-            if rag_results:
-                context = "\n\nRELEVANT CONTEXT FROM KNOWLEDGE BASE:\n"
-                for result in rag_results:
-                    context += f"- {result['title']}: {result['chunk'][:300]}...\n"
-                system_prompt += context
+            # Overlapping chunks merged, repeated sentences dropped, packed to a token budget;
+            # small talk skips retrieval entirely
+            system_prompt += await self.rag.build_context_async(
+                user_text, knowledge_base=PERSONA_KNOWLEDGE_BASES.get(persona))
             
             response = self.openai_client.chat.completions.create(
                 model="gpt-4o",
@@ -0,0 +1,39 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# The RAG modules live at the top level of the repository
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from simple_rag_system import SimpleRAG  # noqa: E402
+
+DOCUMENTS = [
+    ("Kurt Vonnegut Jr. Biography", "literature",
+     "Kurt Vonnegut Jr. was born November 11, 1922, in Indianapolis. He survived the bombing of Dresden "
+     "as a prisoner of war, the basis for Slaughterhouse-Five."),
+    ("Indianapolis Motor Speedway History", "sports",
+     "The Indianapolis Motor Speedway was built in 1909. The first Indianapolis 500 was won by Ray Harroun "
+     "driving a Marmon Wasp. The track is known as The Brickyard."),
+    ("Indiana Limestone Industry", "industry",
+     "Indiana limestone from Lawrence and Monroe counties built the Empire State Building and the Pentagon."),
+    ("The Dunnkirk Library", "nightlife",
+     "The Dunnkirk Library is a hidden speakeasy in Bloomington serving craft cocktails."),
+]
+
+
+@pytest.fixture
+def make_rag(tmp_path):
+    """Offline SimpleRAG factory over a fresh knowledge base directory"""
+    def make(**kwargs):
+        kwargs.setdefault("path", str(tmp_path / "kb"))
+        return SimpleRAG(load=kwargs.pop("load", False), use_cache=False, embedding_provider="local", **kwargs)
+    return make
+
+
+@pytest.fixture
+def rag(make_rag):
+    rag = make_rag()
+    rag.add_documents({"title": title, "content": content, "source": "test", "category": category}
+                      for title, category, content in DOCUMENTS)
+    return rag
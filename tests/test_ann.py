@@ -0,0 +1,25 @@
+import sys
+
+import rag_ann
+from rag_segments import SegmentedStore
+
+
+def test_cli_builds_and_evaluates_a_segmented_store(rag, monkeypatch, capsys):
+    rag.save_knowledge_base()
+    rag.add_document("Slaughterhouse-Five", "Billy Pilgrim comes unstuck in time after Dresden.", "test", "literature")
+    rag.save_knowledge_base()
+    rag.delete_document(rag.search("Dunnkirk speakeasy", top_k=1, mode="lexical")[0]["doc_id"])
+
+    monkeypatch.setattr(sys, "argv", ["rag_ann.py", "eval", rag.store.path.as_posix(), "--nprobe", "1,8",
+                                      "--top-k", "2", "--queries", "4"])
+    rag_ann.main()
+    report = capsys.readouterr().out.splitlines()
+    assert [line.split()[0] for line in report] == ["nprobe", "exact", "1", "8"]
+    assert float(report[-1].split()[1]) == 1.0  # every list probed
+
+    monkeypatch.setattr(sys, "argv", ["rag_ann.py", "build", rag.store.path.as_posix(), "--nprobe", "4"])
+    rag_ann.main()
+    store = SegmentedStore(rag.store.path.as_posix())
+    store.open()
+    assert [segment.ann.nprobe for segment in store.segments] == [4, 4]
+    assert not (rag.store.path / rag_ann.ANN_FILE).exists()
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+import rag_bm25
+from rag_bm25 import BM25Index
+
+TEXTS = [
+    "Kurt Vonnegut was born in Indianapolis and survived the bombing of Dresden.",
+    "Ray Harroun won the first Indianapolis 500 driving a Marmon Wasp.",
+    "Indiana limestone from Bedford built the Empire State Building.",
+    "Bloomington's Dunnkirk Library is a speakeasy; Dunnkirk cocktails are réputés.",
+]
+QUERIES = ["Indianapolis", "Dunnkirk speakeasy", "réputés limestone", "Dresden Wasp Bedford", "missing"]
+
+
+@pytest.fixture
+def index():
+    index = BM25Index()
+    index.add(TEXTS[:2])
+    index.compile()
+    index.add(TEXTS[2:])  # pending postings on top of compiled ones
+    return index
+
+
+def test_saved_index_is_mapped_and_scores_the_same(index, tmp_path):
+    index.save(str(tmp_path / "bm25"))
+    loaded = BM25Index.load(str(tmp_path / "bm25"))
+
+    for array in (loaded._terms, loaded._indptr, loaded._rows, loaded._tfs, loaded._doc_lengths):
+        assert isinstance(array, np.memmap)
+    assert list(loaded._terms) == sorted(loaded._terms)
+    assert loaded.vocab == {}
+    for query in QUERIES:
+        np.testing.assert_allclose(loaded.scores(query), index.scores(query), rtol=1e-6)
+        assert loaded.coverage(query, 3) == pytest.approx(index.coverage(query, 3))
+    with pytest.raises(ValueError):
+        loaded.add(["more text"])
+
+
+def test_archived_index_still_loads(index, tmp_path):
+    # Layout written before the postings were memory-mapped: term ids in insertion order
+    index.compile()
+    np.savez(tmp_path / "bm25.npz", terms=np.array(sorted(index.vocab, key=index.vocab.get), dtype=str),
+             indptr=index._indptr, rows=index._rows, tfs=index._tfs, doc_lengths=index._doc_lengths[:len(index)],
+             params=np.array([index.k1, index.b]))
+    loaded = BM25Index.load(str(tmp_path / "bm25.npz"))
+
+    assert list(loaded._terms) == sorted(loaded._terms)
+    for query in QUERIES:
+        np.testing.assert_allclose(loaded.scores(query), index.scores(query), rtol=1e-6)
+
+
+def test_snapshot_ignores_rows_added_later(index):
+    snapshot = index.snapshot()
+    expected = snapshot.scores("Indianapolis limestone")
+    index.add(["Indianapolis limestone Indianapolis limestone"])
+
+    np.testing.assert_array_equal(snapshot.scores("Indianapolis limestone"), expected)
+    assert len(index.scores("Indianapolis limestone")) == len(TEXTS) + 1
+
+
+def test_merged_postings_match_a_fresh_index(index, tmp_path, monkeypatch):
+    monkeypatch.setattr(rag_bm25, "MERGE_BLOCK_POSTINGS", 3)  # several blocks per index
+    index.save(str(tmp_path / "saved"))
+    other = BM25Index()
+    other.add(TEXTS[::-1])
+
+    # Keep rows 0, 2, 3 of the saved index and rows 0, 1 of the other, interleaved
+    parts = [(BM25Index.load(str(tmp_path / "saved")), np.array([0, -1, 2, 4])),
+             (other, np.array([1, 3, -1, -1]))]
+    rag_bm25.save_merged(str(tmp_path / "merged"), parts, 5)
+    merged = BM25Index.load(str(tmp_path / "merged"))
+
+    fresh = BM25Index()
+    fresh.add([TEXTS[0], TEXTS[3], TEXTS[2], TEXTS[2], TEXTS[3]])
+    assert list(merged._terms) == sorted(term.encode() for term in fresh.vocab)
+    for query in QUERIES + ["Harroun Marmon"]:
+        np.testing.assert_allclose(merged.scores(query), fresh.scores(query), rtol=1e-6)
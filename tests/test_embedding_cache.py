@@ -0,0 +1,21 @@
+import sqlite3
+
+import numpy as np
+
+from rag_embedding_cache import EmbeddingCache
+
+
+def test_large_batches_stay_under_the_bound_variable_limit(tmp_path):
+    cache = EmbeddingCache("test-model", str(tmp_path / "cache.sqlite"), memory_items=10)
+    cache._db.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)  # SQLite's historical default
+    texts = [f"chunk {i}" for i in range(1200)]
+    vectors = np.random.default_rng(0).normal(size=(len(texts), 4)).astype(np.float32)
+
+    cache.put_many(texts, vectors)
+    cache.put_many(texts, vectors)  # every row replaced
+
+    stats = cache.stats()
+    assert stats["disk_bytes"] == vectors.nbytes
+    found = cache.get_many(texts)
+    np.testing.assert_array_equal(np.stack(found), vectors)
+    assert cache.stats()["disk_hits"] == len(texts) - 10
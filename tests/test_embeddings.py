@@ -0,0 +1,17 @@
+import pytest
+
+from rag_embeddings import EmbeddingProvider, LocalEmbeddingProvider
+
+
+def test_providers_must_implement_embed_many():
+    class Incomplete(EmbeddingProvider):
+        provider = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
+    with pytest.raises(TypeError):
+        EmbeddingProvider()
+
+    provider = LocalEmbeddingProvider(dim=16)
+    assert isinstance(provider, EmbeddingProvider)
+    assert [len(vector) for vector in provider.embed_many(["Hoosier", "limestone"])] == [16, 16]
@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+
+def test_result_cache_key_includes_hybrid_alpha(rag):
+    first = rag.search("speedway brickyard race", top_k=3, mode="hybrid")
+    rag.hybrid_alpha = 0.0  # lexical score only
+    second = rag.search("speedway brickyard race", top_k=3, mode="hybrid")
+
+    assert rag.result_cache_stats()["hits"] == 0
+    assert [result["similarity"] for result in first] != [result["similarity"] for result in second]
+
+    rag.search("speedway brickyard race", top_k=3, mode="hybrid")
+    assert rag.result_cache_stats()["hits"] == 1
+
+
+def count_embedding_calls(rag, monkeypatch):
+    calls = []
+    embed_many = rag.embedder.embed_many
+
+    def counting(texts):
+        calls.append(list(texts))
+        return embed_many(texts)
+    monkeypatch.setattr(rag.embedder, "embed_many", counting)
+    return calls
+
+
+def test_confident_lexical_fast_path_skips_embedding(rag, monkeypatch):
+    calls = count_embedding_calls(rag, monkeypatch)
+    results = rag.search("Dunnkirk speakeasy", top_k=1, mode="auto")
+
+    assert not calls
+    assert [result["title"] for result in results] == ["The Dunnkirk Library"]
+    assert results[0]["similarity"] == 0.0  # no cosine without a query embedding
+    assert results[0]["score"] == 1.0
+    assert results[0]["bm25"] > 1.0
+
+
+def test_short_lexical_fast_path_is_backfilled_from_dense(rag, monkeypatch):
+    calls = count_embedding_calls(rag, monkeypatch)
+    results = rag.search("Dunnkirk speakeasy", top_k=3, mode="auto")
+
+    assert len(calls) == 1
+    assert len(results) == 3
+    assert results[0]["title"] == "The Dunnkirk Library"
+    assert len({result["doc_id"] for result in results}) == 3
+    assert all(-1.0 <= result["similarity"] <= 1.0 for result in results)
+    assert results[0]["bm25"] > 0 and results[1]["bm25"] is None
+
+
+def test_result_scores_keep_cosine_and_bm25_apart(rag):
+    dense = rag.search("prisoner of war in Dresden", top_k=2, mode="dense")
+    assert all(result["score"] == result["similarity"] and result["bm25"] is None for result in dense)
+
+    hybrid = rag.search("prisoner of war in Dresden", top_k=2, mode="hybrid")
+    top = hybrid[0]
+    assert top["title"] == "Kurt Vonnegut Jr. Biography"
+    assert top["similarity"] == pytest.approx(
+        next(result["similarity"] for result in dense if result["doc_id"] == top["doc_id"]), abs=1e-6)
+    assert top["bm25"] > 0
+
+    lexical = rag.search("Harroun Brickyard", top_k=2, mode="lexical")
+    assert lexical[0]["similarity"] == 0.0 and lexical[0]["score"] == 1.0
+
+
+def test_similarity_is_a_float_on_every_path(rag):
+    for mode in ("dense", "lexical", "hybrid", "auto"):
+        for query in ("Dunnkirk speakeasy", "Harroun Brickyard", "prisoner of war in Dresden"):
+            for top_k in (1, 3):
+                results = rag.search(query, top_k=top_k, mode=mode)
+                assert results and all(isinstance(result["similarity"], float) for result in results)
+
+
+def test_persona_scopes_come_from_the_persona_config(tmp_path):
+    from simple_rag_system import KNOWLEDGE_BASES, PERSONA_KNOWLEDGE_BASES, load_knowledge_bases
+
+    assert PERSONA_KNOWLEDGE_BASES["kurt-vonnegut"] == "vonnegut"
+    assert {"literature", "architecture", "history"} <= set(KNOWLEDGE_BASES["vonnegut"])
+    assert KNOWLEDGE_BASES["indiana_general"] is None
+
+    config = tmp_path / "personas.yaml"
+    config.write_text("knowledge_bases:\n  narrow: [sports]\n  everything: null\n"
+                      "personas:\n  larry-bird:\n    knowledge_base: narrow\n  no-kb:\n    name: x\n")
+    assert load_knowledge_bases(config) == ({"narrow": ("sports",), "everything": None}, {"larry-bird": "narrow"})
+    assert load_knowledge_bases(tmp_path / "missing.yaml") == ({}, {})
+
+
+def test_vonnegut_scope_reaches_history_documents(rag):
+    rag.add_document("Indiana Statehood History", "Indiana became the 19th state in 1816; Corydon was the first "
+                     "capital before Indianapolis.", "test", "history")
+    results = rag.search("Corydon first state capital", top_k=1, mode="dense", knowledge_base="vonnegut")
+    assert results[0]["title"] == "Indiana Statehood History"
+
+
+def test_unknown_persona_knowledge_base_searches_unscoped(rag, caplog):
+    query = "Dunnkirk speakeasy cocktails"
+    with caplog.at_level("WARNING", logger="simple_rag_system"):
+        results = rag.search(query, top_k=2, mode="lexical", knowledge_base="not-configured")
+        context = asyncio.run(rag.build_context_async(query, knowledge_base="not-configured"))
+
+    assert results == rag.search(query, top_k=2, mode="lexical")
+    assert "Dunnkirk" in context
+    assert "Unknown knowledge base not-configured" in caplog.text
@@ -0,0 +1,199 @@
+import asyncio
+import threading
+
+import numpy as np
+
+import rag_bm25
+import rag_dedup
+
+
+def titles(results):
+    return [result["title"] for result in results]
+
+
+def doc_id_of(rag, title):
+    return next(doc["id"] for segment in rag.store.all_segments() for doc in segment.live_documents()
+                if doc["title"] == title)
+
+
+def test_update_before_flush_replaces_the_staged_document(rag):
+    doc_id = rag.search("Dunnkirk speakeasy", top_k=1, mode="lexical")[0]["doc_id"]
+    documents = rag.store.document_count()
+
+    assert rag.update_document(doc_id, "The Bluebird", "The Bluebird nightclub hosts touring bands in Bloomington.",
+                               "test", "nightlife")
+
+    assert rag.store.get_document(doc_id)["title"] == "The Bluebird"
+    assert rag.store.document_count() == documents
+    assert rag.search("Dunnkirk speakeasy cocktails", top_k=5, mode="lexical") == []
+    for mode in ("dense", "hybrid", "auto"):
+        results = rag.search("Bluebird nightclub touring bands", top_k=5, mode=mode)
+        assert results[0]["title"] == "The Bluebird"
+        assert "Dunnkirk" not in " ".join(result["chunk"] for result in results)
+        assert titles(results).count("The Bluebird") == 1
+
+    # The flushed segment holds only the new version
+    rag.save_knowledge_base()
+    assert rag.store.document_count() == documents
+    assert titles(rag.search("Bluebird nightclub", top_k=5, mode="dense")).count("The Bluebird") == 1
+    assert rag.search("Dunnkirk", top_k=5, mode="lexical") == []
+
+
+def test_update_after_flush_and_reopen(make_rag, rag):
+    rag.save_knowledge_base()
+    doc_id = rag.search("Harroun Brickyard", top_k=1, mode="lexical")[0]["doc_id"]
+    assert rag.update_document(doc_id, "Speedway", "The Brickyard oval now hosts the Brickyard 400 too.",
+                               "test", "sports")
+    rag.save_knowledge_base()
+
+    reopened = make_rag(load=True)
+    assert reopened.store.document_count() == rag.store.document_count() == 4
+    assert reopened.store.get_document(doc_id)["title"] == "Speedway"
+    assert titles(reopened.search("Brickyard", top_k=5, mode="lexical")) == ["Speedway"]
+    reopened.compact_knowledge_base()
+    assert titles(reopened.search("Brickyard", top_k=5, mode="lexical")) == ["Speedway"]
+
+
+def test_updated_document_releases_chunks_it_shared(make_rag):
+    rag = make_rag(dedup_threshold=0.8)
+    text = "Kurt Vonnegut was born in Indianapolis in 1922 and wrote Slaughterhouse-Five about Dresden."
+    rag.add_document("Original", text, "test", "literature")
+    rag.add_document("Copy", text, "test", "literature")
+    assert rag.search("Slaughterhouse-Five Dresden", top_k=1, mode="dense")[0]["also_in"]
+    copy_id = doc_id_of(rag, "Copy")
+
+    assert rag.update_document(copy_id, "Copy", "Breakfast of Champions is set in Midland City.", "test",
+                               "literature")
+    results = rag.search("Slaughterhouse-Five Dresden", top_k=5, mode="dense")
+    assert results[0]["title"] == "Original" and results[0]["also_in"] == []
+    assert titles(rag.search("Breakfast of Champions Midland", top_k=1, mode="lexical")) == ["Copy"]
+
+
+def test_document_added_mid_search_is_left_to_the_next_search(rag, monkeypatch):
+    tokenize = rag_bm25.tokenize
+    query = "Limestone quarries of Bedford"
+
+    def tokenize_and_add(text):
+        if text == query and rag.store.document_count() == 4:
+            # Another thread stages a matching document after the search has sized its score array
+            writer = threading.Thread(target=rag.add_document, args=(
+                "Bedford Stone", "Bedford limestone quarries supplied limestone for the limestone capitol.",
+                "test", "industry"))
+            writer.start()
+            writer.join()
+        return tokenize(text)
+
+    monkeypatch.setattr(rag_bm25, "tokenize", tokenize_and_add)
+    assert titles(rag.search(query, top_k=5, mode="lexical")) == ["Indiana Limestone Industry"]
+    assert titles(rag.search(query, top_k=5, mode="lexical"))[0] == "Bedford Stone"
+
+
+def test_concurrent_adds_and_searches(make_rag):
+    rag = make_rag(result_cache_size=0)
+    words = ["limestone", "speedway", "granfalloon", "dresden", "bluebird", "corydon", "harroun", "kinsey"]
+
+    async def writer(stop_after: int):
+        for i in range(stop_after):
+            content = " ".join(words[(i + k) % len(words)] for k in range(40)) + f" document{i}."
+            await rag.add_document_async(f"Doc {i}", content, "test", ["history", "culture"][i % 2])
+            if i % 25 == 24:
+                await asyncio.get_running_loop().run_in_executor(rag.executor, rag.delete_document, i // 2)
+
+    async def reader(errors, done):
+        i = 0
+        while not done.is_set():
+            mode = ("dense", "lexical", "hybrid", "auto")[i % 4]
+            categories = ["history"] if i % 3 == 0 else None
+            try:
+                for result in await rag.search_async(f"{words[i % len(words)]} document{i % 50}", top_k=5,
+                                                     mode=mode, categories=categories):
+                    assert result["title"].startswith("Doc ")
+            except Exception as e:  # collected and reported below
+                errors.append(repr(e))
+            i += 1
+            await asyncio.sleep(0)  # an empty store answers without awaiting anything
+
+    async def run():
+        errors, done = [], asyncio.Event()
+        readers = [asyncio.create_task(reader(errors, done)) for _ in range(4)]
+        await writer(150)
+        done.set()
+        await asyncio.gather(*readers)
+        await rag.aclose()
+        return errors
+
+    errors = asyncio.run(run())
+    assert errors == []
+    assert rag.store.document_count() == 150 - 6
+
+
+def test_compaction_streams_rows_and_reuses_postings(make_rag, rag, monkeypatch):
+    rag.save_knowledge_base()
+    rag.add_document("Slaughterhouse-Five", "Billy Pilgrim comes unstuck in time after Dresden.", "test", "literature")
+    rag.save_knowledge_base()
+    rag.add_document("Cat's Cradle", "Ice-nine freezes the seas of San Lorenzo.", "test", "literature")
+    rag.delete_document(doc_id_of(rag, "Indiana Limestone Industry"))
+    queries = ["Dresden", "Indianapolis Speedway Harroun", "Dunnkirk speakeasy", "limestone Pentagon"]
+    expected = {(query, mode): [(result["title"], result["chunk"]) for result in rag.search(query, top_k=5, mode=mode)]
+                for query in queries for mode in ("lexical", "dense")}
+
+    def no_tokenizing(text):
+        raise AssertionError("compaction re-tokenized a chunk")
+
+    monkeypatch.setattr(rag_bm25, "tokenize", no_tokenizing)
+    rag.compact_knowledge_base()
+    monkeypatch.undo()
+
+    assert len(rag.store.segments) == 1 and rag.store.document_count() == 5
+    for (query, mode), results in expected.items():
+        # BM25 statistics were per segment, so only the lexical ranking may change
+        found = [(result["title"], result["chunk"]) for result in rag.search(query, top_k=5, mode=mode)]
+        assert sorted(found) == sorted(results)
+
+    # The renumbered postings score exactly like the merged text tokenized afresh
+    segment = rag.store.segments[0]
+    tokenized = rag_bm25.BM25Index()
+    tokenized.add(segment.chunks.text(row) for row in range(len(segment)))
+    for query in queries:
+        np.testing.assert_allclose(segment.lexical.scores(query), tokenized.scores(query), rtol=1e-6)
+
+    reopened = make_rag(load=True)
+    assert titles(reopened.search("Billy Pilgrim Dresden", top_k=1, mode="lexical")) == ["Slaughterhouse-Five"]
+    assert reopened.search("limestone Pentagon", top_k=5, mode="lexical") == []
+
+
+def test_duplicates_are_kept_unless_dedup_is_enabled(make_rag):
+    rag = make_rag()
+    text = "Kurt Vonnegut was born in Indianapolis in 1922 and wrote Slaughterhouse-Five about Dresden."
+    for title in ("First", "Second"):
+        rag.add_document(title, text, "test", "literature")
+    rag.compact_knowledge_base()
+
+    assert rag.store.memtable.dedup is None
+    assert rag.store.chunk_count() == 2
+    assert not (rag.store.segments[0].path / rag_dedup.SIGNATURES_FILE).exists()
+
+
+def test_compaction_collapses_duplicates_with_saved_signatures(make_rag, monkeypatch):
+    rag = make_rag(dedup_threshold=0.8)
+    text = "Kurt Vonnegut was born in Indianapolis in 1922 and wrote Slaughterhouse-Five about Dresden."
+    for title in ("First", "Second"):
+        rag.add_document(title, text, "test", "literature")
+        rag.save_knowledge_base()
+    assert rag.store.chunk_count() == 2
+    assert all(segment.signatures.shape == (1, rag_dedup.NUM_PERMUTATIONS) for segment in rag.store.segments)
+
+    def no_hashing(self, text):
+        raise AssertionError("compaction hashed a row it had a saved signature for")
+
+    monkeypatch.setattr(rag_dedup.MinHasher, "signature", no_hashing)
+    rag.compact_knowledge_base()
+    monkeypatch.undo()
+    assert rag.store.chunk_count() == 1
+    assert rag.store.segments[0].signatures.shape == (1, rag_dedup.NUM_PERMUTATIONS)
+    result = rag.search("Slaughterhouse-Five Dresden", top_k=5, mode="lexical")
+    assert titles(result) == ["First"] and result[0]["also_in"] == [{"title": "Second", "source": "test"}]
+
+    rag.delete_document(doc_id_of(rag, "First"))
+    rag.compact_knowledge_base()
+    assert titles(rag.search("Slaughterhouse-Five Dresden", top_k=5, mode="lexical")) == ["Second"]
@@ -0,0 +1,29 @@
+import pickle
+
+import numpy as np
+
+from rag_store import TEXT_FILE, convert_pickle, load_store
+from rag_stream import chunk_document
+
+
+def test_converted_pickle_stores_each_document_text_once(tmp_path):
+    long_text = " ".join(f"word{i}" for i in range(1200))  # three overlapping chunks
+    documents = [{"id": 7, "title": "Long", "content": long_text},
+                 {"id": 3, "title": "Short", "content": "Indiana limestone from Bedford."}]
+    rng = np.random.default_rng(0)
+    # Legacy rows hold one text copy per chunk
+    embeddings = [{"doc_id": doc["id"], "chunk": chunk, "embedding": rng.normal(size=8).tolist()}
+                  for doc in documents[::-1] for chunk in chunk_document(doc["content"])]
+    with open(tmp_path / "kb.pkl", "wb") as f:
+        pickle.dump({"documents": documents, "embeddings": embeddings}, f)
+
+    convert_pickle(str(tmp_path / "kb.pkl"), str(tmp_path / "kb"))
+    loaded_documents, chunks, index, _ = load_store(str(tmp_path / "kb"))
+
+    text_bytes = (tmp_path / "kb" / TEXT_FILE).stat().st_size
+    assert text_bytes == sum(len(doc["content"].encode()) for doc in documents)
+    assert [doc["id"] for doc in loaded_documents] == [7, 3]
+    assert len(chunks) == len(embeddings)
+    for row, emb in enumerate(embeddings):
+        assert (chunks.doc_id(row), chunks.text(row)) == (emb["doc_id"], emb["chunk"])
+        np.testing.assert_allclose(index.vectors[row], emb["embedding"] / np.linalg.norm(emb["embedding"]), rtol=1e-6)